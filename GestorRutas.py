@@ -3,17 +3,84 @@ from tkinter import messagebox, filedialog
 from tkinter import ttk
 import os
 import csv
-from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
-from geopy.distance import geodesic
 import webbrowser
 import tkintermapview
 import subprocess
+import glob
+import shutil
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from persistencia import (GuardadoDiferido, CargadorCSV, ENCABEZADOS_CSV, escribir_csv_rutas, escribir_rechazos,
+                          importar_csv_paralelo, leer_hoja_direcciones, ENCABEZADOS_DIRECCIONES)
+from almacen_sqlite import AlmacenSQLite
+from geocodificacion import (CachePersistente, CacheInversa, ServicioGeocodificacion, ColaGeocodificacionMasiva,
+                             GeocodificacionEnPausa, normalizar_direccion, crear_proveedor)
+from nomenclator import Nomenclator, construir_nomenclator
+from distancias import distancias_rutas, MemoDistancias, MODELOS_DISTANCIA, MODELO_LOTE
+from red_vial import cargar_red_vial
+from planificador import Planificador
 
 # Asegurar el directorio de trabajo correcto
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 
+# --- Configuración de persistencia ---
+ARCHIVO_DATOS = os.path.join(script_dir, "rutas_informe.csv")
+ARCHIVO_RECHAZOS = os.path.join(script_dir, "rutas_rechazadas.csv")  # Filas inválidas de la última carga
+ESPERA_GUARDADO = 1.0  # Segundos sin cambios antes de escribir en disco
+# "csv" (por defecto) o "sqlite".  Con SQLite cada cambio se guarda como una sola fila.
+BACKEND_ALMACENAMIENTO = os.environ.get("GESTOR_RUTAS_BACKEND", "csv")
+ARCHIVO_SQLITE = os.path.join(script_dir, "rutas.db")
+
+# --- Configuración de geocodificación ---
+# Backend: "nominatim" (por defecto), "local" (solo direcciones conocidas, sin red) o la URL
+# de un servidor compatible, p. ej. servidor_geocodificacion.py: "http://127.0.0.1:8088".
+PROVEEDOR_GEOCODIFICACION = os.environ.get("GESTOR_RUTAS_GEOCODIFICADOR", "nominatim")
+ARCHIVO_CACHE_GEO = os.path.join(script_dir, "geocache.db")
+MAX_ENTRADAS_CACHE_GEO = 20000
+TTL_CACHE_GEO = 90 * 24 * 3600  # Las direcciones rara vez cambian de lugar: 90 días
+# Geocodificación inversa: tamaño de la celda (precisión del geohash, 8 ~ 38 m x 19 m)
+# y antigüedad máxima de una dirección guardada antes de volver a consultarla.
+PRECISION_GEOHASH_INVERSA = 8
+TTL_CACHE_INVERSA = 30 * 24 * 3600
+TIMEOUT_GEOCODIFICACION = 10  # Segundos por consulta
+TASA_GEOCODIFICACION = 1.0    # Consultas por segundo (política de uso de Nominatim)
+PLAZO_GEOCODIFICACION = 12    # Plazo común para geocodificar partida y destino juntos
+TTL_NO_ENCONTRADAS = 6 * 3600  # Cuánto se recuerda que una dirección no existe (caché negativa)
+# Cortocircuito: tras estas fallas seguidas del servicio, se deja de consultar durante la pausa
+MAX_FALLAS_GEOCODIFICACION = 3
+PAUSA_GEOCODIFICACION = 60
+# Búsqueda anticipada: se geocodifica lo escrito en Partida/Destino cuando el campo queda
+# sin cambios este tiempo (ms), así al agregar la ruta ya está en la caché.
+ESPERA_PREBUSQUEDA = 500
+MIN_CARACTERES_PREBUSQUEDA = 5
+# Nomenclátor local: direcciones con coordenadas tomadas de las rutas guardadas en estos CSV
+# (además de las rutas cargadas).  Se consulta antes que la caché y la red.
+ARCHIVOS_NOMENCLATOR = os.path.join(script_dir, "*.csv")
+# Modelos de distancia (ver distancias.py): la vista previa al elegir puntos en el mapa usa
+# uno rápido; lo que se guarda se calcula siempre con el exacto.  Con "calles" se guardan
+# kilómetros por calles según la red vial de ARCHIVO_RED_VIAL (extracto OSM, ver red_vial.py);
+# mientras la red carga, o si no hay camino, se usa la geodésica.  Para recalcular miles de
+# rutas conviene preprocesar el extracto con jerarquia_contraccion.py (se usa automáticamente).
+MODELO_DISTANCIA = os.environ.get("GESTOR_RUTAS_MODELO_DISTANCIA", "geodesic")
+ARCHIVO_RED_VIAL = os.environ.get("GESTOR_RUTAS_RED_VIAL", "")
+MODELO_DISTANCIA_PREVIA = os.environ.get("GESTOR_RUTAS_DISTANCIA_PREVIA", "equirectangular")
+# Un nombre mal escrito haría fallar cada cálculo de distancia: se avisa y se usa el de por defecto
+if MODELO_DISTANCIA not in MODELOS_DISTANCIA and MODELO_DISTANCIA != "calles":
+    print(f"DEBUG: GESTOR_RUTAS_MODELO_DISTANCIA desconocido ({MODELO_DISTANCIA!r}); se usa 'geodesic'. "
+          f"Válidos: {', '.join(sorted(MODELOS_DISTANCIA))}, calles")
+    MODELO_DISTANCIA = "geodesic"
+if MODELO_DISTANCIA_PREVIA not in MODELOS_DISTANCIA:
+    print(f"DEBUG: GESTOR_RUTAS_DISTANCIA_PREVIA desconocido ({MODELO_DISTANCIA_PREVIA!r}); se usa "
+          f"'equirectangular'. Válidos: {', '.join(sorted(MODELOS_DISTANCIA))}")
+    MODELO_DISTANCIA_PREVIA = "equirectangular"
+MAX_ENTRADAS_MEMO_DISTANCIAS = 50000  # Parejas de puntos con la distancia ya calculada
+# Planificación de viajes: una ruta puede seguir a otra si su partida queda a esta distancia
+# del destino de la anterior (ver planificador.py)
+TOLERANCIA_ENCADENAMIENTO_KM = 0.5
+
 class Nodo:
     """
     Representa un nodo en el árbol binario.  Cada nodo contiene la información
@@ -120,6 +187,50 @@ class ArbolBinarioBusqueda:
                                               lat_partida, lon_partida, lat_destino, lon_destino, capacidad, carga_actual)
         return nodo
 
+    def insertar_lote(self, rutas):
+        """
+        Inserta muchas rutas de una sola vez (carga de archivos grandes).
+
+        En lugar de insertar una por una (lo que con IDs ordenados deja el árbol
+        degenerado y revisa el nombre recorriendo todo el árbol en cada inserción),
+        se combinan con las rutas existentes y se reconstruye un árbol balanceado.
+
+        Args:
+            rutas (iterable): Tuplas con el mismo formato que obtener_rutas().
+
+        Returns:
+            list: Las rutas rechazadas por tener un ID o nombre ya existente.
+        """
+        existentes = self.obtener_rutas()
+        ids = {ruta[0] for ruta in existentes}
+        nombres = {ruta[1].lower() for ruta in existentes}
+        nuevas = []
+        rechazadas = []
+        for ruta in rutas:
+            if ruta[0] in ids or ruta[1].lower() in nombres:
+                rechazadas.append(ruta)
+                continue
+            ids.add(ruta[0])
+            nombres.add(ruta[1].lower())
+            nuevas.append(ruta)
+
+        todas = sorted(existentes + nuevas, key=lambda ruta: ruta[0])
+        self.raiz = self._construir_balanceado(todas, 0, len(todas))
+        return rechazadas
+
+    def _construir_balanceado(self, rutas, inicio, fin):
+        """
+        Función auxiliar recursiva que arma un subárbol balanceado a partir de
+        rutas[inicio:fin] (ordenadas por ID).
+        """
+        if inicio >= fin:
+            return None
+        medio = (inicio + fin) // 2
+        nodo = Nodo(*rutas[medio])
+        nodo.izquierda = self._construir_balanceado(rutas, inicio, medio)
+        nodo.derecha = self._construir_balanceado(rutas, medio + 1, fin)
+        return nodo
+
     def buscar(self, id_ruta):
         """
         Busca una ruta en el árbol por su ID.
@@ -301,8 +412,48 @@ class Aplicacion:
         self.longitud_partida = None
         self.latitud_destino = None
         self.longitud_destino = None
+        # Procedencia de las coordenadas de cada campo: tipo -> (texto, (lat, lon), origen),
+        # con origen "mapa" (elegidas en MapaDialog) o "ruta" (las de una ruta cargada).
+        # Mientras el texto del campo no cambie, esas coordenadas se usan tal cual.
+        self.origen_coordenadas = {"partida": None, "destino": None}
+        # Texto que dejó la vista previa en el campo Distancia: si sigue igual al guardar,
+        # no es una distancia escrita a mano y se calcula con el modelo exacto.
+        self.distancia_previa = None
         self.mapa_dialog = None  # <-- Inicialización correcta.
         self.modo_edicion = False
+        # Guardado en segundo plano: agrupa ráfagas de cambios en una sola escritura
+        if BACKEND_ALMACENAMIENTO == "sqlite":
+            self.almacen = AlmacenSQLite(ARCHIVO_SQLITE)
+            self.guardado = GuardadoDiferido(self.almacen.aplicar_cambios, ESPERA_GUARDADO, acumulativo=True)
+        else:
+            self.almacen = None
+            self.guardado = GuardadoDiferido(lambda rutas: escribir_csv_rutas(ARCHIVO_DATOS, rutas), ESPERA_GUARDADO)
+        self.root.protocol("WM_DELETE_WINDOW", self.cerrar)
+        # Servicio de geocodificación único: un proveedor (Nominatim con pool de conexiones u otro
+        # según PROVEEDOR_GEOCODIFICACION), limitador de tasa compartido, cachés persistentes,
+        # nomenclátor local y métricas.
+        self.nomenclator = Nomenclator()
+        cache_coordenadas = CachePersistente(ARCHIVO_CACHE_GEO, "coordenadas", MAX_ENTRADAS_CACHE_GEO, TTL_CACHE_GEO)
+        cache_direcciones = CacheInversa(CachePersistente(ARCHIVO_CACHE_GEO, "direcciones", MAX_ENTRADAS_CACHE_GEO,
+                                                          TTL_CACHE_INVERSA), PRECISION_GEOHASH_INVERSA)
+        self.geocodificador = ServicioGeocodificacion(cache_coordenadas, cache_direcciones,
+                                                      TIMEOUT_GEOCODIFICACION, TASA_GEOCODIFICACION,
+                                                      nomenclator=self.nomenclator,
+                                                      proveedor=crear_proveedor(PROVEEDOR_GEOCODIFICACION,
+                                                                                self.nomenclator,
+                                                                                timeout=TIMEOUT_GEOCODIFICACION),
+                                                      ttl_negativo=TTL_NO_ENCONTRADAS,
+                                                      max_fallas=MAX_FALLAS_GEOCODIFICACION,
+                                                      pausa=PAUSA_GEOCODIFICACION)
+        # Distancias ya calculadas, compartidas por agregar, modificar, la vista previa del mapa,
+        # la importación y el recálculo en lote
+        self.memo_distancias = MemoDistancias(MAX_ENTRADAS_MEMO_DISTANCIAS)
+        self.red_vial = None  # Se carga en segundo plano (ver preparar_red_vial)
+        # Grafo de rutas encadenables (destino cerca de otra partida) para planificar viajes
+        self.planificador = Planificador(TOLERANCIA_ENCADENAMIENTO_KM)
+        # Trabajos en segundo plano (agregar/modificar/importar): clave -> (futuro, descripción, evento de cancelación)
+        self.ejecutor_tareas = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tareas")
+        self.trabajos = {}
 
         # --- Título ---
         self.label_titulo = tk.Label(root, text="Gestión de Rutas de Entrega", bg="#E2FFD1", font=("Arial", 16, "bold"))
@@ -340,6 +491,8 @@ class Aplicacion:
         self.entry_partida.grid(row=2, column=1, padx=(0, 5), pady=5, sticky="w")
         self.btn_seleccionar_partida = tk.Button(input_frame, text="Seleccionar en Mapa", command=lambda: self.mostrar_mapa("partida"), bg="#ADD8E6", fg="black", font=("Arial", 9))
         self.btn_seleccionar_partida.grid(row=2, column=2, padx=(0, 10), pady=5, sticky="w")
+        self.label_estado_partida = tk.Label(input_frame, text="", bg="#E3F2FD", font=("Arial", 8, "italic"))
+        self.label_estado_partida.grid(row=2, column=3, padx=(0, 10), pady=5, sticky="w")
 
         # Punto de Destino
         self.label_destino = tk.Label(input_frame, text="Punto de Destino:", bg="#E3F2FD", font=("Arial", 10, "bold"))
@@ -348,6 +501,14 @@ class Aplicacion:
         self.entry_destino.grid(row=3, column=1, padx=(0, 5), pady=5, sticky="w")
         self.btn_seleccionar_destino = tk.Button(input_frame, text="Seleccionar en Mapa", command=lambda: self.mostrar_mapa("destino"), bg="#ADD8E6", fg="black", font=("Arial", 9))
         self.btn_seleccionar_destino.grid(row=3, column=2, padx=(0, 10), pady=5, sticky="w")
+        self.label_estado_destino = tk.Label(input_frame, text="", bg="#E3F2FD", font=("Arial", 8, "italic"))
+        self.label_estado_destino.grid(row=3, column=3, padx=(0, 10), pady=5, sticky="w")
+
+        # Búsqueda anticipada mientras se escribe (ver _programar_prebusqueda)
+        self.prebusquedas_programadas = {"partida": None, "destino": None}  # tipo -> id de root.after
+        self.prebusquedas_en_curso = {"partida": None, "destino": None}  # tipo -> futuro de la última consulta
+        self.entry_partida.bind("<KeyRelease>", lambda event: self._programar_prebusqueda("partida"))
+        self.entry_destino.bind("<KeyRelease>", lambda event: self._programar_prebusqueda("destino"))
 
         # Distancia
         self.label_distancia = tk.Label(input_frame, text="Distancia (km):", bg="#E3F2FD", font=("Arial", 10, "bold"))
@@ -394,6 +555,9 @@ class Aplicacion:
         self.btn_modificar = tk.Button(button_frame, text="Modificar Ruta", command=self.modificar_ruta, bg="#FFA000", fg="white", font=("Arial", 10), width=button_width)
         self.btn_informe = tk.Button(button_frame, text="Generar Informe", command=self.generar_informe, bg="#90EE90", fg="black", font=("Arial", 10), width=button_width)
         self.btn_ver_mapa = tk.Button(button_frame, text="Ver en Mapa", command=self.ver_ruta_en_mapa, bg="#6495ED", fg="white", font=("Arial", 10), width=button_width)
+        self.btn_importar = tk.Button(button_frame, text="Importar CSV", command=self.importar_rutas, bg="#9575CD", fg="white", font=("Arial", 10), width=button_width)
+        self.btn_recalcular = tk.Button(button_frame, text="Recalcular Dist.", command=self.recalcular_distancias, bg="#80CBC4", fg="black", font=("Arial", 10), width=button_width)
+        self.btn_planificar = tk.Button(button_frame, text="Planificar Viaje", command=self.planificar_viaje, bg="#4DB6AC", fg="black", font=("Arial", 10), width=button_width)
 
         # Colocar botones en el frame
         self.btn_agregar.pack(side=tk.LEFT, padx=5)
@@ -402,6 +566,20 @@ class Aplicacion:
         self.btn_modificar.pack(side=tk.LEFT, padx=5)
         self.btn_informe.pack(side=tk.LEFT, padx=5)
         self.btn_ver_mapa.pack(side=tk.LEFT, padx=5)
+        self.btn_importar.pack(side=tk.LEFT, padx=5)
+        self.btn_recalcular.pack(side=tk.LEFT, padx=5)
+        self.btn_planificar.pack(side=tk.LEFT, padx=5)
+
+        # --- Indicador de progreso (visible solo mientras hay trabajos en segundo plano) ---
+        self.estado_frame = tk.Frame(root, bg="#E2FFD1")
+        self.estado_frame.grid(row=3, column=0, columnspan=5, pady=(0, 5))
+        self.barra_progreso = ttk.Progressbar(self.estado_frame, mode="indeterminate", length=120)
+        self.barra_progreso.pack(side=tk.LEFT, padx=5)
+        self.label_estado = tk.Label(self.estado_frame, text="", bg="#E2FFD1", font=("Arial", 9, "italic"))
+        self.label_estado.pack(side=tk.LEFT, padx=5)
+        self.btn_cancelar = tk.Button(self.estado_frame, text="Cancelar", command=self.cancelar_trabajos, bg="#BDBDBD", fg="black", font=("Arial", 9))
+        self.btn_cancelar.pack(side=tk.LEFT, padx=5)
+        self.estado_frame.grid_remove()
 
 
         # --- Treeview para mostrar los datos ---
@@ -456,7 +634,8 @@ class Aplicacion:
          # Vincular clic izquierdo (fuera de la tabla) - Lógica corregida
         self.root.bind("<Button-1>", lambda event: self.limpiar_campos() \
             if event.widget not in (self.tree, self.btn_agregar, self.btn_buscar, self.btn_eliminar, \
-                                    self.btn_modificar, self.btn_informe, self.btn_ver_mapa, \
+                                    self.btn_modificar, self.btn_informe, self.btn_ver_mapa, self.btn_importar, self.btn_recalcular, \
+                                    self.btn_planificar, self.btn_cancelar, \
                                     self.btn_seleccionar_partida, self.btn_seleccionar_destino, \
                                     self.entry_id, self.entry_nombre, self.entry_distancia, \
                                     self.entry_partida, self.entry_destino, self.entry_capacidad, self.entry_carga_actual) \
@@ -464,36 +643,119 @@ class Aplicacion:
 
         self.root.bind("<Escape>", lambda event: self.limpiar_campos())  # <-- Limpiar con Escape
         self.cargar_datos_iniciales()
+        self.enlazar_rutas()
+        self.indexar_direcciones_conocidas()
+        self.preparar_red_vial()
+
+    def indexar_direcciones_conocidas(self):
+        """
+        Arma el nomenclátor local en un hilo aparte (con muchas rutas tarda unos segundos).
+
+        Primero se indexan las rutas cargadas y luego los otros CSV de rutas del
+        directorio.  Ninguno pisa lo ya indexado, así que las rutas que el
+        usuario agrega o modifica mientras tanto conservan sus coordenadas.
+        """
+        rutas = self.arbol.obtener_rutas()
+        archivos = [archivo for archivo in sorted(glob.glob(ARCHIVOS_NOMENCLATOR))
+                    if os.path.abspath(archivo) not in (ARCHIVO_DATOS, ARCHIVO_RECHAZOS)]
+
+        def construir():
+            self.nomenclator.agregar_rutas(rutas, reemplazar=False, ordenar=False)  # construir_nomenclator ordena al final
+            construir_nomenclator(archivos, self.nomenclator)
+            print(f"DEBUG: indexar_direcciones_conocidas - {len(self.nomenclator)} direcciones indexadas")
+
+        threading.Thread(target=construir, name="nomenclator", daemon=True).start()
+
+    def enlazar_rutas(self):
+        """
+        Arma en un hilo aparte el grafo de rutas encadenables de self.planificador.
+
+        Las rutas que se agregan, modifican o eliminan mientras tanto (ver
+        guardar_datos) se actualizan por separado y el armado no las pisa.  Si
+        se vuelve a llamar antes de que termine, el armado anterior se detiene.
+        """
+        generacion = self.planificador.vaciar()
+        rutas = self.arbol.obtener_rutas()
+
+        def construir():
+            self.planificador.agregar_rutas(rutas, reemplazar=False, generacion=generacion)
+            if self.planificador.vigente(generacion):
+                print(f"DEBUG: enlazar_rutas - {len(self.planificador)} rutas, "
+                      f"{self.planificador.cantidad_enlaces} enlaces")
+
+        threading.Thread(target=construir, name="planificador", daemon=True).start()
+
+    def preparar_red_vial(self):
+        """
+        Carga en un hilo aparte la red vial de ARCHIVO_RED_VIAL, si hay una.
+
+        La primera vez lee el extracto OSM (puede tardar) y guarda el grafo en
+        un .npz junto a él; las siguientes se carga de ese archivo.
+        """
+        if not ARCHIVO_RED_VIAL:
+            return
+
+        def cargar():
+            try:
+                red = cargar_red_vial(ARCHIVO_RED_VIAL)
+            except (OSError, ValueError) as e:
+                print(f"DEBUG: preparar_red_vial - No se pudo cargar {ARCHIVO_RED_VIAL}: {e}")
+                return
+            self.red_vial = red
+            print(f"DEBUG: preparar_red_vial - {len(red)} nodos, {red.cantidad_arcos} arcos")
+
+        threading.Thread(target=cargar, name="red_vial", daemon=True).start()
 
     def obtener_coordenadas(self, lugar):
-        """Obtiene las coordenadas (latitud, longitud) de un lugar usando Nominatim.
+        """Obtiene las coordenadas (latitud, longitud) de un lugar usando el servicio de geocodificación.
+            Primero consulta el nomenclátor local y la caché persistente; solo si no está se va a la red.
             Maneja errores y devuelve (None, None) si falla.
         """
-        geolocalizador = Nominatim(user_agent="gestor_rutas_app", timeout=10)
         try:
-            ubicacion = geolocalizador.geocode(lugar)
-            if ubicacion:
-                #DEBUG: print(f"DEBUG (obtener_coordenadas): Geocodificación exitosa para '{lugar}'.")
-                #DEBUG: print(f"DEBUG (obtener_coordenadas): Latitud: {ubicacion.latitude}, Longitud: {ubicacion.longitude}")  # Imprime las coordenadas
-                return (ubicacion.latitude, ubicacion.longitude)  # Devuelve latitud, longitud
-            else:
-                #DEBUG: print(f"DEBUG (obtener_coordenadas): No se encontró ubicación para '{lugar}'.")
-                messagebox.showerror("Error de Geocodificación", f"No se encontró la ubicación: '{lugar}'")
-                return (None, None)  # Devuelve None, None en caso de error
-        except GeocoderTimedOut:
-            #DEBUG: print(f"DEBUG (obtener_coordenadas): Timeout para '{lugar}'.")
-            messagebox.showerror("Error de Geocodificación", "El servicio tardó demasiado. Revise su conexión a Internet.")
-            return (None, None)
-        except GeocoderUnavailable:
-            #DEBUG: print(f"DEBUG (obtener_coordenadas): Servicio no disponible para '{lugar}'.")
-            messagebox.showerror("Error de Geocodificación", "El servicio no está disponible. Intente más tarde.")
-            return (None, None)
+            coordenadas = self.geocodificador.geocodificar(lugar)
         except Exception as e:
-            #DEBUG: print(f"DEBUG (obtener_coordenadas): Error inesperado para '{lugar}': {e}")
-            messagebox.showerror("Error de Geocodificación", f"Error inesperado: {e}")
-            return (None, None)
+            coordenadas = e
+        if isinstance(coordenadas, tuple):
+            #DEBUG: print(f"DEBUG (obtener_coordenadas): Geocodificación exitosa para '{lugar}': {coordenadas}")
+            return coordenadas  # Devuelve latitud, longitud
+        messagebox.showerror("Error de Geocodificación", self._mensaje_error_geocodificacion(lugar, coordenadas))
+        return (None, None)  # Devuelve None, None en caso de error
+
+    def _errores_geocodificacion(self, lugares, resultados):
+        """
+        Devuelve los mensajes de error (sin repetir) de un lote de geocodificaciones.
+
+        Args:
+            lugares (iterable): Direcciones consultadas.
+            resultados (iterable): Resultados de ServicioGeocodificacion.geocodificar_varios.
+        """
+        errores = [self._mensaje_error_geocodificacion(lugar, resultado)
+                   for lugar, resultado in zip(lugares, resultados) if not isinstance(resultado, tuple)]
+        return list(dict.fromkeys(errores))
+
+    def _mensaje_error_geocodificacion(self, lugar, resultado):
+        """Devuelve el mensaje para el usuario según el resultado fallido de una geocodificación."""
+        if resultado is None:
+            #DEBUG: print(f"DEBUG (obtener_coordenadas): No se encontró ubicación para '{lugar}'.")
+            return f"No se encontró la ubicación: '{lugar}'"
+        if isinstance(resultado, GeocodificacionEnPausa):
+            return (f"El servicio de geocodificación falló varias veces seguidas; se reintentará en "
+                    f"{resultado.restante:.0f} s.  Mientras tanto solo se reconocen direcciones ya conocidas "
+                    f"o elegidas en el mapa.")
+        if isinstance(resultado, GeocoderTimedOut):
+            return "El servicio tardó demasiado. Revise su conexión a Internet."
+        if isinstance(resultado, GeocoderUnavailable):
+            return "El servicio no está disponible. Intente más tarde."
+        return f"Error inesperado: {resultado}"
 
     def agregar_ruta(self):
+        """
+        Valida los campos y agrega la ruta.
+
+        La geocodificación y el cálculo de distancia se hacen en segundo plano
+        (ver _ejecutar_en_segundo_plano); la ruta se inserta cuando terminan,
+        en el hilo de la interfaz.
+        """
         #DEBUG: print("DEBUG: agregar_ruta INICIO")
         try:
             nombre = self.entry_nombre.get().strip()
@@ -511,19 +773,9 @@ class Aplicacion:
                 #DEBUG: print("DEBUG: agregar_ruta - Campos obligatorios vacíos")
                 return
 
-            # --- Obtener coordenadas SIEMPRE ---
-            coordenadas_partida = self.obtener_coordenadas(partida)
-            coordenadas_destino = self.obtener_coordenadas(destino)
-
-            if not coordenadas_partida or not coordenadas_destino:
-                #DEBUG: print("DEBUG: agregar_ruta - Falló la geocodificación")
-                return
-
-            self.latitud_partida, self.longitud_partida = coordenadas_partida
-            self.latitud_destino, self.longitud_destino = coordenadas_destino
-
-            # --- Cálculo de distancia / Validación de distancia ---
-            if distancia_str:
+            # --- Validación de distancia (si se ingresó a mano) ---
+            distancia = None
+            if distancia_str and distancia_str != self.distancia_previa:
                 try:
                     distancia = float(distancia_str)
                     if distancia < 0:
@@ -533,18 +785,6 @@ class Aplicacion:
                 except ValueError:
                     messagebox.showerror("Error", "La distancia debe ser un número válido.")
                     return
-            else:
-                distancia = self.calcular_distancia(self.latitud_partida, self.longitud_partida,
-                                                    self.latitud_destino, self.longitud_destino)
-                if distancia is None:
-                    #DEBUG: print("DEBUG: agregar_ruta - Falló el cálculo de distancia")
-                    return
-                distancia = round(distancia, 2)
-
-            # --- Mostrar la distancia ---
-            self.entry_distancia.delete(0, tk.END)
-            self.entry_distancia.insert(0, str(distancia))
-
 
             # --- Validación de Capacidad y Carga Actual ---
             try:
@@ -568,26 +808,18 @@ class Aplicacion:
                 messagebox.showerror("Error", "La carga actual debe ser un número válido.")
                 return
 
+            # --- Geocodificación y distancia en segundo plano ---
+            # Solo se geocodifica lo escrito a mano; lo elegido en el mapa ya trae coordenadas.
+            coordenadas_partida = self._coordenadas_confiables("partida", partida)
+            coordenadas_destino = self._coordenadas_confiables("destino", destino)
 
+            def trabajo():
+                return self._geocodificar_y_medir(partida, destino, distancia, coordenadas_partida, coordenadas_destino)
 
-            # --- Generar ID y resto de la lógica ---
-            id_ruta = self.obtener_siguiente_id()
-            #DEBUG: print(f"DEBUG: agregar_ruta - ID generado: {id_ruta}")
+            def al_terminar(resultado, error):
+                self._terminar_agregar_ruta(nombre, partida, destino, capacidad, carga_actual, resultado, error)
 
-            # --- Pasar capacidad y carga_actual al constructor del Nodo ---
-            exito = self.arbol.insertar(id_ruta, nombre, distancia, partida, destino,
-                                        self.latitud_partida, self.longitud_partida,
-                                        self.latitud_destino, self.longitud_destino,
-                                        capacidad, carga_actual)  # <-- Pasar capacidad y carga
-            #DEBUG: print(f"DEBUG: agregar_ruta - Resultado de insertar: {exito}")
-
-            if exito:
-                self.actualizar_lista()
-                messagebox.showinfo("Éxito", "Ruta agregada correctamente.")
-                self.limpiar_campos()
-                self.guardar_datos()
-            else:
-                messagebox.showerror("Error", "Error al agregar la ruta.")
+            self._ejecutar_en_segundo_plano(("agregar", nombre.lower()), f"Agregar '{nombre}'", trabajo, al_terminar)
 
         except Exception as e:
             messagebox.showerror("Error", f"Error inesperado: {e}")
@@ -598,6 +830,129 @@ class Aplicacion:
             # self.entry_id.config(state="normal") #Ya se habilita en limpiar campos.
             #DEBUG: print("DEBUG: agregar_ruta FIN")
 
+    def _geocodificar_y_medir(self, partida, destino, distancia=None, coordenadas_partida=None,
+                              coordenadas_destino=None, medir=True):
+        """
+        Trabajo en segundo plano: geocodifica partida y destino (en paralelo) y,
+        si no se indicó una distancia, la calcula.  No toca la interfaz.
+
+        Args:
+            coordenadas_partida (tuple, optional): (lat, lon) ya conocidas de la partida; no se geocodifica.
+            coordenadas_destino (tuple, optional): Ídem para el destino.
+            medir (bool, optional): Si es False solo se geocodifica (la distancia se devuelve tal cual).
+
+        Returns:
+            tuple: (resultados de geocodificar_varios, distancia o None).
+        """
+        resultados = [coordenadas_partida, coordenadas_destino]
+        faltantes = [indice for indice, coordenadas in enumerate(resultados) if coordenadas is None]
+        if faltantes:
+            lugares = (partida, destino)
+            consultados = self.geocodificador.geocodificar_varios([lugares[indice] for indice in faltantes],
+                                                                  PLAZO_GEOCODIFICACION)
+            for indice, resultado in zip(faltantes, consultados):
+                resultados[indice] = resultado
+        if medir and distancia is None and all(isinstance(resultado, tuple) for resultado in resultados):
+            (lat_partida, lon_partida), (lat_destino, lon_destino) = resultados
+            distancia = self.calcular_distancia(lat_partida, lon_partida, lat_destino, lon_destino, mostrar_error=False)
+            if distancia is not None:
+                distancia = round(distancia, 2)
+        return resultados, distancia
+
+    def _terminar_agregar_ruta(self, nombre, partida, destino, capacidad, carga_actual, resultado, error):
+        """Segunda parte de agregar_ruta, en el hilo de la interfaz: inserta la ruta ya geocodificada."""
+        if error is not None:
+            messagebox.showerror("Error", f"Error inesperado: {error}")
+            return
+        resultados, distancia = resultado
+        errores = self._errores_geocodificacion((partida, destino), resultados)
+        if errores:
+            #DEBUG: print("DEBUG: agregar_ruta - Falló la geocodificación")
+            messagebox.showerror("Error de Geocodificación", "\n".join(errores))
+            return
+        if distancia is None:
+            #DEBUG: print("DEBUG: agregar_ruta - Falló el cálculo de distancia")
+            messagebox.showerror("Error", "Error al calcular la distancia.")
+            return
+        (lat_partida, lon_partida), (lat_destino, lon_destino) = resultados
+
+        # --- Generar ID y resto de la lógica ---
+        id_ruta = self.obtener_siguiente_id()
+        #DEBUG: print(f"DEBUG: agregar_ruta - ID generado: {id_ruta}")
+
+        # --- Pasar capacidad y carga_actual al constructor del Nodo ---
+        exito = self.arbol.insertar(id_ruta, nombre, distancia, partida, destino,
+                                    lat_partida, lon_partida, lat_destino, lon_destino,
+                                    capacidad, carga_actual)  # <-- Pasar capacidad y carga
+        #DEBUG: print(f"DEBUG: agregar_ruta - Resultado de insertar: {exito}")
+
+        if exito:
+            self.actualizar_lista()
+            self.guardar_datos(id_ruta)
+            messagebox.showinfo("Éxito", "Ruta agregada correctamente.")
+        else:
+            messagebox.showerror("Error", "Error al agregar la ruta.")
+
+    def _ejecutar_en_segundo_plano(self, clave, descripcion, trabajo, al_terminar, cancelar=None):
+        """
+        Ejecuta `trabajo` en un hilo aparte sin congelar la ventana.
+
+        Mientras corre se muestra el indicador de progreso (con opción de
+        cancelar).  Al terminar, `al_terminar(resultado, error)` se ejecuta en
+        el hilo de Tk (se revisa con root.after), así que puede tocar los widgets.
+
+        Args:
+            clave (hashable): Identifica la operación; no se aceptan dos a la vez con la misma clave.
+            descripcion (str): Texto que se muestra mientras corre.
+            trabajo (callable): Función sin argumentos; no debe tocar la interfaz.
+            al_terminar (callable): Recibe (resultado, error); error es None si no hubo excepción.
+            cancelar (threading.Event, optional): Se activa al cancelar, para trabajos largos
+                que revisan si deben detenerse.
+
+        Returns:
+            bool: False si se rechazó por haber otra igual en curso.
+        """
+        if clave in self.trabajos:
+            messagebox.showwarning("Operación en curso", f"{descripcion}: ya hay una operación igual en curso.")
+            return False
+        futuro = self.ejecutor_tareas.submit(trabajo)
+        self.trabajos[clave] = (futuro, descripcion, cancelar)
+        self._actualizar_progreso()
+        self.root.after(100, self._revisar_trabajo, clave, futuro, al_terminar)
+        return True
+
+    def _revisar_trabajo(self, clave, futuro, al_terminar):
+        """Revisa periódicamente un trabajo en segundo plano y entrega su resultado al terminar."""
+        if not futuro.done():
+            self.root.after(100, self._revisar_trabajo, clave, futuro, al_terminar)
+            return
+        if self.trabajos.get(clave, (None,))[0] is not futuro:
+            return  # Fue cancelado: el resultado se descarta
+        del self.trabajos[clave]
+        self._actualizar_progreso()
+        error = futuro.exception()
+        al_terminar(None if error else futuro.result(), error)
+
+    def cancelar_trabajos(self):
+        """Cancela las operaciones en curso (sus resultados se descartan)."""
+        for futuro, _, cancelar in self.trabajos.values():
+            futuro.cancel()
+            if cancelar is not None:
+                cancelar.set()
+        self.trabajos.clear()
+        self._actualizar_progreso()
+
+    def _actualizar_progreso(self):
+        """Muestra u oculta el indicador de progreso según haya trabajos en curso."""
+        if self.trabajos:
+            descripciones = ", ".join(descripcion for _, descripcion, _ in self.trabajos.values())
+            self.label_estado.config(text=f"Procesando: {descripciones}...")
+            self.estado_frame.grid()
+            self.barra_progreso.start(10)
+        else:
+            self.barra_progreso.stop()
+            self.estado_frame.grid_remove()
+
     def obtener_siguiente_id(self):
         """Obtiene el siguiente ID disponible para una nueva ruta."""
         rutas = self.arbol.obtener_rutas()
@@ -658,6 +1013,7 @@ class Aplicacion:
             # --- Distancia ---
             self.entry_distancia.delete(0, tk.END)
             self.entry_distancia.insert(0, str(nodo.distancia))
+            self.distancia_previa = None
 
             # --- Partida ---
             self.entry_partida.delete(0, tk.END)
@@ -680,6 +1036,8 @@ class Aplicacion:
             self.longitud_partida = nodo.longitud_partida if nodo.longitud_partida is not None else 0.0
             self.latitud_destino = nodo.latitud_destino if nodo.latitud_destino is not None else 0.0
             self.longitud_destino = nodo.longitud_destino if nodo.longitud_destino is not None else 0.0
+            self._registrar_origen("partida", nodo.partida, nodo.latitud_partida, nodo.longitud_partida, "ruta")
+            self._registrar_origen("destino", nodo.destino, nodo.latitud_destino, nodo.longitud_destino, "ruta")
 
             #DEBUG: print(f"DEBUG: cargar_ruta_buscada - Coordenadas guardadas: lat_partida={self.latitud_partida}, "
             #      f"lon_partida={self.longitud_partida}, lat_destino={self.latitud_destino}, "
@@ -701,7 +1059,7 @@ class Aplicacion:
             if self.arbol.eliminar(int(id_ruta)):
                 self.actualizar_lista()
                 self.limpiar_campos()
-                self.guardar_datos() #Guarda los datos
+                self.guardar_datos(int(id_ruta)) #Guarda los datos
             else:
                 messagebox.showerror("Error", "Ruta no encontrada.")
 
@@ -778,6 +1136,12 @@ class Aplicacion:
         self.entry_capacidad.delete(0, tk.END)
         self.entry_carga_actual.delete(0, tk.END)
         self.modo_edicion = False  # Restablecer el modo de edición
+        self.origen_coordenadas = {"partida": None, "destino": None}
+        self.distancia_previa = None
+        self._mostrar_estado_direccion("partida", "")
+        self._mostrar_estado_direccion("destino", "")
+        self._cancelar_prebusqueda("partida")
+        self._cancelar_prebusqueda("destino")
 
         # *Después* de limpiar, si NO hay selección, deshabilitar.  Si la llamada
         # viene de un evento (Escape), deshabilitar.  Si no (ej. desde agregar_ruta),
@@ -821,6 +1185,8 @@ class Aplicacion:
                 self.longitud_partida = nodo.longitud_partida
                 self.latitud_destino = nodo.latitud_destino
                 self.longitud_destino = nodo.longitud_destino
+                self._registrar_origen("partida", nodo.partida, nodo.latitud_partida, nodo.longitud_partida, "ruta")
+                self._registrar_origen("destino", nodo.destino, nodo.latitud_destino, nodo.longitud_destino, "ruta")
             # else: #Comentamos el else porque si no se encuentra la ruta en la lista
             # no hacemos nada
                 #DEBUG: print(f"DEBUG: _cargar_ruta - Nodo no encontrado para ID: {id_ruta}")
@@ -836,6 +1202,7 @@ class Aplicacion:
             self.entry_nombre.insert(0, nombre)
             self.entry_distancia.delete(0, tk.END)
             self.entry_distancia.insert(0, distancia)
+            self.distancia_previa = None
             self.entry_partida.delete(0, tk.END)
             self.entry_partida.insert(0, partida)
             self.entry_destino.delete(0, tk.END)
@@ -904,32 +1271,44 @@ class Aplicacion:
                 messagebox.showerror("Error", "La ruta con el ID especificado no existe.")
                 return
 
-            # --- Geolocalización ---
-            coordenadas_partida = self.obtener_coordenadas(nueva_partida)
-            coordenadas_destino = self.obtener_coordenadas(nuevo_destino)
-
-            if not coordenadas_partida or not coordenadas_destino:
-                return  # Ya se mostró un error dentro de obtener_coordenadas
-
-            lat_partida, lon_partida = coordenadas_partida
-            lat_destino, lon_destino = coordenadas_destino
-
-            # --- Recalcular distancia ---
-            nueva_distancia = self.calcular_distancia(lat_partida, lon_partida, lat_destino, lon_destino)
-            if nueva_distancia is None:
+            # --- Solo se geocodifica y se mide lo que cambió ---
+            # Una dirección sin cambios conserva sus coordenadas; una distancia escrita a mano
+            # se respeta, y si no cambió ninguna dirección se conserva la guardada.
+            coordenadas_partida = self._coordenadas_confiables("partida", nueva_partida)
+            coordenadas_destino = self._coordenadas_confiables("destino", nuevo_destino)
+            if coordenadas_partida is None \
+                    and normalizar_direccion(nueva_partida) == normalizar_direccion(nodo.partida or "") \
+                    and nodo.latitud_partida is not None and nodo.longitud_partida is not None:
+                coordenadas_partida = (nodo.latitud_partida, nodo.longitud_partida)
+            if coordenadas_destino is None \
+                    and normalizar_direccion(nuevo_destino) == normalizar_direccion(nodo.destino or "") \
+                    and nodo.latitud_destino is not None and nodo.longitud_destino is not None:
+                coordenadas_destino = (nodo.latitud_destino, nodo.longitud_destino)
+            # La de la vista previa del mapa no cuenta como escrita a mano: se mide con el modelo exacto
+            escrita_a_mano = nueva_distancia_str.strip() != self.distancia_previa
+            distancia = None
+            if escrita_a_mano and round(nueva_distancia, 2) != nodo.distancia:
+                distancia = round(nueva_distancia, 2)
+            elif coordenadas_partida == (nodo.latitud_partida, nodo.longitud_partida) \
+                    and coordenadas_destino == (nodo.latitud_destino, nodo.longitud_destino):
+                distancia = nodo.distancia
+
+            def al_terminar(resultado, error):
+                self._terminar_modificar_ruta(id_ruta, nuevo_nombre, nueva_partida, nuevo_destino,
+                                              nueva_capacidad, nueva_carga_actual, resultado, error)
+
+            if coordenadas_partida and coordenadas_destino and distancia is not None \
+                    and ("modificar", id_ruta) not in self.trabajos:
+                # Por ejemplo solo cambió la carga: no hace falta consultar la red
+                al_terminar(([coordenadas_partida, coordenadas_destino], distancia), None)
                 return
 
-            nueva_distancia = round(nueva_distancia, 2)
+            # --- Geolocalización y distancia en segundo plano ---
+            def trabajo():
+                return self._geocodificar_y_medir(nueva_partida, nuevo_destino, distancia,
+                                                  coordenadas_partida, coordenadas_destino)
 
-            # --- Modificar ruta en el árbol ---
-            if self.arbol.modificar(id_ruta, nuevo_nombre, nueva_distancia, nueva_partida, nuevo_destino,
-                                    lat_partida, lon_partida, lat_destino, lon_destino, nueva_capacidad, nueva_carga_actual):
-                self.actualizar_lista()
-                self.limpiar_campos()
-                self.guardar_datos()
-                messagebox.showinfo("Modificación", "Ruta modificada con éxito.")
-            else:
-                messagebox.showerror("Error", "No se pudo modificar la ruta.")
+            self._ejecutar_en_segundo_plano(("modificar", id_ruta), f"Modificar ruta {id_ruta}", trabajo, al_terminar)
 
         except ValueError:
             messagebox.showerror("Error", "Ingrese valores válidos (ID numérico, distancia numérica).")
@@ -937,30 +1316,85 @@ class Aplicacion:
             # self.entry_id.config(state="disabled")  # <-- Ya no va aquí
             self.modo_edicion = False  # <-- Finalizar modo edición SIEMPRE
 
+    def _terminar_modificar_ruta(self, id_ruta, nuevo_nombre, nueva_partida, nuevo_destino,
+                                 nueva_capacidad, nueva_carga_actual, resultado, error):
+        """Segunda parte de modificar_ruta, en el hilo de la interfaz: aplica la modificación."""
+        if error is not None:
+            messagebox.showerror("Error", f"Error inesperado: {error}")
+            return
+        resultados, nueva_distancia = resultado
+        errores = self._errores_geocodificacion((nueva_partida, nuevo_destino), resultados)
+        if errores:
+            messagebox.showerror("Error de Geocodificación", "\n".join(errores))
+            return
+        if nueva_distancia is None:
+            messagebox.showerror("Error", "Error al calcular la distancia.")
+            return
+        (lat_partida, lon_partida), (lat_destino, lon_destino) = resultados
+
+        # --- Modificar ruta en el árbol ---
+        if self.arbol.modificar(id_ruta, nuevo_nombre, nueva_distancia, nueva_partida, nuevo_destino,
+                                lat_partida, lon_partida, lat_destino, lon_destino, nueva_capacidad, nueva_carga_actual):
+            self.actualizar_lista()
+            if self.entry_id.get() == str(id_ruta):  # Solo si el usuario no pasó a otra ruta mientras tanto
+                self.limpiar_campos()
+            self.guardar_datos(id_ruta)
+            messagebox.showinfo("Modificación", "Ruta modificada con éxito.")
+        else:
+            messagebox.showerror("Error", "No se pudo modificar la ruta.")
+
     def obtener_direccion(self, latitud, longitud):
-        geolocalizador = Nominatim(user_agent="aplicacion_rutas") #Usar un nombre
+        """
+        Obtiene la dirección de un punto (geocodificación inversa), consultando primero la caché.
+
+        Returns:
+            str: La dirección, o None si no se encontró.
+
+        Raises:
+            Exception: Los errores del servicio se propagan (ver MapaDialog._direccion_obtenida).
+        """
         try:
-            ubicacion = geolocalizador.reverse((latitud, longitud), exactly_one=True, language="es")
-            if ubicacion:
-                return ubicacion.address
-            else:
-                return "Dirección no encontrada"
+            return self.geocodificador.direccion(latitud, longitud) or None
         except Exception as e:
             print(f"Error en geocodificación inversa: {e}")
-            return "Error al obtener dirección"
+            raise
 
-    def calcular_distancia(self, lat1, lon1, lat2, lon2):
-        """Calcula la distancia geodésica entre dos puntos."""
+    def calcular_distancia(self, lat1, lon1, lat2, lon2, mostrar_error=True, modelo=None, con_geometria=False):
+        """Calcula la distancia entre dos puntos (por defecto la geodésica exacta).
+            Con mostrar_error=False no abre diálogos (para usarla desde otro hilo).
+            modelo: una clave de distancias.MODELOS_DISTANCIA o "calles" (por defecto MODELO_DISTANCIA).
+            Con con_geometria=True devuelve (km, lista de (lat, lon) del trayecto por calles o None).
+        """
+        modelo = modelo or MODELO_DISTANCIA
         try:
-            punto1 = (lat1, lon1)
-            punto2 = (lat2, lon2)
-            distancia = geodesic(punto1, punto2).km  # Calcula la distancia en kilómetros
-            return distancia
+            red = self.red_vial
+            if modelo == "calles" and red is not None:
+                if con_geometria:
+                    trayecto = red.distancia_por_calles(lat1, lon1, lat2, lon2)
+                    if trayecto is not None:
+                        return trayecto
+                else:
+                    # Por calles importa el sentido (calles de un sentido): A->B y B->A no se comparten
+                    distancia = self.memo_distancias.distancia(lat1, lon1, lat2, lon2, "calles",
+                                                               funcion=self._km_por_calles, simetrica=False)
+                    if distancia is not None:
+                        return distancia
+            if modelo == "calles":
+                modelo = "geodesic"  # Red sin cargar o sin camino: en línea recta
+            # En kilómetros; una pareja ya medida se toma de self.memo_distancias
+            distancia = self.memo_distancias.distancia(lat1, lon1, lat2, lon2, modelo)
+            return (distancia, None) if con_geometria else distancia
         except Exception as e:
             print(f"Error al calcular la distancia: {e}")
-            messagebox.showerror("Error", "Error al calcular la distancia.")
+            if mostrar_error:
+                messagebox.showerror("Error", "Error al calcular la distancia.")
             return None
 
+    def _km_por_calles(self, lat1, lon1, lat2, lon2):
+        """Kilómetros por calles entre dos puntos, o None si no hay camino (para MemoDistancias)."""
+        trayecto = self.red_vial.distancia_por_calles(lat1, lon1, lat2, lon2)
+        return trayecto[0] if trayecto is not None else None
+
     def mostrar_mapa(self, tipo):
         """Abre la ventana del mapa para seleccionar coordenadas."""
         if self.mapa_dialog is None:
@@ -973,6 +1407,7 @@ class Aplicacion:
             # Si ya existe, reutiliza la instancia existente
             self.mapa_dialog.tipo = tipo  # Actualiza el tipo (partida/destino)
             self.mapa_dialog.map_widget.delete_all_marker()  # Elimina marcadores previos
+            self.mapa_dialog.reiniciar_seleccion()  # Olvida el punto y la dirección anteriores
             self.mapa_dialog.deiconify()  # Muestra la ventana (si estaba oculta)
 
         self.root.wait_window(self.mapa_dialog)
@@ -1031,59 +1466,82 @@ class Aplicacion:
 
     def cargar_datos_iniciales(self):
         """Carga datos desde el archivo CSV, o inserta datos de ejemplo si hay errores."""
-        ruta_archivo = os.path.join(os.getcwd(), "rutas_informe.csv")
+        if self.almacen is not None:
+            self.cargar_datos_sqlite()
+            return
+
+        ruta_archivo = ARCHIVO_DATOS
+
+        if not os.path.exists(ruta_archivo) or os.path.getsize(ruta_archivo) == 0:
+            print("DEBUG: cargar_datos_iniciales - El archivo CSV no existe o está vacío. Cargando datos de ejemplo.")
+            self.insertar_datos_ejemplo()
+            self.guardar_datos()
+            return
 
-        if os.path.exists(ruta_archivo):
+        cargador = CargadorCSV(ruta_archivo, archivo_rechazos=ARCHIVO_RECHAZOS, progreso=self._reportar_progreso_carga)
+        rutas = []
+        error_carga = False
+        try:
+            for bloque in cargador.bloques():
+                rutas.extend(bloque)
+        except Exception as e:
+            error_carga = True
+            # No se vuelve a escribir el archivo con datos de ejemplo: eso borraría
+            # las rutas que no se pudieron leer.  Se respalda y se sigue con lo leído.
+            respaldo = self._respaldar_archivo(ruta_archivo)
+            print(f"DEBUG: cargar_datos_iniciales - Error al cargar datos: {e}")
+            messagebox.showwarning("Advertencia", f"No se pudo leer completamente {os.path.basename(ruta_archivo)}: {e}\n"
+                                                  f"Se guardó una copia en {os.path.basename(respaldo)}.")
+
+        self.arbol = ArbolBinarioBusqueda()
+        duplicadas = self.arbol.insertar_lote(rutas)
+        if error_carga and not rutas:
+            self.insertar_datos_ejemplo()  # Solo en memoria; el archivo original queda respaldado
+        self.actualizar_lista()
+
+        if cargador.filas_rechazadas or duplicadas:
+            detalle = ", ".join(f"{motivo}: {cantidad}" for motivo, cantidad in cargador.motivos_rechazo.most_common())
+            print(f"DEBUG: cargar_datos_iniciales - {cargador.filas_validas} filas válidas, "
+                  f"{cargador.filas_rechazadas} rechazadas ({detalle}), {len(duplicadas)} duplicadas.")
+            if cargador.filas_rechazadas:
+                messagebox.showwarning("Advertencia", f"Se omitieron {cargador.filas_rechazadas} filas inválidas.\n"
+                                                      f"Ver {os.path.basename(ARCHIVO_RECHAZOS)}.")
+
+    def _reportar_progreso_carga(self, bytes_leidos, bytes_totales, filas_leidas):
+        """Muestra el avance de la carga en la barra de título (útil con archivos grandes)."""
+        porcentaje = (bytes_leidos / bytes_totales) * 100 if bytes_totales else 100
+        self.root.title(f"Gestión de Rutas - Cargando {porcentaje:.0f}% ({filas_leidas} filas)")
+        self.root.update_idletasks()
+        if bytes_leidos >= bytes_totales:
+            self.root.title("Gestión de Rutas")
+
+    def _respaldar_archivo(self, ruta_archivo):
+        """Copia el archivo a <nombre>.respaldo-<fecha> y devuelve la ruta de la copia."""
+        respaldo = f"{ruta_archivo}.respaldo-{time.strftime('%Y%m%d-%H%M%S')}"
+        shutil.copy2(ruta_archivo, respaldo)
+        return respaldo
+
+    def cargar_datos_sqlite(self):
+        """
+        Carga las rutas desde la base SQLite.  La primera vez (base vacía) migra
+        el contenido de rutas_informe.csv; si tampoco hay CSV, inserta datos de ejemplo.
+        """
+        if self.almacen.contar() == 0 and os.path.exists(ARCHIVO_DATOS):
             try:
-                with open(ruta_archivo, "r", newline="", encoding="utf-8") as f:
-                    lector_csv = csv.reader(f)
-                    encabezados = next(lector_csv, None)  # Leer la primera fila (encabezados)
-
-                    # --- Validación de Encabezados ---
-                    if encabezados is None or encabezados != ["ID", "Ruta", "Distancia (km)", "Partida", "Destino", "Latitud Partida", "Longitud Partida", "Latitud Destino", "Longitud Destino", "Capacidad", "Carga Actual", "Eficiencia"]:
-                        print("DEBUG: cargar_datos_iniciales - Encabezados incorrectos o archivo vacío.")
-                        self.insertar_datos_ejemplo()
-                        self.guardar_datos()  # <-- IMPORTANTE: Guardar después de insertar ejemplos
-                        return
+                migradas = self.almacen.migrar_desde_csv(ARCHIVO_DATOS)
+                print(f"DEBUG: cargar_datos_sqlite - Migradas {migradas} rutas desde {ARCHIVO_DATOS}")
+            except (OSError, ValueError) as e:
+                print(f"DEBUG: cargar_datos_sqlite - No se pudo migrar el CSV: {e}")
 
-                    # --- Carga de Datos ---
-                    self.arbol = ArbolBinarioBusqueda()  # <-- Crear un *NUEVO* árbol
-                    for fila in lector_csv:
-                        try:
-                            # Leer *todos* los campos, incluyendo la eficiencia (aunque no se use directamente)
-                            id_ruta, nombre, distancia_str, partida, destino, lat_partida_str, lon_partida_str, lat_destino_str, lon_destino_str, capacidad_str, carga_actual_str, _ = fila
-                            
-                            # Conversiones (con manejo de errores)
-                            id_ruta = int(id_ruta)
-                            distancia = round(float(distancia_str), 2)
-                            lat_partida = float(lat_partida_str)
-                            lon_partida = float(lon_partida_str)
-                            lat_destino = float(lat_destino_str)
-                            lon_destino = float(lon_destino_str)
-                            capacidad = float(capacidad_str)
-                            carga_actual = float(carga_actual_str)
-
-
-                            self.arbol.insertar(id_ruta, nombre, distancia, partida, destino, lat_partida, lon_partida, lat_destino, lon_destino, capacidad, carga_actual)
-
-                        except (ValueError, IndexError) as e:
-                            print(f"DEBUG: cargar_datos_iniciales - Error al leer fila: {fila} - {e}")
-                            # Si hay error en *una* fila, NO cargamos datos de ejemplo,
-                            # simplemente *ignoramos* la fila y continuamos con la siguiente.
-                            continue  # Saltar a la siguiente iteración del bucle for
-
-
-                    self.actualizar_lista()
-
-            except Exception as e:  # Captura cualquier otra excepción
-                print(f"DEBUG: cargar_datos_iniciales - Error inesperado al cargar datos: {e}")
-                self.insertar_datos_ejemplo()  # Cargar ejemplos
-                self.guardar_datos()
-
-        else:  #Si no existe el archivo CSV
-            print("DEBUG: cargar_datos_iniciales - El archivo CSV no existe. Cargando datos de ejemplo.")
+        rutas = self.almacen.obtener_rutas()
+        if not rutas:
             self.insertar_datos_ejemplo()
             self.guardar_datos()
+            return
+
+        self.arbol = ArbolBinarioBusqueda()
+        self.arbol.insertar_lote(rutas)
+        self.actualizar_lista()
 
     def insertar_datos_ejemplo(self):
         """Inserta datos de prueba en el árbol de rutas y actualiza la interfaz."""
@@ -1105,37 +1563,282 @@ class Aplicacion:
         # Asegurar que las rutas aparezcan en la tabla tras la inserción
         self.actualizar_lista()
 
-    def guardar_datos(self):
-        """Guarda los datos en un archivo CSV."""
+    def guardar_datos(self, *ids_rutas):
+        """
+        Programa el guardado de los datos en el archivo CSV (o en SQLite).
+
+        Solo toma una instantánea de las rutas (en memoria); la escritura la hace
+        el hilo de GuardadoDiferido tras un periodo sin cambios.
+
+        Args:
+            *ids_rutas (int, optional): Rutas que cambiaron.  Con SQLite solo se guardan
+                esas filas (o se eliminan si ya no están en el árbol); sin IDs se guardan todas.
+                Sus direcciones se agregan además al nomenclátor local, y sus enlaces
+                se actualizan en self.planificador (el armado completo lo hace enlazar_rutas).
+        """
+        for id_ruta in ids_rutas:  # Las direcciones nuevas o corregidas pasan al nomenclátor y al planificador
+            nodo = self.arbol.buscar(id_ruta)
+            if nodo:
+                self.nomenclator.agregar(nodo.partida, nodo.latitud_partida, nodo.longitud_partida)
+                self.nomenclator.agregar(nodo.destino, nodo.latitud_destino, nodo.longitud_destino)
+                self.planificador.agregar_ruta((nodo.id_ruta, nodo.nombre, nodo.distancia, nodo.partida, nodo.destino,
+                                                nodo.latitud_partida, nodo.longitud_partida, nodo.latitud_destino,
+                                                nodo.longitud_destino, nodo.capacidad, nodo.carga_actual))
+            else:
+                self.planificador.quitar_ruta(id_ruta)
+
+        if self.almacen is None:
+            self.guardado.marcar_sucio(self.arbol.obtener_rutas())
+        elif not ids_rutas:
+            self.guardado.marcar_sucio({ruta[0]: ruta for ruta in self.arbol.obtener_rutas()})
+        else:
+            cambios = {}
+            for id_ruta in ids_rutas:
+                nodo = self.arbol.buscar(id_ruta)
+                cambios[id_ruta] = None
+                if nodo:
+                    cambios[id_ruta] = (nodo.id_ruta, nodo.nombre, nodo.distancia, nodo.partida, nodo.destino,
+                                        nodo.latitud_partida, nodo.longitud_partida, nodo.latitud_destino,
+                                        nodo.longitud_destino, nodo.capacidad, nodo.carga_actual)
+            self.guardado.marcar_sucio(cambios)
+
+    def cerrar(self):
+        """Escribe los cambios pendientes y cierra la ventana principal."""
+        self.cancelar_trabajos()
+        self.ejecutor_tareas.shutdown(wait=False)
+        self.guardado.detener()
+        self.geocodificador.cerrar()
+        print(f"DEBUG: cerrar - Métricas de geocodificación: {self.geocodificador.metricas.resumen()}")
+        print(f"DEBUG: cerrar - Memoria de distancias: {self.memo_distancias.estadisticas()}")
+        if self.almacen is not None:
+            self.almacen.cerrar()
+        self.root.destroy()
+
+
+    def importar_rutas(self):
+        """
+        Importa rutas desde otro CSV y las agrega a las existentes.
+
+        Acepta dos formatos:
+        - El de rutas_informe.csv (por ejemplo un volcado regional): se interpreta
+          en varios procesos con importar_csv_paralelo.
+        - Planillas que solo traen direcciones (Ruta, Partida, Destino, Capacidad,
+          Carga Actual): se geocodifican con ColaGeocodificacionMasiva, que
+          respeta el límite de Nominatim y permite reanudar si se interrumpe.
+
+        Todo corre en segundo plano; las rutas se incorporan al árbol en el hilo
+        de la interfaz.
+        """
+        ruta_archivo = filedialog.askopenfilename(
+            initialdir=os.getcwd(),
+            title="Importar rutas",
+            filetypes=(("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*"))
+        )
+        if not ruta_archivo:  # El usuario canceló el diálogo
+            return
+
         try:
-            with open("rutas_informe.csv", "w", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow(["ID", "Ruta", "Distancia (km)", "Partida", "Destino", "Latitud Partida", "Longitud Partida", "Latitud Destino", "Longitud Destino", "Capacidad", "Carga Actual", "Eficiencia"])
-
-                rutas = self.arbol.obtener_rutas()
-                for ruta in rutas:
-                    id_ruta, nombre, distancia, partida, destino, lat_partida, lon_partida, lat_destino, lon_destino, capacidad, carga_actual = ruta
-                    # Calcular la eficiencia aquí, para que se guarde en el archivo.
-                    eficiencia = "N/A"
-                    if capacidad > 0:  # Evitar división por cero
-                        porcentaje = (carga_actual / capacidad) * 100
-                        if porcentaje < 50:
-                            eficiencia = "Baja"
-                        elif 50 <= porcentaje < 80:
-                            eficiencia = "Media"
-                        else:
-                            eficiencia = "Alta"
+            with open(ruta_archivo, "r", newline="", encoding="utf-8") as f:
+                encabezados = next(csv.reader(f), None)
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("Error", f"No se pudo leer el archivo: {e}")
+            return
 
-                    writer.writerow([id_ruta, nombre, distancia, partida, destino, lat_partida, lon_partida, lat_destino, lon_destino, capacidad, carga_actual, eficiencia])
+        cancelar = threading.Event()
+        if encabezados == ENCABEZADOS_CSV:
+            def trabajo():
+                rutas, rechazos = importar_csv_paralelo(ruta_archivo, archivo_rechazos=ARCHIVO_RECHAZOS)
+                return rutas, rechazos, 0
+        else:
+            def trabajo():
+                return self._importar_hoja_direcciones(ruta_archivo, cancelar)
 
-            # Ya no son necesarias with open cierra el archivo
-            #file.flush()
-            #file.close()
+        self._ejecutar_en_segundo_plano(("importar", ruta_archivo), f"Importar {os.path.basename(ruta_archivo)}",
+                                        trabajo, self._terminar_importacion, cancelar)
 
-            #DEBUG: print("DEBUG: Datos guardados correctamente en rutas_informe.csv")
-        except Exception as e:
-            print(f"ERROR: No se pudo guardar el archivo CSV. Detalles: {e}")
+    def _importar_hoja_direcciones(self, ruta_archivo, cancelar):
+        """
+        Trabajo en segundo plano: lee una planilla sin coordenadas, geocodifica
+        sus direcciones en lote y arma las rutas.  No toca la interfaz.
+
+        Returns:
+            tuple: (rutas, rechazos, cantidad de direcciones que quedaron pendientes).
+        """
+        filas, rechazos = leer_hoja_direcciones(ruta_archivo)
+        cola = ColaGeocodificacionMasiva(self.geocodificador, ruta_archivo + ".geocodificacion.jsonl")
+        resultados, fallidas = cola.resolver([direccion for fila in filas for direccion in fila[2:4]], cancelar=cancelar)
+
+        rutas = []
+        pendientes = 0
+        for linea, nombre, partida, destino, distancia, capacidad, carga_actual in filas:
+            clave_partida = normalizar_direccion(partida)
+            clave_destino = normalizar_direccion(destino)
+            if clave_partida in fallidas or clave_destino in fallidas:
+                pendientes += 1  # Se completan al volver a importar el archivo
+                continue
+            coordenadas_partida = resultados.get(clave_partida)
+            coordenadas_destino = resultados.get(clave_destino)
+            if not coordenadas_partida or not coordenadas_destino:
+                lugar = partida if not coordenadas_partida else destino
+                rechazos.append((linea, f"No se encontró la ubicación: {lugar}",
+                                 [nombre, partida, destino, capacidad, carga_actual]))
+                continue
+            if distancia is None:
+                distancia = self.calcular_distancia(*coordenadas_partida, *coordenadas_destino, mostrar_error=False)
+                if distancia is None:
+                    rechazos.append((linea, "Error al calcular la distancia",
+                                     [nombre, partida, destino, capacidad, carga_actual]))
+                    continue
+                distancia = round(distancia, 2)
+            rutas.append((0, nombre, distancia, partida, destino, *coordenadas_partida, *coordenadas_destino,
+                          capacidad, carga_actual))
 
+        if rechazos:
+            rechazos.sort(key=lambda rechazo: rechazo[0])
+            escribir_rechazos(ARCHIVO_RECHAZOS, rechazos, ENCABEZADOS_DIRECCIONES)
+        if not fallidas:
+            cola.limpiar_control()
+        return rutas, rechazos, pendientes
+
+    def recalcular_distancias(self):
+        """
+        Recalcula la distancia de todas las rutas a partir de sus coordenadas.
+
+        Útil tras corregir coordenadas en lote.  Se calcula en una sola pasada
+        vectorizada (ver distancias.distancias_rutas) en segundo plano, con el
+        mismo modelo con que se guardan (MODELO_DISTANCIA), tomando de
+        self.memo_distancias las parejas ya medidas, y se reemplazan también
+        las distancias ingresadas a mano.
+        """
+        rutas = self.arbol.obtener_rutas()
+        if not rutas:
+            messagebox.showinfo("Recalcular distancias", "No hay rutas registradas.")
+            return
+        if not messagebox.askyesno("Recalcular distancias",
+                                   f"Se recalculará la distancia de {len(rutas)} rutas según sus coordenadas, "
+                                   f"reemplazando también las ingresadas a mano.  ¿Continuar?"):
+            return
+
+        def trabajo():
+            if MODELO_DISTANCIA == "calles" and self.red_vial is not None:
+                # Por calles no hay cálculo vectorizado: una búsqueda en el grafo por ruta
+                return [self.calcular_distancia(*ruta[5:9], mostrar_error=False) if None not in ruta[5:9] else None
+                        for ruta in rutas]
+            # El equivalente en lote del modelo con que se guardan las distancias (geodesic -> vincenty);
+            # por calles sin la red cargada se usa la geodésica, como en calcular_distancia
+            modelo = MODELO_LOTE.get(MODELO_DISTANCIA, "vincenty")
+            return distancias_rutas(rutas, modelo, memo=self.memo_distancias).tolist()
+
+        def al_terminar(distancias, error):
+            self._terminar_recalculo(rutas, distancias, error)
+
+        self._ejecutar_en_segundo_plano(("recalcular",), "Recalcular distancias", trabajo, al_terminar)
+
+    def _terminar_recalculo(self, rutas, distancias, error):
+        """Aplica las distancias recalculadas (en el hilo de la interfaz)."""
+        if error is not None:
+            messagebox.showerror("Error", f"Error al recalcular las distancias: {error}")
+            return
+        cambiadas = []
+        sin_coordenadas = 0
+        for ruta, distancia in zip(rutas, distancias):
+            if distancia is None or distancia != distancia:  # None o NaN: faltan coordenadas
+                sin_coordenadas += 1
+                continue
+            nodo = self.arbol.buscar(ruta[0])
+            distancia = round(distancia, 2)
+            if nodo and nodo.distancia != distancia:
+                nodo.distancia = distancia
+                cambiadas.append(nodo.id_ruta)
+        if cambiadas:
+            self.actualizar_lista()
+            self.guardar_datos(*cambiadas)
+        mensaje = f"Distancias actualizadas: {len(cambiadas)} de {len(rutas)}."
+        if sin_coordenadas:
+            mensaje += f"\nRutas sin coordenadas (no se tocaron): {sin_coordenadas}."
+        messagebox.showinfo("Recalcular distancias", mensaje)
+
+    def planificar_viaje(self):
+        """
+        Busca la cadena de rutas guardadas más corta entre la Partida y el Destino
+        de los campos (ver planificador.Planificador): cada ruta debe partir cerca
+        de donde terminó la anterior.  Las direcciones se geocodifican en segundo
+        plano si no vienen del mapa o de una ruta cargada.
+        """
+        partida = self.entry_partida.get().strip()
+        destino = self.entry_destino.get().strip()
+        if not partida or not destino:
+            messagebox.showerror("Error", "Indique la Partida y el Destino del viaje.")
+            return
+        coordenadas_partida = self._coordenadas_confiables("partida", partida)
+        coordenadas_destino = self._coordenadas_confiables("destino", destino)
+
+        def trabajo():
+            # Solo se geocodifica: la distancia directa entre los dos puntos no hace falta
+            resultados, _ = self._geocodificar_y_medir(partida, destino, coordenadas_partida=coordenadas_partida,
+                                                       coordenadas_destino=coordenadas_destino, medir=False)
+            if not all(isinstance(resultado, tuple) for resultado in resultados):
+                return resultados, None
+            (lat_partida, lon_partida), (lat_destino, lon_destino) = resultados
+            return resultados, self.planificador.planificar(lat_partida, lon_partida, lat_destino, lon_destino)
+
+        def al_terminar(resultado, error):
+            self._terminar_planificacion(partida, destino, resultado, error)
+
+        self._ejecutar_en_segundo_plano(("planificar",), "Planificar viaje", trabajo, al_terminar)
+
+    def _terminar_planificacion(self, partida, destino, resultado, error):
+        """Muestra el viaje planificado (en el hilo de la interfaz)."""
+        if error is not None:
+            messagebox.showerror("Error", f"Error al planificar el viaje: {error}")
+            return
+        resultados, plan = resultado
+        errores = self._errores_geocodificacion((partida, destino), resultados)
+        if errores:
+            messagebox.showerror("Error de Geocodificación", "\n".join(errores))
+            return
+        if plan is None:
+            messagebox.showinfo("Planificar viaje",
+                                f"Ninguna cadena de rutas guardadas une '{partida}' con '{destino}' "
+                                f"(tolerancia: {TOLERANCIA_ENCADENAMIENTO_KM} km entre una ruta y la siguiente).")
+            return
+        km_total, cadena, km_sueltos = plan
+        lineas = []
+        for numero, id_ruta in enumerate(cadena, 1):
+            nodo = self.arbol.buscar(id_ruta)
+            if nodo:
+                lineas.append(f"{numero}. {nodo.nombre} (ID {nodo.id_ruta}): {nodo.partida} → {nodo.destino}, "
+                              f"{nodo.distancia} km")
+        lineas.append(f"\nTotal: {km_total:.2f} km en {len(cadena)} rutas ({km_sueltos:.2f} km entre rutas).")
+        messagebox.showinfo("Planificar viaje", "\n".join(lineas))
+
+    def _terminar_importacion(self, resultado, error):
+        """Incorpora las rutas importadas al árbol (en el hilo de la interfaz)."""
+        if error is not None:
+            messagebox.showerror("Error", f"Error al importar el archivo: {error}")
+            return
+
+        rutas, rechazos, pendientes = resultado
+        # Los IDs se autogeneran: se renumeran a continuación del máximo actual
+        siguiente_id = self.obtener_siguiente_id()
+        rutas = [(siguiente_id + i,) + ruta[1:] for i, ruta in enumerate(rutas)]
+        duplicadas = self.arbol.insertar_lote(rutas)
+        ids_duplicados = {ruta[0] for ruta in duplicadas}
+        importadas = [ruta[0] for ruta in rutas if ruta[0] not in ids_duplicados]
+
+        self.actualizar_lista()
+        if importadas:
+            self.guardar_datos(*importadas)
+
+        mensaje = f"Rutas importadas: {len(importadas)}."
+        if duplicadas:
+            mensaje += f"\nOmitidas por nombre repetido: {len(duplicadas)}."
+        if rechazos:
+            mensaje += f"\nFilas inválidas: {len(rechazos)} (ver {os.path.basename(ARCHIVO_RECHAZOS)})."
+        if pendientes:
+            mensaje += (f"\nRutas pendientes por fallas del servicio: {pendientes}. "
+                        f"Vuelva a importar el archivo para continuar donde quedó.")
+        messagebox.showinfo("Importar", mensaje)
 
     def ver_ruta_en_mapa(self):
         """Abre la ruta seleccionada en el navegador web (OpenStreetMap)."""
@@ -1174,42 +1877,144 @@ class Aplicacion:
         webbrowser.open(url)
 
 
-    def actualizar_campos(self, direccion, lat, lng, tipo):
+    def _programar_prebusqueda(self, tipo):
+        """
+        Reinicia la espera de la búsqueda anticipada del campo (se llama en cada tecla).
+
+        Solo cuando el campo queda ESPERA_PREBUSQUEDA ms sin cambios se consulta,
+        así no se geocodifica cada letra.
+        """
+        programada = self.prebusquedas_programadas[tipo]
+        if programada is not None:
+            self.root.after_cancel(programada)
+        self.prebusquedas_programadas[tipo] = self.root.after(ESPERA_PREBUSQUEDA, self._prebuscar, tipo)
+
+    def _prebuscar(self, tipo):
+        """Geocodifica en segundo plano lo escrito en el campo; el resultado queda en la caché."""
+        self.prebusquedas_programadas[tipo] = None
+        entrada = self.entry_partida if tipo == "partida" else self.entry_destino
+        texto = entrada.get().strip()
+        if len(texto) < MIN_CARACTERES_PREBUSQUEDA:
+            self._mostrar_estado_direccion(tipo, "")
+            return
+        if self._coordenadas_confiables(tipo, texto):
+            self._mostrar_estado_direccion(tipo, "✓ Ubicación conocida", "green")
+            return
+        self._mostrar_estado_direccion(tipo, "Buscando...", "gray")
+        # La consulta de un texto anterior que aún espera al limitador ya no sirve:
+        # se cancela para no demorar las que vienen ni gastar cuota del servicio.
+        self._cancelar_prebusqueda(tipo)
+        # Un texto a medio escribir que no existe no se anota en la caché negativa
+        futuro = self.geocodificador.ejecutor.submit(self.geocodificador.geocodificar, texto, cache_negativa=False)
+        self.prebusquedas_en_curso[tipo] = futuro
+        self._revisar_prebusqueda(tipo, texto, futuro)
+
+    def _cancelar_prebusqueda(self, tipo):
+        """Cancela la búsqueda anticipada pendiente del campo, si todavía no empezó."""
+        futuro = self.prebusquedas_en_curso[tipo]
+        if futuro is not None:
+            futuro.cancel()
+            self.prebusquedas_en_curso[tipo] = None
+
+    def _revisar_prebusqueda(self, tipo, texto, futuro):
+        """Muestra junto al campo el resultado de la búsqueda anticipada, si el texto sigue igual."""
+        if futuro is not self.prebusquedas_en_curso[tipo]:
+            return  # Reemplazada por la búsqueda de un texto más nuevo
+        entrada = self.entry_partida if tipo == "partida" else self.entry_destino
+        if entrada.get().strip() != texto:
+            self._cancelar_prebusqueda(tipo)  # El usuario siguió escribiendo
+            return
+        if not futuro.done():
+            self.root.after(100, self._revisar_prebusqueda, tipo, texto, futuro)
+            return
+        self.prebusquedas_en_curso[tipo] = None
+        if futuro.cancelled():
+            self._mostrar_estado_direccion(tipo, "")
+        elif futuro.exception() is not None:
+            if isinstance(futuro.exception(), GeocodificacionEnPausa):
+                self._mostrar_estado_direccion(tipo, "⚠ En pausa (servicio con fallas)", "orange")
+            else:
+                self._mostrar_estado_direccion(tipo, "⚠ Sin conexión", "orange")
+        elif futuro.result() is None:
+            self._mostrar_estado_direccion(tipo, "✗ No se encontró", "red")
+        else:
+            self._mostrar_estado_direccion(tipo, "✓ Encontrada", "green")
+
+    def _mostrar_estado_direccion(self, tipo, texto, color="black"):
+        """Muestra un aviso breve junto al campo Partida o Destino."""
+        etiqueta = self.label_estado_partida if tipo == "partida" else self.label_estado_destino
+        etiqueta.config(text=texto, fg=color)
+
+    def _registrar_origen(self, tipo, texto, latitud, longitud, origen):
+        """Anota de dónde salieron las coordenadas del campo partida o destino (ver origen_coordenadas)."""
+        if texto and latitud is not None and longitud is not None:
+            self.origen_coordenadas[tipo] = (texto, (latitud, longitud), origen)
+        else:
+            self.origen_coordenadas[tipo] = None
+
+    def _coordenadas_confiables(self, tipo, texto):
+        """
+        Devuelve las coordenadas ya conocidas del campo si su texto no cambió desde
+        que se anotaron (elegidas en el mapa o de la ruta cargada), o None si hay
+        que geocodificarlo.
+        """
+        registro = self.origen_coordenadas.get(tipo)
+        if registro and normalizar_direccion(registro[0]) == normalizar_direccion(texto):
+            return registro[1]
+        return None
+
+    def actualizar_campos(self, direccion, lat, lng, tipo, aviso=""):
         """
         Callback: Actualiza los campos de entrada con la dirección,
         guarda las coordenadas, y calcula/actualiza la distancia.
         Se llama desde MapaDialog.
+
+        Si la geocodificación inversa falló (direccion es None) no se toca el
+        campo ni se anotan las coordenadas: el aviso se muestra junto al campo
+        para que el usuario escriba la dirección.
         """
+        if direccion is None:
+            entrada = self.entry_partida if tipo == "partida" else self.entry_destino
+            self._mostrar_estado_direccion(tipo, f"⚠ {aviso}: escríbala", "orange")
+            entrada.focus_set()
+            return
+        self._mostrar_estado_direccion(tipo, "")  # Borra el aviso de un intento anterior
 
         if tipo == "partida":
             self.entry_partida.delete(0, tk.END)
             self.entry_partida.insert(0, direccion)
             self.latitud_partida = lat
             self.longitud_partida = lng
+            self._registrar_origen("partida", direccion, lat, lng, "mapa")
 
         elif tipo == "destino":
             self.entry_destino.delete(0, tk.END)
             self.entry_destino.insert(0, direccion)
             self.latitud_destino = lat
             self.longitud_destino = lng
+            self._registrar_origen("destino", direccion, lat, lng, "mapa")
 
         # --- Calcular la distancia (si tenemos ambas coordenadas) ---
-        if (
-            self.latitud_partida is not None
-            and self.longitud_partida is not None
-            and self.latitud_destino is not None
-            and self.longitud_destino is not None
-        ):
-            distancia = self.calcular_distancia(
-                self.latitud_partida, self.longitud_partida, self.latitud_destino, self.longitud_destino
-            )
+        # Solo con coordenadas vigentes de los dos campos: las de un campo que se
+        # limpió o se reescribió a mano ya no corresponden.
+        coordenadas_partida = self._coordenadas_confiables("partida", self.entry_partida.get())
+        coordenadas_destino = self._coordenadas_confiables("destino", self.entry_destino.get())
+        if coordenadas_partida and coordenadas_destino:
+            # Vista previa con el modelo rápido; al guardar se recalcula con el exacto.
+            # Por calles no hay aproximación rápida, pero la búsqueda en el grafo toma milisegundos.
+            modelo = "calles" if MODELO_DISTANCIA == "calles" else MODELO_DISTANCIA_PREVIA
+            resultado = self.calcular_distancia(*coordenadas_partida, *coordenadas_destino, modelo=modelo,
+                                                con_geometria=True)
+            distancia, geometria = resultado if resultado is not None else (None, None)
+            if self.mapa_dialog is not None:
+                self.mapa_dialog.mostrar_trayecto(geometria)
             if distancia is not None:
                 distancia = round(distancia, 2)  # <--- Redondeo
                 self.entry_distancia.delete(0, tk.END)
                 self.entry_distancia.insert(0, str(distancia))  # <--- Usar str, no f-string
-        #Se movió la función de guardar datos aquí, para que cada vez que se actualicen los campos
-        #Desde el mapa, se guarden los cambios.
-        self.guardar_datos()
+                self.distancia_previa = str(distancia)
+        # No se guarda aquí: elegir un punto en el mapa solo cambia los campos de
+        # entrada, no las rutas almacenadas.
 
 
 
@@ -1217,20 +2022,42 @@ class MapaDialog(tk.Toplevel):
     def __init__(self, aplicacion, parent, tipo):
         super().__init__(parent)
         self.title("Seleccionar Ubicación")
-        self.geometry("600x450")
+        self.geometry("600x470")
         self.tipo = tipo  # "partida" o "destino"
         self.lat = None
         self.lon = None
         self.aplicacion = aplicacion  # Referencia a la clase Aplicacion
+        # Geocodificación inversa del último clic, iniciada apenas se coloca el marcador
+        self.futuro_direccion = None
+        self.confirmacion_pendiente = False
 
         self.map_widget = tkintermapview.TkinterMapView(self, width=600, height=400)
         self.map_widget.pack()
-        # self.map_widget.set_position(-23.65, -70.4)  <- ELIMINAR ESTA LÍNEA
-        # self.map_widget.set_zoom(12)                   <- ELIMINAR ESTA LÍNEA
+        # self.map_widget.set_position(-23.65, -70.4)  <- ELIMINAR ESTA LÍNEA
+        # self.map_widget.set_zoom(12)                   <- ELIMINAR ESTA LÍNEA
         self.map_widget.add_left_click_map_command(self.obtener_coordenadas)
 
-        btn_confirmar = tk.Button(self, text="Confirmar", command=self.confirmar)
-        btn_confirmar.pack(pady=10)
+        self.label_direccion = tk.Label(self, text="Haga clic en el mapa para elegir el punto.", font=("Arial", 9, "italic"))
+        self.label_direccion.pack(pady=(5, 0))
+        self.btn_confirmar = tk.Button(self, text="Confirmar", command=self.confirmar)
+        self.btn_confirmar.pack(pady=5)
+
+    def reiniciar_seleccion(self):
+        """Descarta el punto elegido antes (al reabrir el diálogo)."""
+        if self.futuro_direccion is not None:
+            self.futuro_direccion.cancel()
+        self.futuro_direccion = None
+        self.confirmacion_pendiente = False
+        self.lat = None
+        self.lon = None
+        self.btn_confirmar.config(state="normal")
+        self.label_direccion.config(text="Haga clic en el mapa para elegir el punto.")
+
+    def mostrar_trayecto(self, geometria):
+        """Dibuja el trayecto por calles entre partida y destino (o lo borra si es None)."""
+        self.map_widget.delete_all_path()
+        if geometria and len(geometria) > 1:
+            self.map_widget.set_path(geometria)
 
     def obtener_coordenadas(self, coordenadas):
         self.lat, self.lon = coordenadas
@@ -1241,22 +2068,62 @@ class MapaDialog(tk.Toplevel):
             for marker in marcadores[:-1]:
                 marker.delete()
 
+        # Buscar la dirección ya, en segundo plano: al confirmar normalmente ya está lista.
+        # Un clic nuevo reemplaza al anterior (si aún no empezó, se cancela).
+        if self.futuro_direccion is not None:
+            self.futuro_direccion.cancel()
+        self.futuro_direccion = self.aplicacion.geocodificador.ejecutor.submit(
+            self.aplicacion.obtener_direccion, self.lat, self.lon)
+        self.label_direccion.config(text="Buscando dirección...")
+        self._revisar_direccion(self.futuro_direccion)
+
+    def _revisar_direccion(self, futuro):
+        """Espera (sin bloquear) la dirección del clic; descarta la de clics ya reemplazados."""
+        if futuro is not self.futuro_direccion:
+            return
+        if not futuro.done():
+            self.after(100, self._revisar_direccion, futuro)
+            return
+        direccion, aviso = self._direccion_obtenida(futuro)
+        self.label_direccion.config(text=direccion or aviso)
+        if self.confirmacion_pendiente:
+            self._terminar_confirmacion()
+
+    def _direccion_obtenida(self, futuro):
+        """
+        Devuelve la dirección de un futuro ya terminado.
+
+        Returns:
+            tuple: (dirección, aviso).  Si falló, la dirección es None y el aviso dice por qué.
+        """
+        if futuro.cancelled() or futuro.exception() is not None:
+            return None, "Error al obtener dirección"
+        if futuro.result() is None:
+            return None, "Dirección no encontrada"
+        return futuro.result(), ""
 
     def confirmar(self):
         #DEBUG: print(f"DEBUG: confirmar en MapaDialog se ejecutó, tipo: {self.tipo}")
-        geolocalizador = Nominatim(user_agent="aplicacion_rutas")
-        try:
-            direccion = geolocalizador.reverse((self.lat, self.lon), exactly_one=True, language="es")
-            if direccion:
-                direccion_str = direccion.address
-            else:
-                direccion_str = "Dirección no encontrada"
-        except Exception as e:
-            print(f"Error al obtener la dirección: {e}")
-            direccion_str = "Error al obtener la dirección"
+        if self.lat is None or self.lon is None:
+            self.label_direccion.config(text="Primero haga clic en el mapa.")
+            return
+        if self.futuro_direccion is not None and self.futuro_direccion.done():
+            self._terminar_confirmacion()
+            return
+        # La dirección todavía no llega: se confirma cuando llegue, sin congelar el diálogo
+        self.confirmacion_pendiente = True
+        self.btn_confirmar.config(state="disabled")
+        self.label_direccion.config(text="Obteniendo dirección...")
+
+    def _terminar_confirmacion(self):
+        """Entrega la dirección y las coordenadas elegidas a la aplicación y oculta el diálogo."""
+        self.confirmacion_pendiente = False
+        self.btn_confirmar.config(state="normal")
+        # Usa la geocodificación inversa de la aplicación (con caché por celda)
+        direccion_str, aviso = self._direccion_obtenida(self.futuro_direccion)
 
         # Llamar a actualizar_campos de la instancia de Aplicacion:
-        self.aplicacion.actualizar_campos(direccion_str, self.lat, self.lon, self.tipo)  # Usar self.aplicacion
+        self.aplicacion.actualizar_campos(direccion_str, self.lat, self.lon, self.tipo, aviso)  # Usar self.aplicacion
         self.withdraw()  # Oculta la ventana en lugar de destruirla
 
 if __name__ == "__main__":
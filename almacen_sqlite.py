@@ -0,0 +1,165 @@
+import sys
+import sqlite3
+import threading
+
+from persistencia import CargadorCSV
+
+# --- Sentencias SQL ---
+# Se usan siempre los mismos textos para que sqlite3 reutilice las sentencias
+# preparadas de su caché (ver cached_statements en AlmacenSQLite).
+SQL_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS rutas (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    nombre_normalizado TEXT NOT NULL,
+    distancia REAL NOT NULL,
+    partida TEXT,
+    destino TEXT,
+    lat_partida REAL,
+    lon_partida REAL,
+    lat_destino REAL,
+    lon_destino REAL,
+    capacidad REAL NOT NULL DEFAULT 0,
+    carga_actual REAL NOT NULL DEFAULT 0,
+    eficiencia REAL
+);
+CREATE INDEX IF NOT EXISTS idx_rutas_nombre ON rutas (nombre_normalizado);
+CREATE INDEX IF NOT EXISTS idx_rutas_distancia ON rutas (distancia);
+CREATE INDEX IF NOT EXISTS idx_rutas_eficiencia ON rutas (eficiencia);
+"""
+
+SQL_INSERTAR = """
+INSERT OR REPLACE INTO rutas (id, nombre, nombre_normalizado, distancia, partida, destino,
+                              lat_partida, lon_partida, lat_destino, lon_destino,
+                              capacidad, carga_actual, eficiencia)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_ELIMINAR = "DELETE FROM rutas WHERE id = ?"
+SQL_OBTENER_TODAS = """
+SELECT id, nombre, distancia, partida, destino, lat_partida, lon_partida, lat_destino, lon_destino,
+       capacidad, carga_actual
+FROM rutas ORDER BY id
+"""
+SQL_BUSCAR_ID = SQL_OBTENER_TODAS.replace("ORDER BY id", "WHERE id = ?")
+SQL_BUSCAR_NOMBRE = SQL_OBTENER_TODAS.replace("ORDER BY id", "WHERE nombre_normalizado = ?")
+SQL_CONTAR = "SELECT COUNT(*) FROM rutas"
+
+
+def normalizar_nombre(nombre):
+    """Normaliza el nombre de una ruta igual que ArbolBinarioBusqueda.buscar_por_nombre."""
+    return nombre.strip().lower()
+
+
+def _parametros(ruta):
+    """Convierte una tupla de ruta (formato de obtener_rutas) en parámetros de SQL_INSERTAR."""
+    id_ruta, nombre, distancia, partida, destino, lat_partida, lon_partida, lat_destino, lon_destino, capacidad, carga_actual = ruta
+    eficiencia = carga_actual / capacidad if capacidad > 0 else None
+    return (id_ruta, nombre, normalizar_nombre(nombre), distancia, partida, destino, lat_partida, lon_partida,
+            lat_destino, lon_destino, capacidad, carga_actual, eficiencia)
+
+
+class AlmacenSQLite:
+    """
+    Almacén de rutas en SQLite (alternativa opcional al CSV).
+
+    Usa modo WAL para permitir lectores concurrentes mientras se escribe, y
+    cada operación de la aplicación se traduce en una sola sentencia por fila
+    en lugar de reescribir el archivo completo.
+    """
+    def __init__(self, ruta_db, cached_statements=64):
+        """
+        Abre (o crea) la base de datos.
+
+        Args:
+            ruta_db (str): Ruta del archivo SQLite.
+            cached_statements (int, optional): Tamaño de la caché de sentencias preparadas.
+        """
+        self.ruta_db = ruta_db
+        # check_same_thread=False: las escrituras llegan desde el hilo de GuardadoDiferido.
+        # El acceso se serializa con self._lock.
+        self.conexion = sqlite3.connect(ruta_db, check_same_thread=False, cached_statements=cached_statements)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conexion.execute("PRAGMA journal_mode=WAL")
+            self.conexion.execute("PRAGMA synchronous=NORMAL")
+            self.conexion.executescript(SQL_ESQUEMA)
+            self.conexion.commit()
+
+    def cerrar(self):
+        """Cierra la conexión."""
+        with self._lock:
+            self.conexion.close()
+
+    def contar(self):
+        """Devuelve la cantidad de rutas almacenadas."""
+        with self._lock:
+            return self.conexion.execute(SQL_CONTAR).fetchone()[0]
+
+    def obtener_rutas(self):
+        """
+        Obtiene todas las rutas ordenadas por ID.
+
+        Returns:
+            list: Tuplas con el mismo formato que ArbolBinarioBusqueda.obtener_rutas().
+        """
+        with self._lock:
+            return self.conexion.execute(SQL_OBTENER_TODAS).fetchall()
+
+    def buscar(self, id_ruta):
+        """Busca una ruta por ID (usa la clave primaria).  Devuelve la tupla o None."""
+        with self._lock:
+            return self.conexion.execute(SQL_BUSCAR_ID, (id_ruta,)).fetchone()
+
+    def buscar_por_nombre(self, nombre):
+        """Busca una ruta por nombre normalizado (usa idx_rutas_nombre).  Devuelve la tupla o None."""
+        with self._lock:
+            return self.conexion.execute(SQL_BUSCAR_NOMBRE, (normalizar_nombre(nombre),)).fetchone()
+
+    def guardar(self, ruta):
+        """Inserta o actualiza una ruta (una sola sentencia)."""
+        self.aplicar_cambios({ruta[0]: ruta})
+
+    def eliminar(self, id_ruta):
+        """Elimina una ruta por ID (una sola sentencia)."""
+        self.aplicar_cambios({id_ruta: None})
+
+    def aplicar_cambios(self, cambios):
+        """
+        Aplica un lote de cambios por fila en una única transacción.
+
+        Args:
+            cambios (dict): id_ruta -> tupla de la ruta (insertar/actualizar) o None (eliminar).
+        """
+        with self._lock, self.conexion:
+            for id_ruta, ruta in cambios.items():
+                if ruta is None:
+                    self.conexion.execute(SQL_ELIMINAR, (id_ruta,))
+                else:
+                    self.conexion.execute(SQL_INSERTAR, _parametros(ruta))
+
+    def migrar_desde_csv(self, ruta_csv):
+        """
+        Importa una sola vez las rutas de un CSV con el formato de rutas_informe.csv.
+
+        Se lee por bloques (ver CargadorCSV), por lo que no carga el archivo
+        completo en memoria.  Las filas con valores inválidos se omiten.
+
+        Returns:
+            int: Cantidad de rutas importadas.
+        """
+        importadas = 0
+        for bloque in CargadorCSV(ruta_csv).bloques():
+            with self._lock, self.conexion:
+                self.conexion.executemany(SQL_INSERTAR, (_parametros(ruta) for ruta in bloque))
+            importadas += len(bloque)
+        return importadas
+
+
+if __name__ == "__main__":
+    # Migración manual: python almacen_sqlite.py rutas_informe.csv rutas.db
+    if len(sys.argv) != 3:
+        print("Uso: python almacen_sqlite.py <archivo.csv> <archivo.db>")
+        sys.exit(1)
+    almacen = AlmacenSQLite(sys.argv[2])
+    print(f"Rutas migradas: {almacen.migrar_desde_csv(sys.argv[1])}")
+    almacen.cerrar()
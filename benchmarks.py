@@ -0,0 +1,331 @@
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+from servidor_geocodificacion import ServidorGeocodificacion
+
+# --- Benchmarks sin red ---
+# Uso: python benchmarks.py [nombre ...]   (sin nombres se corren todos)
+# La geocodificación se hace contra servidor_geocodificacion.py en un puerto
+# local, así que nada sale a Internet y los resultados son repetibles.
+
+
+def medir(funcion, repeticiones):
+    """
+    Ejecuta `funcion` varias veces y devuelve las estadísticas de tiempo.
+
+    Returns:
+        dict: media, p50, p95 y máximo, en milisegundos.
+    """
+    tiempos = []
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(i)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {"media_ms": statistics.fmean(tiempos), "p50_ms": tiempos[len(tiempos) // 2],
+            "p95_ms": tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], "max_ms": tiempos[-1]}
+
+
+def imprimir(nombre, resultado):
+    """Muestra una línea de resultados."""
+    detalle = ", ".join(f"{clave}={valor:.2f}" if isinstance(valor, float) else f"{clave}={valor}"
+                        for clave, valor in resultado.items())
+    print(f"{nombre:<40} {detalle}")
+
+
+def benchmark_agregar_modificar(repeticiones=20, latencia=0.05, tasa_fallas=0.0):
+    """
+    Mide agregar_ruta y modificar_ruta de punta a punta (validación,
+    geocodificación en segundo plano y actualización de la lista).
+
+    Usa la ventana real de Tk (oculta), así que necesita un display (en un
+    servidor sin pantalla, por ejemplo con xvfb-run).  Los diálogos de
+    messagebox se reemplazan por un registro para que no bloqueen.  Al final
+    se comprueba lo guardado (ver verificar_rutas_guardadas).
+    """
+    import tkinter as tk
+    import GestorRutas
+
+    servidor = ServidorGeocodificacion(latencia=latencia, tasa_fallas=tasa_fallas, semilla=1).iniciar()
+    directorio = tempfile.mkdtemp(prefix="benchmark_rutas_")
+    GestorRutas.ARCHIVO_DATOS = os.path.join(directorio, "rutas_informe.csv")
+    GestorRutas.ARCHIVO_RECHAZOS = os.path.join(directorio, "rutas_rechazadas.csv")
+    GestorRutas.ARCHIVO_CACHE_GEO = os.path.join(directorio, "geocache.db")
+    GestorRutas.ARCHIVOS_NOMENCLATOR = os.path.join(directorio, "*.csv")
+    GestorRutas.PROVEEDOR_GEOCODIFICACION = servidor.url
+    dialogos = []
+    for nombre in ("showinfo", "showerror", "showwarning"):
+        setattr(GestorRutas.messagebox, nombre, lambda *args, nombre=nombre, **kwargs: dialogos.append((nombre,) + args))
+
+    root = tk.Tk()
+    root.withdraw()
+    aplicacion = GestorRutas.Aplicacion(root)
+    aplicacion.geocodificador.limitador.tasa = 1000  # El servidor local no tiene límite de uso
+
+    def completar(id_ruta, nombre, partida, destino, distancia=""):
+        aplicacion.entry_id.config(state="normal")
+        campos = [(aplicacion.entry_id, id_ruta), (aplicacion.entry_nombre, nombre),
+                  (aplicacion.entry_partida, partida), (aplicacion.entry_destino, destino),
+                  (aplicacion.entry_capacidad, "100"), (aplicacion.entry_carga_actual, "40"),
+                  (aplicacion.entry_distancia, distancia)]
+        for entrada, valor in campos:
+            entrada.delete(0, tk.END)
+            entrada.insert(0, valor)
+
+    def esperar_trabajos():
+        while aplicacion.trabajos:
+            root.update()
+            time.sleep(0.001)
+
+    def agregar(i, nombre, direcciones):
+        completar("", f"{nombre} {i}", f"Bodega {direcciones} {i}", f"Cliente {direcciones} {i}")
+        aplicacion.agregar_ruta()
+        esperar_trabajos()
+
+    def modificar(i):
+        id_ruta = aplicacion.obtener_siguiente_id() - 1 - (i % repeticiones)
+        nodo = aplicacion.arbol.buscar(id_ruta)
+        completar(str(id_ruta), nodo.nombre, nodo.partida, f"Cliente modificado {i}", str(nodo.distancia))
+        aplicacion.modificar_ruta()
+        esperar_trabajos()
+
+    try:
+        imprimir("agregar_ruta (direcciones nuevas)", medir(lambda i: agregar(i, "Nueva", "A"), repeticiones))
+        # Mismas direcciones con otro nombre: se resuelven sin consultar al servidor
+        imprimir("agregar_ruta (direcciones conocidas)", medir(lambda i: agregar(i, "Repetida", "A"), repeticiones))
+        imprimir("modificar_ruta (destino nuevo)", medir(modificar, repeticiones))
+        errores = [dialogo for dialogo in dialogos if dialogo[0] != "showinfo"]
+        print(f"Consultas al servidor: {servidor.consultas} (fallas simuladas: {servidor.fallas}), "
+              f"diálogos de error: {len(errores)}")
+        aplicacion.guardado.vaciar()
+        rutas = [ruta for ruta in aplicacion.arbol.obtener_rutas() if ruta[1].startswith(("Nueva ", "Repetida "))]
+        discrepancias = verificar_rutas_guardadas(rutas, GestorRutas.MODELO_DISTANCIA)
+        for discrepancia in discrepancias:
+            print(f"  {discrepancia}")
+        print(f"Rutas verificadas: {len(rutas)}, discrepancias: {len(discrepancias)}")
+        if discrepancias or (not tasa_fallas and errores):
+            raise AssertionError("agregar_ruta/modificar_ruta no guardaron lo esperado")
+        print(f"Métricas del servicio: {aplicacion.geocodificador.metricas.resumen()}")
+    finally:
+        aplicacion.cerrar()
+        servidor.detener()
+
+
+def verificar_rutas_guardadas(rutas, modelo="geodesic"):
+    """
+    Comprueba rutas agregadas o modificadas contra servidor_geocodificacion.py:
+    las coordenadas deben ser las sintéticas de cada dirección y la distancia,
+    la del modelo con que se guardan (redondeada a 2 decimales).
+
+    Returns:
+        list: Descripción de cada discrepancia (vacía si todo está bien).
+    """
+    from distancias import distancia_km
+    from servidor_geocodificacion import coordenadas_sinteticas
+
+    discrepancias = []
+    for ruta in rutas:
+        id_ruta, nombre, distancia, partida, destino = ruta[:5]
+        for direccion, coordenadas in ((partida, ruta[5:7]), (destino, ruta[7:9])):
+            esperadas = coordenadas_sinteticas(direccion)
+            if any(abs(a - b) > 1e-9 for a, b in zip(coordenadas, esperadas)):
+                discrepancias.append(f"{id_ruta} {nombre}: coordenadas de '{direccion}' {coordenadas} != {esperadas}")
+        esperada = round(distancia_km(*ruta[5:9], modelo=modelo), 2)
+        if distancia != esperada:
+            discrepancias.append(f"{id_ruta} {nombre}: distancia {distancia} != {esperada}")
+    return discrepancias
+
+
+def benchmark_geocodificacion(repeticiones=50, latencia=0.05):
+    """Mide el servicio de geocodificación solo (sin interfaz) contra el servidor local."""
+    from geocodificacion import ServicioGeocodificacion, crear_proveedor
+
+    servidor = ServidorGeocodificacion(latencia=latencia).iniciar()
+    servicio = ServicioGeocodificacion(tasa=1000, proveedor=crear_proveedor(servidor.url))
+    try:
+        imprimir("geocodificar (una dirección)", medir(lambda i: servicio.geocodificar(f"Calle {i}"), repeticiones))
+        imprimir("geocodificar_varios (partida y destino)",
+                 medir(lambda i: servicio.geocodificar_varios([f"Partida {i}", f"Destino {i}"], 10), repeticiones))
+    finally:
+        servicio.cerrar()
+        servidor.detener()
+
+
+def puntos_antofagasta(cantidad, semilla=0, radio_grados=1.5):
+    """Parejas de puntos aleatorios alrededor de Antofagasta (zona de operación), como arreglos NumPy."""
+    import numpy as np
+
+    azar = np.random.default_rng(semilla)
+    lat1, lat2 = (-23.65 + azar.uniform(-radio_grados, radio_grados, cantidad) for _ in range(2))
+    lon1, lon2 = (-70.40 + azar.uniform(-radio_grados, radio_grados, cantidad) for _ in range(2))
+    return lat1, lon1, lat2, lon2
+
+
+def benchmark_distancias(cantidad=20000):
+    """Compara geodesic pareja por pareja con el cálculo vectorizado de distancias.py."""
+    import numpy as np
+    from geopy.distance import geodesic
+    from distancias import haversine_km, vincenty_km
+
+    lat1, lon1, lat2, lon2 = puntos_antofagasta(cantidad)
+    inicio = time.perf_counter()
+    referencia = np.array([geodesic((a, b), (c, d)).km for a, b, c, d in zip(lat1, lon1, lat2, lon2)])
+    tiempo_geodesic = time.perf_counter() - inicio
+    imprimir(f"geodesic por pareja ({cantidad})", {"total_ms": tiempo_geodesic * 1000})
+    for nombre, funcion in (("vincenty_km", vincenty_km), ("haversine_km", haversine_km)):
+        inicio = time.perf_counter()
+        resultado = funcion(lat1, lon1, lat2, lon2)
+        tiempo = time.perf_counter() - inicio
+        imprimir(f"{nombre} vectorizado ({cantidad})",
+                 {"total_ms": tiempo * 1000, "aceleracion": f"{tiempo_geodesic / tiempo:.0f}x",
+                  "error_max_m": float(np.max(np.abs(resultado - referencia))) * 1000})
+
+
+def benchmark_modelos_distancia(cantidad=20000):
+    """
+    Tiempo por pareja y error máximo frente a geodesic de cada modelo de
+    distancias.MODELOS_DISTANCIA, en Antofagasta y en la región (ver el cuadro de distancias.py).
+    """
+    import numpy as np
+    from distancias import MODELOS_DISTANCIA, distancia_km
+
+    for zona, radio_grados in (("Antofagasta", 0.15), ("región", 1.5)):
+        parejas = list(zip(*(valores.tolist() for valores in puntos_antofagasta(cantidad, radio_grados=radio_grados))))
+        referencia = np.array([distancia_km(*pareja) for pareja in parejas])
+        for modelo in MODELOS_DISTANCIA:
+            inicio = time.perf_counter()
+            resultado = np.array([distancia_km(*pareja, modelo=modelo) for pareja in parejas])
+            tiempo = time.perf_counter() - inicio
+            error = np.abs(resultado - referencia)
+            imprimir(f"{modelo} ({zona})", {"us_por_pareja": tiempo / cantidad * 1e6,
+                                            "error_max_m": float(error.max()) * 1000,
+                                            "error_max_pct": float(np.max(error / np.maximum(referencia, 0.1))) * 100})
+
+
+def benchmark_matriz(origenes=5000, destinos=5000, procesos=None):
+    """Matriz de distancias entre puntos distintos (matriz_distancias.py), por modelo."""
+    import numpy as np
+    from matriz_distancias import construir_matriz
+
+    lat1, lon1, lat2, lon2 = puntos_antofagasta(max(origenes, destinos))
+    puntos_origen = np.column_stack([lat1[:origenes], lon1[:origenes]])
+    puntos_destino = np.column_stack([lat2[:destinos], lon2[:destinos]])
+    for modelo in ("equirectangular", "vincenty"):
+        inicio = time.perf_counter()
+        construir_matriz(puntos_origen, puntos_destino, modelo, procesos=procesos)
+        imprimir(f"matriz {origenes}x{destinos} {modelo}",
+                 {"total_s": time.perf_counter() - inicio, "procesos": procesos or os.cpu_count()})
+
+
+def escribir_osm_sintetico(ruta_archivo, lado=150, cada=3, semilla=0):
+    """
+    Escribe un extracto OSM con una grilla de `lado` x `lado` nodos (~200 m entre
+    nodos, alrededor de Antofagasta) y una calle cada `cada` filas y columnas: los
+    nodos intermedios son puntos de forma, como en los extractos reales.  Una de
+    cada tres calles es de un solo sentido y algunas avenidas están cortadas.
+    Sirve para medir red_vial.py sin descargar un extracto real.
+    """
+    import random
+
+    azar = random.Random(semilla)
+    with open(ruta_archivo, "w", encoding="utf-8") as archivo:
+        archivo.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for i in range(lado):
+            for j in range(lado):
+                archivo.write(f'<node id="{i * lado + j + 1}" lat="{-23.75 + i * 0.0018 + azar.uniform(-2e-4, 2e-4):.7f}" '
+                              f'lon="{-70.45 + j * 0.0018 + azar.uniform(-2e-4, 2e-4):.7f}"/>\n')
+        via = 1
+        for i in range(0, lado, cada):
+            nodos = [i * lado + j + 1 for j in range(lado)]
+            sentido = '<tag k="oneway" v="yes"/>' if i % (3 * cada) == 0 else ""
+            if i % (6 * cada) == 3 * cada:
+                nodos.reverse()
+            archivo.write(f'<way id="{via}">' + "".join(f'<nd ref="{nodo}"/>' for nodo in nodos)
+                          + f'<tag k="highway" v="residential"/>{sentido}</way>\n')
+            via += 1
+        for j in range(0, lado, cada):
+            nodos = [i * lado + j + 1 for i in range(lado) if not (j % (5 * cada) == 2 * cada and lado // 3 <= i < lado // 2)]
+            archivo.write(f'<way id="{via}">' + "".join(f'<nd ref="{nodo}"/>' for nodo in nodos)
+                          + '<tag k="highway" v="primary"/></way>\n')
+            via += 1
+        archivo.write("</osm>\n")
+
+
+def benchmark_red_vial(lado=150, consultas=200):
+    """
+    Lectura del extracto, carga del grafo guardado, preproceso de la jerarquía
+    de contracción y caminos más cortos con y sin ella (red_vial.py).
+    """
+    import random
+    from red_vial import RedVial, cargar_red_vial
+    from jerarquia_contraccion import JerarquiaContraccion
+
+    directorio = tempfile.mkdtemp(prefix="benchmark_red_")
+    extracto = os.path.join(directorio, "grilla.osm")
+    escribir_osm_sintetico(extracto, lado)
+    inicio = time.perf_counter()
+    red = cargar_red_vial(extracto)
+    imprimir(f"leer OSM ({len(red)} nodos, {red.cantidad_arcos} arcos)", {"total_ms": (time.perf_counter() - inicio) * 1000})
+    imprimir("cargar grafo guardado (.npz)", medir(lambda i: RedVial.cargar(extracto + ".red.npz"), 5))
+    inicio = time.perf_counter()
+    jerarquia = JerarquiaContraccion.construir(red.indptr, red.indices, red.pesos)
+    imprimir(f"preproceso jerarquía ({jerarquia.cantidad_atajos} atajos)", {"total_s": time.perf_counter() - inicio})
+    jerarquia.guardar(extracto + ".ch.npz")
+    imprimir("cargar jerarquía guardada (.npz)",
+             medir(lambda i: JerarquiaContraccion.cargar(extracto + ".ch.npz", len(red)), 5))
+    red.jerarquia = jerarquia
+
+    azar = random.Random(1)
+    parejas = [(azar.randrange(len(red)), azar.randrange(len(red))) for _ in range(consultas)]
+    for metodo in ("astar", "bidireccional", "ch"):
+        imprimir(f"camino más corto ({metodo})",
+                 medir(lambda i: red.camino_mas_corto(*parejas[i], metodo=metodo), consultas))
+    imprimir("solo distancia (ch)", medir(lambda i: jerarquia.distancia(*parejas[i]), consultas))
+
+
+def benchmark_planificador(cantidad=20000, consultas=200):
+    """
+    Armado del grafo de rutas encadenables, altas y bajas de a una y viajes
+    de varias rutas (planificador.py), con rutas repartidas en la ciudad.
+    """
+    from planificador import Planificador
+    from distancias import haversine_km
+
+    lat1, lon1, lat2, lon2 = puntos_antofagasta(cantidad, radio_grados=0.15)
+    distancias = haversine_km(lat1, lon1, lat2, lon2)
+    rutas = [(i, f"Ruta {i}", round(float(distancias[i]), 2), "", "", float(lat1[i]), float(lon1[i]),
+              float(lat2[i]), float(lon2[i]), 100.0, 0.0) for i in range(cantidad)]
+    inicio = time.perf_counter()
+    planificador = Planificador.desde_rutas(rutas)
+    imprimir(f"armar grafo ({cantidad} rutas, {planificador.cantidad_enlaces} enlaces)",
+             {"total_s": time.perf_counter() - inicio})
+    imprimir("quitar y volver a agregar una ruta",
+             medir(lambda i: (planificador.quitar_ruta(i), planificador.agregar_ruta(rutas[i])), consultas))
+    viajes = [(float(lat1[i]), float(lon1[i]), float(lat2[-i - 1]), float(lon2[-i - 1])) for i in range(consultas)]
+    encontrados = sum(planificador.planificar(*viaje) is not None for viaje in viajes)
+    imprimir(f"planificar viaje ({encontrados}/{consultas} con cadena)",
+             medir(lambda i: planificador.planificar(*viajes[i]), consultas))
+
+
+BENCHMARKS = {
+    "geocodificacion": benchmark_geocodificacion,
+    "agregar_modificar": benchmark_agregar_modificar,
+    "distancias": benchmark_distancias,
+    "modelos_distancia": benchmark_modelos_distancia,
+    "matriz": benchmark_matriz,
+    "red_vial": benchmark_red_vial,
+    "planificador": benchmark_planificador,
+}
+
+
+if __name__ == "__main__":
+    nombres = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in nombres:
+        if nombre not in BENCHMARKS:
+            print(f"Benchmark desconocido: {nombre}.  Disponibles: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        print(f"--- {nombre} ---")
+        BENCHMARKS[nombre]()
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import mmap
+
+import numpy as np
+
+from persistencia import CargadorCSV
+
+# --- Formato columnar ---
+# Un directorio con un archivo por columna:
+#   <columna>.bin        arreglo contiguo little-endian (int64 o float64)
+#   <texto>.off / .heap  offsets (uint64, n+1 valores) y bytes UTF-8 concatenados
+#   meta.json            cantidad de filas y tipos; se escribe al final, por lo
+#                        que su presencia indica que el archivo está completo.
+VERSION_FORMATO = 1
+COLUMNAS_NUMERICAS = [("id", "<i8"), ("distancia", "<f8"), ("lat_partida", "<f8"), ("lon_partida", "<f8"),
+                      ("lat_destino", "<f8"), ("lon_destino", "<f8"), ("capacidad", "<f8"), ("carga_actual", "<f8")]
+COLUMNAS_TEXTO = ["nombre", "partida", "destino"]
+# Posición de cada columna en las tuplas de ArbolBinarioBusqueda.obtener_rutas()
+POSICION = {"id": 0, "nombre": 1, "distancia": 2, "partida": 3, "destino": 4, "lat_partida": 5, "lon_partida": 6,
+            "lat_destino": 7, "lon_destino": 8, "capacidad": 9, "carga_actual": 10}
+
+
+def escribir_columnar(directorio, bloques):
+    """
+    Escribe rutas en formato columnar.
+
+    Recibe las rutas por bloques (por ejemplo CargadorCSV.bloques()), así que
+    se pueden convertir archivos más grandes que la memoria.
+
+    Args:
+        directorio (str): Directorio de salida (se crea si no existe).
+        bloques (iterable): Listas de tuplas de rutas (formato de obtener_rutas).
+
+    Returns:
+        int: Cantidad de filas escritas.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    meta = os.path.join(directorio, "meta.json")
+    if os.path.exists(meta):
+        os.remove(meta)  # El archivo queda incompleto hasta terminar de escribir
+
+    archivos = {}
+    try:
+        for nombre, _ in COLUMNAS_NUMERICAS:
+            archivos[nombre] = open(os.path.join(directorio, f"{nombre}.bin"), "wb")
+        fin_heap = {}
+        for nombre in COLUMNAS_TEXTO:
+            archivos[nombre + ".off"] = open(os.path.join(directorio, f"{nombre}.off"), "wb")
+            archivos[nombre + ".heap"] = open(os.path.join(directorio, f"{nombre}.heap"), "wb")
+            np.zeros(1, dtype="<u8").tofile(archivos[nombre + ".off"])
+            fin_heap[nombre] = 0
+
+        filas = 0
+        for bloque in bloques:
+            if not bloque:
+                continue
+            columnas = list(zip(*bloque))
+            for nombre, tipo in COLUMNAS_NUMERICAS:
+                np.asarray(columnas[POSICION[nombre]], dtype=tipo).tofile(archivos[nombre])
+            for nombre in COLUMNAS_TEXTO:
+                codificados = [(texto or "").encode("utf-8") for texto in columnas[POSICION[nombre]]]
+                largos = np.fromiter((len(c) for c in codificados), dtype="<u8", count=len(codificados))
+                offsets = fin_heap[nombre] + np.cumsum(largos, dtype="<u8")
+                offsets.tofile(archivos[nombre + ".off"])
+                archivos[nombre + ".heap"].write(b"".join(codificados))
+                fin_heap[nombre] = int(offsets[-1])
+            filas += len(bloque)
+    finally:
+        for archivo in archivos.values():
+            archivo.close()
+
+    with open(meta, "w", encoding="utf-8") as f:
+        json.dump({"version": VERSION_FORMATO, "filas": filas, "columnas": dict(COLUMNAS_NUMERICAS),
+                   "textos": COLUMNAS_TEXTO}, f)
+    return filas
+
+
+class ArchivoColumnar:
+    """
+    Acceso de solo lectura a un archivo columnar mediante mmap.
+
+    Las columnas numéricas se exponen como vistas NumPy sobre el archivo
+    mapeado: no se copian datos ni se crean objetos Nodo, y abrir el archivo
+    es instantáneo sin importar cuántas rutas tenga (el sistema operativo
+    carga las páginas a medida que se usan).
+    """
+    def __init__(self, directorio):
+        """
+        Args:
+            directorio (str): Directorio creado con escribir_columnar().
+
+        Raises:
+            ValueError: Si el archivo está incompleto o es de otra versión.
+        """
+        ruta_meta = os.path.join(directorio, "meta.json")
+        if not os.path.exists(ruta_meta):
+            raise ValueError(f"{directorio} no es un archivo columnar completo.")
+        with open(ruta_meta, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != VERSION_FORMATO:
+            raise ValueError(f"Versión de formato no soportada: {self.meta.get('version')}")
+
+        self.directorio = directorio
+        self.filas = self.meta["filas"]
+        self._mapas = []
+        self.columnas = {nombre: self._mapear(f"{nombre}.bin", tipo)
+                         for nombre, tipo in self.meta["columnas"].items()}
+        self._offsets = {nombre: self._mapear(f"{nombre}.off", "<u8") for nombre in self.meta["textos"]}
+        self._heaps = {nombre: self._mapear(f"{nombre}.heap", "u1") for nombre in self.meta["textos"]}
+
+    def _mapear(self, nombre_archivo, tipo):
+        """Mapea un archivo en memoria y devuelve una vista NumPy de solo lectura."""
+        with open(os.path.join(self.directorio, nombre_archivo), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return np.empty(0, dtype=tipo)  # mmap no admite archivos vacíos
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapas.append(mapa)
+        return np.frombuffer(mapa, dtype=tipo)
+
+    def __len__(self):
+        return self.filas
+
+    def __getitem__(self, nombre):
+        """Devuelve la vista NumPy de una columna numérica (por ejemplo archivo["capacidad"])."""
+        return self.columnas[nombre]
+
+    def texto(self, columna, indice):
+        """Decodifica el texto de la fila indicada en una columna de texto (nombre, partida o destino)."""
+        offsets = self._offsets[columna]
+        return bytes(self._heaps[columna][offsets[indice]:offsets[indice + 1]]).decode("utf-8")
+
+    def eficiencia(self):
+        """Carga actual / capacidad para todas las rutas (NaN si la capacidad no es positiva)."""
+        capacidad = self.columnas["capacidad"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(capacidad > 0, self.columnas["carga_actual"] / capacidad, np.nan)
+
+    def cerrar(self):
+        """Libera los mapas de memoria (no deben quedar vistas en uso)."""
+        self.columnas = {}
+        self._offsets = {}
+        self._heaps = {}
+        for mapa in self._mapas:
+            mapa.close()
+        self._mapas = []
+
+
+if __name__ == "__main__":
+    # Conversión: python columnar.py rutas_informe.csv rutas_columnar
+    if len(sys.argv) != 3:
+        print("Uso: python columnar.py <archivo.csv> <directorio_salida>")
+        sys.exit(1)
+    print(f"Filas escritas: {escribir_columnar(sys.argv[2], CargadorCSV(sys.argv[1]).bloques())}")
@@ -0,0 +1,355 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from geopy.distance import geodesic
+
+# --- Elipsoide WGS-84 (el mismo que usa geopy.distance.geodesic) ---
+SEMIEJE_MAYOR_KM = 6378.137
+ACHATAMIENTO = 1 / 298.257223563
+SEMIEJE_MENOR_KM = SEMIEJE_MAYOR_KM * (1 - ACHATAMIENTO)
+EXCENTRICIDAD2 = ACHATAMIENTO * (2 - ACHATAMIENTO)
+RADIO_MEDIO_KM = 6371.0088  # Radio medio (IUGG), para las fórmulas esféricas
+
+
+def _como_arreglos(*valores):
+    """Convierte las coordenadas a arreglos float64 del mismo tamaño (None pasa a NaN)."""
+    return np.broadcast_arrays(*(np.asarray(valor, dtype=np.float64) for valor in valores))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distancia sobre una esfera de radio medio, vectorizada.
+
+    Args:
+        lat1, lon1, lat2, lon2 (array_like): Coordenadas en grados (escalares o arreglos).
+
+    Returns:
+        numpy.ndarray: Distancias en km (NaN donde falta alguna coordenada).
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(valor) for valor in _como_arreglos(lat1, lon1, lat2, lon2))
+    seno_lat = np.sin((lat2 - lat1) / 2)
+    seno_lon = np.sin((lon2 - lon1) / 2)
+    a = seno_lat ** 2 + np.cos(lat1) * np.cos(lat2) * seno_lon ** 2
+    return 2 * RADIO_MEDIO_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def equirectangular_km(lat1, lon1, lat2, lon2):
+    """
+    Aproximación plana con los radios de curvatura del elipsoide en la latitud media, vectorizada.
+
+    Es la más rápida y, para distancias de decenas de km, casi tan exacta como
+    geodesic (ver el cuadro de errores más abajo).
+
+    Args:
+        lat1, lon1, lat2, lon2 (array_like): Coordenadas en grados (escalares o arreglos).
+
+    Returns:
+        numpy.ndarray: Distancias en km (NaN donde falta alguna coordenada).
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(valor) for valor in _como_arreglos(lat1, lon1, lat2, lon2))
+    latitud_media = (lat1 + lat2) / 2
+    w = 1 - EXCENTRICIDAD2 * np.sin(latitud_media) ** 2
+    radio_meridiano = SEMIEJE_MAYOR_KM * (1 - EXCENTRICIDAD2) / w ** 1.5
+    radio_normal = SEMIEJE_MAYOR_KM / np.sqrt(w)
+    diferencia_lon = (lon2 - lon1 + np.pi) % (2 * np.pi) - np.pi
+    return np.hypot(radio_meridiano * (lat2 - lat1), radio_normal * np.cos(latitud_media) * diferencia_lon)
+
+
+def vincenty_km(lat1, lon1, lat2, lon2, tolerancia=1e-12, max_iteraciones=200):
+    """
+    Distancia sobre el elipsoide WGS-84 (fórmula inversa de Vincenty), vectorizada.
+
+    Todas las parejas iteran juntas; cada una deja de cambiar al converger.
+    Las pocas que no convergen (puntos casi antípodas) se calculan con
+    geopy.distance.geodesic (algoritmo de Karney), así que el resultado
+    coincide con geodesic en todos los casos (diferencias de micrómetros).
+
+    Args:
+        lat1, lon1, lat2, lon2 (array_like): Coordenadas en grados.
+        tolerancia (float, optional): Cambio de lambda (radianes) para dar por convergida una pareja.
+        max_iteraciones (int, optional): Máximo de iteraciones.
+
+    Returns:
+        numpy.ndarray: Distancias en km (NaN donde falta alguna coordenada).
+    """
+    grados = _como_arreglos(lat1, lon1, lat2, lon2)
+    forma = grados[0].shape
+    lat1, lon1, lat2, lon2 = (np.radians(valor).ravel() for valor in grados)
+    a, b, f = SEMIEJE_MAYOR_KM, SEMIEJE_MENOR_KM, ACHATAMIENTO
+
+    L = lon2 - lon1
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    validas = np.isfinite(lat1) & np.isfinite(lon1) & np.isfinite(lat2) & np.isfinite(lon2)
+    pendientes = validas.copy()
+    sin_sigma = np.zeros_like(lam)
+    cos_sigma = np.ones_like(lam)
+    sigma = np.zeros_like(lam)
+    cos2_alfa = np.ones_like(lam)
+    cos_2sigma_m = np.zeros_like(lam)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iteraciones):
+            cantidad_pendientes = np.count_nonzero(pendientes)
+            if not cantidad_pendientes:
+                break
+            # Mientras casi todas siguen iterando conviene operar sobre los arreglos
+            # completos (volver a iterar una convergida no la cambia); al final, solo
+            # sobre las pendientes, para no pagar por todas cuando quedan pocas.
+            i = slice(None) if cantidad_pendientes > len(lam) // 4 else pendientes
+            sin_lam, cos_lam = np.sin(lam[i]), np.cos(lam[i])
+            sin_sigma[i] = np.hypot(cosU2[i] * sin_lam, cosU1[i] * sinU2[i] - sinU1[i] * cosU2[i] * cos_lam)
+            cos_sigma[i] = sinU1[i] * sinU2[i] + cosU1[i] * cosU2[i] * cos_lam
+            sigma[i] = np.arctan2(sin_sigma[i], cos_sigma[i])
+            sin_alfa = np.where(sin_sigma[i] == 0, 0.0, cosU1[i] * cosU2[i] * sin_lam / sin_sigma[i])
+            cos2_alfa[i] = 1 - sin_alfa ** 2
+            # En el ecuador cos2_alfa = 0 y el término se anula
+            cos_2sigma_m[i] = np.where(cos2_alfa[i] == 0, 0.0,
+                                       cos_sigma[i] - 2 * sinU1[i] * sinU2[i] / cos2_alfa[i])
+            C = f / 16 * cos2_alfa[i] * (4 + f * (4 - 3 * cos2_alfa[i]))
+            lam_anterior = lam[i].copy()  # Con slice, lam[i] sería una vista
+            lam[i] = L[i] + (1 - C) * f * sin_alfa * (
+                sigma[i] + C * sin_sigma[i] * (cos_2sigma_m[i] + C * cos_sigma[i] * (-1 + 2 * cos_2sigma_m[i] ** 2)))
+            cambio = np.abs(lam[i] - lam_anterior)
+            pendientes[i] &= ~(cambio <= tolerancia)
+
+        u2 = cos2_alfa * (a ** 2 - b ** 2) / b ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distancias = np.where(validas, b * A * (sigma - delta_sigma), np.nan)
+
+    # Las que no convergieron se resuelven una a una con Karney (geopy)
+    for indice in np.flatnonzero(pendientes):
+        distancias[indice] = geodesic((grados[0].flat[indice], grados[1].flat[indice]),
+                                      (grados[2].flat[indice], grados[3].flat[indice])).km
+    return distancias.reshape(forma)
+
+
+# --- Una sola pareja de puntos ---
+# Las mismas fórmulas con math (NumPy tiene un costo fijo alto para un solo valor).
+# Error máximo frente a geodesic, medido con benchmarks.py (modelos_distancia)
+# sobre 20.000 parejas al azar:
+#
+#   modelo            Antofagasta (±0,15°, hasta ~40 km)   región (±1,5°, hasta ~430 km)
+#   equirectangular   0,03 m                                34 m   (0,008 %)
+#   haversine         131 m  (0,40 %)                       1,3 km (0,42 %)
+#   geodesic          exacta (referencia)
+#
+# Haversine usa una esfera y su error es proporcional a la distancia (sobre
+# todo en dirección norte-sur); la equirectangular con los radios del elipsoide
+# solo pierde precisión cuando la distancia crece.  Las dos aproximadas toman
+# unos 2 µs por pareja; geodesic, unos 160 µs.
+
+def _equirectangular(lat1, lon1, lat2, lon2):
+    """Versión escalar de equirectangular_km."""
+    latitud_media = math.radians(lat1 + lat2) / 2
+    w = 1 - EXCENTRICIDAD2 * math.sin(latitud_media) ** 2
+    radio_meridiano = SEMIEJE_MAYOR_KM * (1 - EXCENTRICIDAD2) / w ** 1.5
+    radio_normal = SEMIEJE_MAYOR_KM / math.sqrt(w)
+    diferencia_lon = (math.radians(lon2 - lon1) + math.pi) % (2 * math.pi) - math.pi
+    return math.hypot(radio_meridiano * math.radians(lat2 - lat1), radio_normal * math.cos(latitud_media) * diferencia_lon)
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Versión escalar de haversine_km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_MEDIO_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _geodesic(lat1, lon1, lat2, lon2):
+    """Distancia exacta sobre el elipsoide (geopy, algoritmo de Karney)."""
+    return geodesic((lat1, lon1), (lat2, lon2)).km
+
+
+# Modelos para una pareja, del más rápido al exacto
+MODELOS_DISTANCIA = {"equirectangular": _equirectangular, "haversine": _haversine, "geodesic": _geodesic}
+
+
+def distancia_km(lat1, lon1, lat2, lon2, modelo="geodesic"):
+    """
+    Distancia entre dos puntos con el modelo indicado.
+
+    Args:
+        lat1, lon1, lat2, lon2 (float): Coordenadas en grados.
+        modelo (str, optional): Una clave de MODELOS_DISTANCIA.  "geodesic" es
+            la exacta y la que se guarda; las otras sirven para vistas previas.
+
+    Returns:
+        float: Distancia en km.
+
+    Raises:
+        ValueError: Si el modelo no existe.
+    """
+    try:
+        funcion = MODELOS_DISTANCIA[modelo]
+    except KeyError:
+        raise ValueError(f"Modelo de distancia desconocido: {modelo}") from None
+    return funcion(float(lat1), float(lon1), float(lat2), float(lon2))
+
+
+# Modelos disponibles para calcular distancias en lote
+MODELOS_LOTE = {"equirectangular": equirectangular_km, "haversine": haversine_km, "vincenty": vincenty_km}
+
+
+# Modelo por pareja equivalente a cada modelo en lote (vincenty coincide con geodesic)
+MODELO_EQUIVALENTE = {"equirectangular": "equirectangular", "haversine": "haversine", "vincenty": "geodesic"}
+# Y al revés: modelo en lote para cada modelo por pareja (para recalcular con el mismo que se guarda)
+MODELO_LOTE = {pareja: lote for lote, pareja in MODELO_EQUIVALENTE.items()}
+
+
+class MemoDistancias:
+    """
+    Memoria LRU acotada de distancias ya calculadas.
+
+    La clave es el modelo y la pareja de puntos redondeados a `decimales`
+    (6 decimales son unos 10 cm), ordenada para que A->B y B->A compartan
+    entrada.  Así volver a editar una ruta, la vista previa del mapa, una
+    reimportación o el recálculo en lote no repiten el cálculo geodésico.
+    Se puede usar desde varios hilos.
+    """
+    def __init__(self, max_entradas=50000, decimales=6):
+        """
+        Args:
+            max_entradas (int, optional): Máximo de parejas; se desalojan las menos usadas.
+            decimales (int, optional): Decimales de grado con que se redondean las coordenadas.
+        """
+        self.max_entradas = max_entradas
+        self.decimales = decimales
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojadas = 0
+        self._entradas = OrderedDict()  # (modelo, punto, punto) -> km
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def clave(self, lat1, lon1, lat2, lon2, modelo, simetrica=True):
+        """Clave de una pareja de puntos (simétrica salvo que se indique lo contrario)."""
+        punto1 = (round(float(lat1), self.decimales), round(float(lon1), self.decimales))
+        punto2 = (round(float(lat2), self.decimales), round(float(lon2), self.decimales))
+        return (modelo,) + ((punto1, punto2) if punto1 <= punto2 or not simetrica else (punto2, punto1))
+
+    def _obtener(self, clave):
+        """Busca una clave y la marca como usada (con el lock tomado).  None si no está."""
+        distancia = self._entradas.get(clave)
+        if distancia is None:
+            self.fallos += 1
+            return None
+        self._entradas.move_to_end(clave)
+        self.aciertos += 1
+        return distancia
+
+    def _guardar(self, clave, distancia):
+        """Guarda una distancia y desaloja las menos usadas (con el lock tomado)."""
+        self._entradas[clave] = distancia
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.desalojadas += 1
+
+    def distancia(self, lat1, lon1, lat2, lon2, modelo="geodesic", funcion=None, simetrica=True):
+        """
+        Igual que distancia_km(), pero reutiliza lo ya calculado.
+
+        Args:
+            funcion (callable, optional): Calcula la distancia de un modelo que no está en
+                MODELOS_DISTANCIA (p. ej. por calles); si devuelve None no se guarda.
+            simetrica (bool, optional): False si A->B puede medir distinto que B->A.
+
+        Raises:
+            ValueError: Si el modelo no existe.
+        """
+        clave = self.clave(lat1, lon1, lat2, lon2, modelo, simetrica)
+        with self._lock:
+            distancia = self._obtener(clave)
+        if distancia is None:
+            # Se calcula fuera del lock; dos hilos con la misma pareja darían el mismo valor
+            if funcion is not None:
+                distancia = funcion(lat1, lon1, lat2, lon2)
+            else:
+                distancia = distancia_km(lat1, lon1, lat2, lon2, modelo)
+            if distancia is not None:
+                with self._lock:
+                    self._guardar(clave, distancia)
+        return distancia
+
+    def distancias_lote(self, lat1, lon1, lat2, lon2, modelo="vincenty"):
+        """
+        Igual que MODELOS_LOTE[modelo](...), pero solo calcula (vectorizado) las
+        parejas que no están en memoria.  Las parejas con NaN no se guardan.
+
+        Returns:
+            numpy.ndarray: Distancias en km.
+        """
+        lat1, lon1, lat2, lon2 = (valor.ravel() for valor in _como_arreglos(lat1, lon1, lat2, lon2))
+        modelo_pareja = MODELO_EQUIVALENTE[modelo]
+        distancias = np.full(lat1.shape, np.nan)
+        validas = np.isfinite(lat1) & np.isfinite(lon1) & np.isfinite(lat2) & np.isfinite(lon2)
+        claves = {}
+        with self._lock:
+            for indice in np.flatnonzero(validas):
+                clave = self.clave(lat1[indice], lon1[indice], lat2[indice], lon2[indice], modelo_pareja)
+                distancia = self._obtener(clave)
+                if distancia is None:
+                    claves[indice] = clave
+                else:
+                    distancias[indice] = distancia
+        if claves:
+            faltantes = np.fromiter(claves, dtype=np.intp, count=len(claves))
+            calculadas = MODELOS_LOTE[modelo](lat1[faltantes], lon1[faltantes], lat2[faltantes], lon2[faltantes])
+            distancias[faltantes] = calculadas
+            with self._lock:
+                for indice, distancia in zip(faltantes.tolist(), calculadas.tolist()):
+                    self._guardar(claves[indice], distancia)
+        return distancias
+
+    def estadisticas(self):
+        """Devuelve un dict con el tamaño y los contadores de aciertos, fallos y desalojadas."""
+        consultas = self.aciertos + self.fallos
+        return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos,
+                "desalojadas": self.desalojadas, "tasa_aciertos": self.aciertos / consultas if consultas else 0.0}
+
+
+def coordenadas_rutas(rutas):
+    """
+    Extrae las coordenadas de una lista de rutas como arreglos NumPy.
+
+    Args:
+        rutas (list): Tuplas en el formato de ArbolBinarioBusqueda.obtener_rutas().
+
+    Returns:
+        tuple: (lat_partida, lon_partida, lat_destino, lon_destino), arreglos float64
+        con NaN donde falta la coordenada.
+    """
+    if not rutas:
+        return tuple(np.empty(0) for _ in range(4))
+    columnas = np.array([ruta[5:9] for ruta in rutas], dtype=np.float64)  # None -> NaN
+    return columnas[:, 0], columnas[:, 1], columnas[:, 2], columnas[:, 3]
+
+
+def distancias_rutas(rutas, modelo="vincenty", memo=None):
+    """
+    Calcula en una sola pasada la distancia de todas las rutas.
+
+    Args:
+        rutas (list): Tuplas en el formato de ArbolBinarioBusqueda.obtener_rutas().
+        modelo (str, optional): "vincenty" (elipsoidal, igual a geodesic), "haversine"
+            (esférico) o "equirectangular" (plana; ver el cuadro de errores).
+        memo (MemoDistancias, optional): Memoria compartida; solo se calculan las parejas nuevas.
+
+    Returns:
+        numpy.ndarray: Distancia en km de cada ruta, en el mismo orden (NaN si le faltan coordenadas).
+    """
+    if memo is not None:
+        return memo.distancias_lote(*coordenadas_rutas(rutas), modelo=modelo)
+    return MODELOS_LOTE[modelo](*coordenadas_rutas(rutas))
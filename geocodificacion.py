@@ -0,0 +1,795 @@
+import os
+import re
+import json
+import time
+import random
+import sqlite3
+import threading
+import unicodedata
+import functools
+from abc import ABC, abstractmethod
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from geopy.geocoders import Nominatim
+from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderQueryError
+from persistencia import GuardadoDiferido
+
+try:
+    from geopy.adapters import RequestsAdapter
+except ImportError:  # geopy sin requests: se usa el adaptador por defecto (sin pool de conexiones)
+    RequestsAdapter = None
+
+# Un solo user agent para toda la aplicación (política de uso de Nominatim)
+USER_AGENT = "gestor_rutas_app"
+# Resultado de ServicioGeocodificacion.buscar_en_cache cuando no se sabe nada de
+# la dirección (None significa que se sabe que no existe: caché negativa).
+DESCONOCIDA = object()
+
+
+def normalizar_direccion(texto):
+    """
+    Normaliza una dirección para usarla como clave de caché.
+
+    Quita tildes, pasa a minúsculas y unifica espacios y signos de puntuación,
+    de modo que "Mall Plaza  Antofagasta" y "mall plaza antofagasta." den la
+    misma clave.
+    """
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r"[^\w,]+", " ", texto)
+    texto = re.sub(r"\s*,\s*", ", ", texto)
+    return re.sub(r"\s+", " ", texto).strip(" ,")
+
+
+_BASE32_GEOHASH = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def codificar_geohash(latitud, longitud, precision=8):
+    """
+    Codifica un punto como geohash.
+
+    Puntos cercanos comparten prefijo; con precision=8 cada celda mide
+    aproximadamente 38 m x 19 m, con 7 unos 153 m x 153 m.
+
+    Args:
+        latitud (float): Latitud en grados.
+        longitud (float): Longitud en grados.
+        precision (int, optional): Cantidad de caracteres del geohash.
+
+    Returns:
+        str: El geohash.
+    """
+    rango_lat = [-90.0, 90.0]
+    rango_lon = [-180.0, 180.0]
+    caracteres = []
+    bits = 0
+    valor = 0
+    es_longitud = True  # Los bits se intercalan empezando por la longitud
+    while len(caracteres) < precision:
+        rango, coordenada = (rango_lon, longitud) if es_longitud else (rango_lat, latitud)
+        medio = (rango[0] + rango[1]) / 2
+        if coordenada >= medio:
+            valor = (valor << 1) | 1
+            rango[0] = medio
+        else:
+            valor <<= 1
+            rango[1] = medio
+        es_longitud = not es_longitud
+        bits += 1
+        if bits == 5:
+            caracteres.append(_BASE32_GEOHASH[valor])
+            bits = 0
+            valor = 0
+    return "".join(caracteres)
+
+
+class CachePersistente:
+    """
+    Caché clave -> valor en disco (SQLite) con desalojo LRU y vencimiento por entrada.
+
+    Las consultas se resuelven en memoria (un OrderedDict en orden de uso), así
+    que un acierto cuesta microsegundos.  Las escrituras en disco las hace un
+    GuardadoDiferido en segundo plano, agrupando los cambios.
+    """
+    def __init__(self, ruta_db, tabla, max_entradas=10000, ttl=30 * 24 * 3600, espera_guardado=2.0):
+        """
+        Abre (o crea) la caché y carga en memoria las entradas vigentes.
+
+        Args:
+            ruta_db (str): Archivo SQLite donde se guarda la caché.
+            tabla (str): Nombre de la tabla (permite varias cachés en un mismo archivo).
+            max_entradas (int, optional): Máximo de entradas; se desalojan las menos usadas.
+            ttl (float, optional): Vigencia por defecto de cada entrada, en segundos.
+            espera_guardado (float, optional): Segundos de calma antes de escribir en disco.
+        """
+        if not tabla.isidentifier():
+            raise ValueError(f"Nombre de tabla inválido: {tabla}")
+        self.tabla = tabla
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self.vencidas = 0
+        self.desalojadas = 0
+        self._entradas = OrderedDict()  # clave -> (valor, expira, ultimo_acceso)
+        self._lock = threading.Lock()
+
+        self.conexion = sqlite3.connect(ruta_db, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute(f"CREATE TABLE IF NOT EXISTS {tabla} (clave TEXT PRIMARY KEY, valor TEXT, "
+                              f"expira REAL, ultimo_acceso REAL)")
+        self.conexion.commit()
+        ahora = time.time()
+        filas = self.conexion.execute(f"SELECT clave, valor, expira, ultimo_acceso FROM {tabla} WHERE expira > ? "
+                                      f"ORDER BY ultimo_acceso DESC LIMIT ?", (ahora, max_entradas)).fetchall()
+        for clave, valor, expira, ultimo_acceso in reversed(filas):
+            self._entradas[clave] = (json.loads(valor), expira, ultimo_acceso)
+
+        self._guardado = GuardadoDiferido(self._escribir, espera_guardado, acumulativo=True)
+        # Borrar en disco lo vencido o lo que quedó fuera del límite
+        self._guardado.marcar_sucio({None: None})
+
+    def obtener(self, clave, predeterminado=None):
+        """
+        Busca una clave.
+
+        Returns:
+            El valor guardado, o `predeterminado` si no está o ya venció.
+        """
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return predeterminado
+            valor, expira, _ = entrada
+            if expira <= ahora:
+                del self._entradas[clave]
+                self.vencidas += 1
+                self.fallos += 1
+                self._guardado.marcar_sucio({clave: None})
+                return predeterminado
+            self._entradas[clave] = (valor, expira, ahora)
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            self._guardado.marcar_sucio({clave: self._entradas[clave]})
+            return valor
+
+    def guardar(self, clave, valor, ttl=None):
+        """
+        Guarda un valor (debe poder serializarse como JSON).
+
+        Args:
+            clave (str): Clave de la entrada.
+            valor: Valor a guardar.
+            ttl (float, optional): Vigencia de esta entrada; por defecto la de la caché.
+        """
+        ahora = time.time()
+        with self._lock:
+            entrada = (valor, ahora + (self.ttl if ttl is None else ttl), ahora)
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            cambios = {clave: entrada}
+            while len(self._entradas) > self.max_entradas:
+                desalojada, _ = self._entradas.popitem(last=False)
+                cambios[desalojada] = None
+                self.desalojadas += 1
+            self._guardado.marcar_sucio(cambios)
+
+    def eliminar(self, clave):
+        """Quita una entrada de la caché."""
+        with self._lock:
+            if self._entradas.pop(clave, None) is not None:
+                self._guardado.marcar_sucio({clave: None})
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def estadisticas(self):
+        """Devuelve un dict con el tamaño y los contadores de aciertos, fallos, vencidas y desalojadas."""
+        consultas = self.aciertos + self.fallos
+        return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos,
+                "vencidas": self.vencidas, "desalojadas": self.desalojadas,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0}
+
+    def cerrar(self):
+        """Escribe los cambios pendientes y cierra la base de datos."""
+        self._guardado.detener()
+        self.conexion.close()
+
+    def _escribir(self, cambios):
+        """Aplica en SQLite los cambios acumulados (clave -> entrada, o None para borrar)."""
+        borrar_sobrantes = cambios.pop(None, False) is None
+        with self.conexion:
+            self.conexion.executemany(f"DELETE FROM {self.tabla} WHERE clave = ?",
+                                      [(clave,) for clave, entrada in cambios.items() if entrada is None])
+            self.conexion.executemany(f"INSERT OR REPLACE INTO {self.tabla} VALUES (?, ?, ?, ?)",
+                                      [(clave, json.dumps(entrada[0]), entrada[1], entrada[2])
+                                       for clave, entrada in cambios.items() if entrada is not None])
+            if borrar_sobrantes:
+                self.conexion.execute(f"DELETE FROM {self.tabla} WHERE expira <= ?", (time.time(),))
+                self.conexion.execute(f"DELETE FROM {self.tabla} WHERE clave NOT IN (SELECT clave FROM {self.tabla} "
+                                      f"ORDER BY ultimo_acceso DESC LIMIT ?)", (self.max_entradas,))
+
+
+class CacheInversa:
+    """
+    Caché de geocodificación inversa: (lat, lon) -> dirección.
+
+    Las coordenadas se cuantizan a una celda geohash, así que dos clics a pocos
+    metros dentro de la misma celda comparten la dirección guardada.
+    """
+    def __init__(self, cache, precision=8):
+        """
+        Args:
+            cache (CachePersistente): Caché donde se guardan las direcciones (su ttl
+                define cuándo una dirección se considera desactualizada).
+            precision (int, optional): Caracteres de geohash (tamaño de la celda).
+        """
+        self.cache = cache
+        self.precision = precision
+
+    def clave(self, latitud, longitud):
+        """Devuelve la clave (celda geohash) de un punto."""
+        return codificar_geohash(latitud, longitud, self.precision)
+
+    def obtener(self, latitud, longitud):
+        """Devuelve la dirección guardada para la celda del punto, o None."""
+        return self.cache.obtener(self.clave(latitud, longitud))
+
+    def guardar(self, latitud, longitud, direccion):
+        """Guarda la dirección para la celda del punto."""
+        self.cache.guardar(self.clave(latitud, longitud), direccion)
+
+    def cerrar(self):
+        """Cierra la caché subyacente."""
+        self.cache.cerrar()
+
+
+class LimitadorTokens:
+    """
+    Limitador de tasa tipo "token bucket", compartido entre hilos.
+
+    Se reponen `tasa` fichas por segundo hasta un máximo de `capacidad`; cada
+    consulta consume una ficha y, si no hay, espera a que se reponga.
+    """
+    def __init__(self, tasa=1.0, capacidad=1):
+        """
+        Args:
+            tasa (float, optional): Fichas por segundo (Nominatim pide como máximo 1 consulta/s).
+            capacidad (int, optional): Ráfaga máxima permitida.
+        """
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._fichas = float(capacidad)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self, timeout=None):
+        """
+        Consume una ficha, esperando si hace falta.
+
+        Returns:
+            bool: True si se obtuvo la ficha, False si se agotó el timeout.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultima) * self.tasa)
+                self._ultima = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                espera = (1 - self._fichas) / self.tasa
+            if limite is not None:
+                if ahora + espera > limite:
+                    return False
+            time.sleep(espera)
+
+
+class GeocodificacionEnPausa(GeocoderUnavailable):
+    """El cortocircuito está abierto: no se consulta al proveedor hasta que pase la pausa."""
+    def __init__(self, restante):
+        super().__init__(f"Geocodificación en pausa por fallas repetidas ({restante:.0f} s restantes).")
+        self.restante = restante
+
+
+class Cortocircuito:
+    """
+    Cortocircuito (circuit breaker) para un servicio externo.
+
+    Tras `max_fallas` fallas seguidas se abre: durante `pausa` segundos las
+    consultas fallan de inmediato en lugar de esperar el timeout de cada una.
+    Pasada la pausa se deja pasar una sola consulta de prueba; si funciona se
+    cierra, y si falla se vuelve a abrir.
+    """
+    def __init__(self, max_fallas=3, pausa=60.0):
+        self.max_fallas = max_fallas
+        self.pausa = pausa
+        self.fallas_seguidas = 0
+        self.aperturas = 0
+        self._abierto_hasta = None  # None: cerrado
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """
+        Indica si se puede consultar ahora.
+
+        Raises:
+            GeocodificacionEnPausa: Si está abierto (con los segundos que faltan).
+        """
+        with self._lock:
+            if self._abierto_hasta is None:
+                return True
+            restante = self._abierto_hasta - time.monotonic()
+            if restante > 0 or self._prueba_en_curso:
+                raise GeocodificacionEnPausa(max(restante, 0))
+            self._prueba_en_curso = True  # Semiabierto: una sola consulta de prueba
+            return True
+
+    def registrar_exito(self):
+        """Cierra el cortocircuito y reinicia el conteo de fallas."""
+        with self._lock:
+            self.fallas_seguidas = 0
+            self._abierto_hasta = None
+            self._prueba_en_curso = False
+
+    def registrar_falla(self):
+        """Cuenta una falla; al llegar al máximo (o si falló la prueba) abre el cortocircuito."""
+        with self._lock:
+            self.fallas_seguidas += 1
+            if self._prueba_en_curso or self.fallas_seguidas >= self.max_fallas:
+                self._abierto_hasta = time.monotonic() + self.pausa
+                self._prueba_en_curso = False
+                self.aperturas += 1
+
+    @property
+    def abierto(self):
+        with self._lock:
+            return self._abierto_hasta is not None and self._abierto_hasta > time.monotonic()
+
+
+class MetricasGeocodificacion:
+    """Contadores de consultas, errores y latencias (de las consultas a la red)."""
+    def __init__(self, muestras=500):
+        self.consultas = Counter()  # operación -> consultas a la red
+        self.errores = Counter()    # nombre de la excepción -> cantidad
+        self.latencias = deque(maxlen=muestras)  # Últimas latencias, en segundos
+        self._lock = threading.Lock()
+
+    def registrar(self, operacion, latencia, error=None):
+        """Registra una consulta a la red."""
+        with self._lock:
+            self.consultas[operacion] += 1
+            self.latencias.append(latencia)
+            if error is not None:
+                self.errores[type(error).__name__] += 1
+
+    def resumen(self):
+        """Devuelve un dict con consultas, errores y latencias (p50, p95 y máxima, en ms)."""
+        with self._lock:
+            latencias = sorted(self.latencias)
+            resumen = {"consultas": dict(self.consultas), "errores": dict(self.errores)}
+        if latencias:
+            resumen["latencia_p50_ms"] = latencias[len(latencias) // 2] * 1000
+            resumen["latencia_p95_ms"] = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))] * 1000
+            resumen["latencia_max_ms"] = latencias[-1] * 1000
+        return resumen
+
+
+class ProveedorGeocodificacion(ABC):
+    """
+    Interfaz de los backends de geocodificación que usa ServicioGeocodificacion.
+
+    Un proveedor solo sabe resolver una consulta; la caché, el limitador de
+    tasa, las métricas y la concurrencia quedan en el servicio.  Ante fallas
+    del servicio externo se propagan las excepciones de geopy
+    (GeocoderTimedOut, GeocoderUnavailable, ...).
+    """
+    nombre = "base"
+    remoto = True  # Si es False, el servicio no aplica el limitador de tasa
+
+    @abstractmethod
+    def geocodificar(self, direccion):
+        """Devuelve (latitud, longitud) de la dirección, o None si no existe."""
+
+    @abstractmethod
+    def direccion(self, latitud, longitud):
+        """Devuelve la dirección de un punto, o None si no se encontró."""
+
+
+class ProveedorNominatim(ProveedorGeocodificacion):
+    """
+    Nominatim mediante geopy, con pool de conexiones keep-alive.
+
+    Con `dominio` y `esquema` sirve también para cualquier servidor compatible
+    con la API de Nominatim (por ejemplo servidor_geocodificacion.py).
+    """
+    nombre = "nominatim"
+
+    def __init__(self, user_agent=USER_AGENT, timeout=10, conexiones=4, dominio=None, esquema=None):
+        """
+        Args:
+            user_agent (str, optional): User agent enviado al servidor.
+            timeout (float, optional): Timeout de cada consulta, en segundos.
+            conexiones (int, optional): Tamaño del pool de conexiones HTTP.
+            dominio (str, optional): Servidor a usar, p. ej. "127.0.0.1:8088" (por defecto el público).
+            esquema (str, optional): "http" o "https".
+        """
+        fabrica_adaptador = None
+        if RequestsAdapter is not None:
+            fabrica_adaptador = functools.partial(RequestsAdapter, pool_connections=1, pool_maxsize=conexiones)
+        opciones = {"domain": dominio} if dominio else {}
+        self.geolocalizador = Nominatim(user_agent=user_agent, timeout=timeout, scheme=esquema,
+                                        adapter_factory=fabrica_adaptador, **opciones)
+
+    def geocodificar(self, direccion):
+        ubicacion = self.geolocalizador.geocode(direccion)
+        return (ubicacion.latitude, ubicacion.longitude) if ubicacion else None
+
+    def direccion(self, latitud, longitud):
+        ubicacion = self.geolocalizador.reverse((latitud, longitud), exactly_one=True, language="es")
+        return ubicacion.address if ubicacion else None
+
+
+class ProveedorLocal(ProveedorGeocodificacion):
+    """
+    Geocodificación sin red: solo resuelve direcciones del nomenclátor.
+
+    Sirve para trabajar sin conexión (junto con las cachés del servicio) y para
+    pruebas; lo desconocido se informa como no encontrado.
+    """
+    nombre = "local"
+    remoto = False
+
+    def __init__(self, nomenclator, radio_km=0.5):
+        """
+        Args:
+            nomenclator (Nomenclator): Direcciones conocidas.
+            radio_km (float, optional): Distancia máxima para la geocodificación inversa.
+        """
+        self.nomenclator = nomenclator
+        self.radio_km = radio_km
+
+    def geocodificar(self, direccion):
+        return self.nomenclator.buscar(direccion)
+
+    def direccion(self, latitud, longitud):
+        cercana = self.nomenclator.mas_cercana(latitud, longitud, self.radio_km)
+        return cercana[0] if cercana else None
+
+
+def crear_proveedor(configuracion, nomenclator=None, user_agent=USER_AGENT, timeout=10, conexiones=4):
+    """
+    Crea el proveedor indicado por un texto de configuración.
+
+    Args:
+        configuracion (str): "nominatim", "local" o la URL de un servidor
+            compatible con Nominatim (p. ej. "http://127.0.0.1:8088").
+        nomenclator (Nomenclator, optional): Necesario para "local".
+
+    Returns:
+        ProveedorGeocodificacion: El proveedor.
+
+    Raises:
+        ValueError: Si la configuración no es válida.
+    """
+    if configuracion == "nominatim":
+        return ProveedorNominatim(user_agent, timeout, conexiones)
+    if configuracion == "local":
+        if nomenclator is None:
+            raise ValueError("El proveedor local necesita un nomenclátor.")
+        return ProveedorLocal(nomenclator)
+    if configuracion.startswith(("http://", "https://")):
+        esquema, dominio = configuracion.rstrip("/").split("://", 1)
+        return ProveedorNominatim(user_agent, timeout, conexiones, dominio, esquema)
+    raise ValueError(f"Proveedor de geocodificación desconocido: {configuracion}")
+
+
+class ServicioGeocodificacion:
+    """
+    Servicio de geocodificación único para toda la aplicación.
+
+    Reúne un solo proveedor (por defecto Nominatim, con pool de conexiones
+    keep-alive), un limitador de tasa compartido, las cachés, el nomenclátor
+    local de direcciones conocidas y las métricas.  Los errores de
+    red (GeocoderTimedOut, GeocoderUnavailable, ...) se propagan para que quien
+    llama decida cómo mostrarlos.
+
+    Las direcciones que el proveedor no encontró se recuerdan un tiempo (caché
+    negativa), y si el proveedor falla varias veces seguidas un cortocircuito
+    hace fallar de inmediato las consultas a la red durante una pausa; mientras
+    tanto solo se resuelve lo que está en el nomenclátor o en la caché.
+    """
+    def __init__(self, cache_coordenadas=None, cache_direcciones=None, timeout=10, tasa=1.0,
+                 user_agent=USER_AGENT, conexiones=4, nomenclator=None, proveedor=None,
+                 ttl_negativo=6 * 3600, max_fallas=3, pausa=60.0):
+        """
+        Args:
+            cache_coordenadas (CachePersistente, optional): Caché dirección normalizada -> (lat, lon).
+            cache_direcciones (CacheInversa, optional): Caché de geocodificación inversa.
+            timeout (float, optional): Timeout de cada consulta, en segundos.
+            tasa (float, optional): Consultas por segundo permitidas.
+            user_agent (str, optional): User agent enviado a Nominatim.
+            conexiones (int, optional): Tamaño del pool de conexiones HTTP.
+            nomenclator (Nomenclator, optional): Direcciones conocidas; se consulta antes que la caché.
+            proveedor (ProveedorGeocodificacion, optional): Backend a usar (por defecto
+                ProveedorNominatim con user_agent, timeout y conexiones).
+            ttl_negativo (float, optional): Cuánto se recuerda que una dirección no existe, en segundos.
+            max_fallas (int, optional): Fallas seguidas que abren el cortocircuito.
+            pausa (float, optional): Segundos que el cortocircuito queda abierto.
+        """
+        if proveedor is None:
+            proveedor = ProveedorNominatim(user_agent, timeout, conexiones)
+        self.proveedor = proveedor
+        self.cache_coordenadas = cache_coordenadas
+        self.cache_direcciones = cache_direcciones
+        self.nomenclator = nomenclator
+        self.ttl_negativo = ttl_negativo
+        self.cortocircuito = Cortocircuito(max_fallas, pausa)
+        self.limitador = LimitadorTokens(tasa)
+        self.metricas = MetricasGeocodificacion()
+        self.ejecutor = ThreadPoolExecutor(max_workers=conexiones, thread_name_prefix="geocodificacion")
+
+    def _consultar(self, operacion, funcion, *args, **kwargs):
+        """
+        Hace una consulta al proveedor respetando el cortocircuito y el limitador,
+        y registrando las métricas.
+
+        Raises:
+            GeocodificacionEnPausa: Si el cortocircuito está abierto (sin esperar el timeout).
+        """
+        self.cortocircuito.permitir()
+        if self.proveedor.remoto:
+            self.limitador.adquirir()
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            self.metricas.registrar(operacion, time.perf_counter() - inicio, e)
+            if isinstance(e, GeocoderQueryError):
+                # El servicio respondió (rechazó la consulta): está funcionando
+                self.cortocircuito.registrar_exito()
+            else:
+                # Falla del servicio o error inesperado (respuesta ilegible, falla del proveedor):
+                # no prueba que el servicio funcione, así que no puede cerrar un cortocircuito
+                # semiabierto.  Se cuenta como falla (ignorarlo dejaría la prueba en curso para siempre).
+                self.cortocircuito.registrar_falla()
+            raise
+        self.metricas.registrar(operacion, time.perf_counter() - inicio)
+        self.cortocircuito.registrar_exito()
+        return resultado
+
+    def geocodificar(self, direccion, cache_negativa=True):
+        """
+        Obtiene las coordenadas de una dirección.
+
+        Args:
+            cache_negativa (bool, optional): Si es False, una dirección no encontrada
+                no se recuerda como inexistente (p. ej. texto a medio escribir).
+
+        Returns:
+            tuple: (latitud, longitud), o None si no se encontró la dirección.
+        """
+        en_cache = self.buscar_en_cache(direccion)
+        if en_cache is not DESCONOCIDA:
+            return en_cache
+        return self.geocodificar_red(direccion, cache_negativa)
+
+    def buscar_en_cache(self, direccion):
+        """
+        Busca la dirección en el nomenclátor y en la caché, sin consultar la red.
+
+        Returns:
+            (lat, lon) si se conoce, None si se sabe que no existe (caché negativa)
+            o DESCONOCIDA si hay que consultar al proveedor.
+        """
+        if self.nomenclator is not None:
+            conocida = self.nomenclator.buscar(direccion)
+            if conocida:
+                return conocida
+        if self.cache_coordenadas is None:
+            return DESCONOCIDA
+        en_cache = self.cache_coordenadas.obtener(normalizar_direccion(direccion), DESCONOCIDA)
+        return en_cache if en_cache is DESCONOCIDA or en_cache is None else tuple(en_cache)
+
+    def geocodificar_red(self, direccion, cache_negativa=True):
+        """Consulta la dirección al proveedor (sin mirar la caché) y guarda el resultado en caché."""
+        coordenadas = self._consultar("geocodificar", self.proveedor.geocodificar, direccion)
+        if not coordenadas:
+            if cache_negativa and self.cache_coordenadas is not None:
+                self.cache_coordenadas.guardar(normalizar_direccion(direccion), None, self.ttl_negativo)
+            return None
+        coordenadas = tuple(coordenadas)
+        if self.cache_coordenadas is not None:
+            self.cache_coordenadas.guardar(normalizar_direccion(direccion), list(coordenadas))
+        return coordenadas
+
+    def geocodificar_varios(self, direcciones, plazo=None):
+        """
+        Geocodifica varias direcciones en paralelo y espera a todas con un plazo común.
+
+        Las que están en caché se resuelven de inmediato; el resto se consulta
+        a la vez en el pool de hilos (el limitador de tasa sigue aplicando).
+
+        Args:
+            direcciones (list): Direcciones a geocodificar.
+            plazo (float, optional): Segundos máximos para el conjunto completo.
+
+        Returns:
+            list: Un resultado por dirección, en el mismo orden: (lat, lon), None
+            si no se encontró, o la excepción que se produjo (GeocoderTimedOut
+            si se agotó el plazo).
+        """
+        resultados = [None] * len(direcciones)
+        futuros = {}
+        for indice, direccion in enumerate(direcciones):
+            en_cache = self.buscar_en_cache(direccion)
+            if en_cache is not DESCONOCIDA:
+                resultados[indice] = en_cache
+            else:
+                futuros[self.ejecutor.submit(self.geocodificar_red, direccion)] = indice
+
+        listos, pendientes = wait(futuros, timeout=plazo)
+        for futuro in listos:
+            error = futuro.exception()
+            resultados[futuros[futuro]] = error if error is not None else futuro.result()
+        for futuro in pendientes:
+            futuro.cancel()
+            resultados[futuros[futuro]] = GeocoderTimedOut(f"Se agotó el plazo de {plazo} s.")
+        return resultados
+
+    def direccion(self, latitud, longitud):
+        """
+        Obtiene la dirección de un punto (geocodificación inversa).
+
+        Returns:
+            str: La dirección, o None si no se encontró.
+        """
+        if self.cache_direcciones is not None:
+            en_cache = self.cache_direcciones.obtener(latitud, longitud)
+            if en_cache:
+                return en_cache
+
+        direccion = self._consultar("inversa", self.proveedor.direccion, latitud, longitud)
+        if not direccion:
+            return None
+        if self.cache_direcciones is not None:
+            self.cache_direcciones.guardar(latitud, longitud, direccion)
+        return direccion
+
+    def cerrar(self):
+        """Detiene el pool de hilos y cierra las cachés (escribe lo pendiente)."""
+        self.ejecutor.shutdown(wait=False, cancel_futures=True)
+        if self.cache_coordenadas is not None:
+            self.cache_coordenadas.cerrar()
+        if self.cache_direcciones is not None:
+            self.cache_direcciones.cerrar()
+
+
+class ColaGeocodificacionMasiva:
+    """
+    Geocodificación de muchas direcciones (importación de planillas sin coordenadas).
+
+    Elimina direcciones repetidas, usa la caché antes que la red y consulta el
+    resto de a una, respetando el limitador del servicio.  Ante
+    GeocoderTimedOut/GeocoderUnavailable reintenta con espera exponencial,
+    pero si el cortocircuito del servicio se abre (GeocodificacionEnPausa) se
+    detiene de inmediato y deja el resto pendiente.  Cada dirección resuelta
+    se anota en un archivo de control (JSON por línea), así una importación
+    interrumpida continúa donde quedó.
+    """
+    def __init__(self, servicio, archivo_control, max_reintentos=5, espera_inicial=1.0, espera_maxima=60.0):
+        """
+        Args:
+            servicio (ServicioGeocodificacion): Servicio a usar (limitador, caché y métricas).
+            archivo_control (str): Archivo de avance para poder reanudar.
+            max_reintentos (int, optional): Reintentos por dirección ante fallas del servicio.
+            espera_inicial (float, optional): Espera antes del primer reintento, en segundos.
+            espera_maxima (float, optional): Tope de la espera entre reintentos.
+        """
+        self.servicio = servicio
+        self.archivo_control = archivo_control
+        self.max_reintentos = max_reintentos
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+
+    def _leer_control(self):
+        """Devuelve las direcciones ya resueltas en una ejecución anterior (clave -> coordenadas o None)."""
+        resueltas = {}
+        if not os.path.exists(self.archivo_control):
+            return resueltas
+        with open(self.archivo_control, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue  # Última línea cortada por una interrupción
+                coordenadas = registro["coordenadas"]
+                resueltas[registro["clave"]] = tuple(coordenadas) if coordenadas else None
+        return resueltas
+
+    def resolver(self, direcciones, progreso=None, cancelar=None):
+        """
+        Geocodifica un lote de direcciones.
+
+        Args:
+            direcciones (iterable): Direcciones (pueden repetirse).
+            progreso (callable, optional): Se llama con (resueltas, total) tras cada dirección.
+            cancelar (threading.Event, optional): Si se activa, se detiene tras la consulta en curso.
+
+        Returns:
+            tuple: (resultados, fallidas).  resultados es un dict dirección
+            normalizada -> (lat, lon) o None si no existe; fallidas es el conjunto
+            de claves que no se pudieron consultar (se reintentan al reanudar);
+            si el servicio quedó en pausa incluye todas las que faltaban.
+        """
+        pendientes = {}
+        for direccion in direcciones:
+            pendientes.setdefault(normalizar_direccion(direccion), direccion)
+        lote = list(pendientes)
+        total = len(lote)
+
+        resultados = self._leer_control()
+        for clave in list(pendientes):
+            if clave in resultados:
+                del pendientes[clave]
+                continue
+            en_cache = self.servicio.buscar_en_cache(pendientes[clave])
+            if en_cache is not DESCONOCIDA:
+                resultados[clave] = en_cache
+                del pendientes[clave]
+
+        fallidas = set()
+        with open(self.archivo_control, "a", encoding="utf-8") as control:
+            for clave, direccion in pendientes.items():
+                if cancelar is not None and cancelar.is_set():
+                    fallidas.update(clave for clave in pendientes if clave not in resultados)
+                    break
+                try:
+                    resultados[clave] = self._geocodificar_con_reintentos(direccion, cancelar)
+                except GeocodificacionEnPausa as e:
+                    # Con el servicio caído cada consulta fallaría igual: se deja todo lo que
+                    # falta pendiente para la próxima ejecución, que lo retoma del archivo de control.
+                    print(f"DEBUG: ColaGeocodificacionMasiva - Se detiene: {e}")
+                    fallidas.update(clave for clave in pendientes if clave not in resultados)
+                    break
+                except (GeocoderTimedOut, GeocoderUnavailable):
+                    fallidas.add(clave)
+                    continue
+                control.write(json.dumps({"clave": clave, "coordenadas": resultados[clave]}) + "\n")
+                control.flush()
+                if progreso:
+                    progreso(len(resultados), total)
+        return {clave: resultados[clave] for clave in lote if clave in resultados and clave not in fallidas}, fallidas
+
+    def _geocodificar_con_reintentos(self, direccion, cancelar=None):
+        """
+        Consulta una dirección reintentando con espera exponencial (con algo de azar) si el servicio falla.
+
+        Raises:
+            GeocodificacionEnPausa: Sin reintentar, si el cortocircuito está abierto.
+        """
+        for intento in range(self.max_reintentos + 1):
+            try:
+                return self.servicio.geocodificar_red(direccion)
+            except GeocodificacionEnPausa:
+                raise  # Es una GeocoderUnavailable, pero reintentar solo gastaría la espera
+            except (GeocoderTimedOut, GeocoderUnavailable):
+                if intento == self.max_reintentos:
+                    raise
+                espera = min(self.espera_maxima, self.espera_inicial * 2 ** intento)
+                espera *= random.uniform(0.5, 1.0)
+                if cancelar is not None:
+                    if cancelar.wait(espera):
+                        raise
+                else:
+                    time.sleep(espera)
+
+    def limpiar_control(self):
+        """Borra el archivo de control (cuando la importación terminó bien)."""
+        if os.path.exists(self.archivo_control):
+            os.remove(self.archivo_control)
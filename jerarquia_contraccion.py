@@ -0,0 +1,326 @@
+import os
+import sys
+import time
+import heapq
+import math
+
+import numpy as np
+
+# --- Jerarquía de contracción sobre la red vial ---
+# Preproceso (una vez por extracto): los nodos se "contraen" de menos a más
+# importantes; al sacar un nodo v, cada camino u -> v -> x que no tenga otro
+# igual de corto (testigo) se reemplaza por un atajo u -> x.  Después, un camino
+# más corto se encuentra con dos búsquedas que solo suben de rango (desde el
+# origen por los arcos hacia adelante y desde el destino por los invertidos),
+# que recorren unos pocos cientos de nodos en vez de media ciudad.
+# Ver Geisberger et al., "Contraction Hierarchies" (2008).
+
+VERSION_JERARQUIA = 1  # Subirla si cambia el formato del .npz
+MAX_ASENTADOS_TESTIGO = 100  # Nodos que revisa como máximo cada búsqueda de testigos
+# Pesos de la prioridad de contracción (menor = se contrae antes)
+PESO_DIFERENCIA = 2
+PESO_CONTRAIDOS = 1
+PESO_NIVEL = 1
+
+
+def _csr_desde_listas(listas):
+    """Convierte una lista (por nodo) de listas [(vecino, peso, medio), ...] a arreglos CSR."""
+    indptr = np.zeros(len(listas) + 1, dtype=np.int64)
+    np.cumsum([len(arcos) for arcos in listas], out=indptr[1:])
+    planos = [arco for arcos in listas for arco in arcos]
+    indices = np.array([arco[0] for arco in planos], dtype=np.int32)
+    pesos = np.array([arco[1] for arco in planos], dtype=np.float64)
+    medios = np.array([arco[2] for arco in planos], dtype=np.int32)
+    return indptr, indices, pesos, medios
+
+
+class JerarquiaContraccion:
+    """
+    Grafo de búsqueda de una jerarquía de contracción.
+
+    Para cada nodo se guardan sus arcos hacia nodos de mayor rango: hacia
+    adelante (para la búsqueda desde el origen) y los de entrada invertidos
+    (para la búsqueda desde el destino), en formato CSR.  `medios` indica el
+    nodo que reemplaza cada atajo (-1 si es una calle original), con lo que se
+    recupera el camino completo.
+    """
+    def __init__(self, rangos, adelante, atras):
+        """
+        Args:
+            rangos (numpy.ndarray): Orden de contracción de cada nodo.
+            adelante (tuple): (indptr, indices, pesos, medios) de los arcos u -> x con rango(x) > rango(u).
+            atras (tuple): Ídem con los arcos x -> u invertidos (guardados en u).
+        """
+        self.rangos = rangos
+        self.adelante = adelante
+        self.atras = atras
+        # Listas de Python para los bucles de búsqueda (ver RedVial)
+        self._adelante = tuple(arreglo.tolist() for arreglo in adelante[:3])
+        self._atras = tuple(arreglo.tolist() for arreglo in atras[:3])
+        self._medios = {}  # (desde, hasta) -> nodo intermedio de cada atajo
+        for (indptr, indices, _, medios), invertido in ((adelante, False), (atras, True)):
+            for nodo, inicio, final in zip(range(len(indptr) - 1), indptr[:-1].tolist(), indptr[1:].tolist()):
+                for vecino, medio in zip(indices[inicio:final].tolist(), medios[inicio:final].tolist()):
+                    if medio >= 0:
+                        self._medios[(vecino, nodo) if invertido else (nodo, vecino)] = medio
+
+    def __len__(self):
+        return len(self.rangos)
+
+    @property
+    def cantidad_atajos(self):
+        return len(self._medios)
+
+    @classmethod
+    def construir(cls, indptr, indices, pesos, max_asentados=MAX_ASENTADOS_TESTIGO, progreso=None):
+        """
+        Contrae todos los nodos de un grafo CSR (el de RedVial).
+
+        El orden sale de una cola de prioridad con la "diferencia de arcos"
+        (atajos que agregaría menos arcos que quita) más la cantidad de vecinos
+        ya contraídos, actualizada de forma perezosa.
+
+        Args:
+            indptr, indices, pesos (numpy.ndarray): Grafo dirigido en formato CSR.
+            max_asentados (int, optional): Límite de cada búsqueda de testigos; más bajo
+                preprocesa más rápido a cambio de algunos atajos de sobra.
+            progreso (callable, optional): Se llama con (contraídos, total) cada tanto.
+
+        Returns:
+            JerarquiaContraccion: La jerarquía.
+        """
+        cantidad = len(indptr) - 1
+        salientes = [dict() for _ in range(cantidad)]  # nodo -> {vecino: (peso, medio)}
+        entrantes = [dict() for _ in range(cantidad)]
+        indptr, indices, pesos = indptr.tolist(), indices.tolist(), pesos.tolist()
+        for nodo in range(cantidad):
+            for arco in range(indptr[nodo], indptr[nodo + 1]):
+                vecino, peso = indices[arco], pesos[arco]
+                if vecino != nodo and peso < salientes[nodo].get(vecino, (math.inf,))[0]:
+                    salientes[nodo][vecino] = (peso, -1)
+                    entrantes[vecino][nodo] = (peso, -1)
+
+        def testigos(origen, excluido, limite):
+            """Distancias desde `origen` sin pasar por `excluido`, hasta `limite` km o max_asentados nodos."""
+            distancias = {origen: 0.0}
+            pendientes = [(0.0, origen)]
+            asentados = 0
+            while pendientes and asentados < max_asentados:
+                distancia, nodo = heapq.heappop(pendientes)
+                if distancia > limite:
+                    break
+                if distancia > distancias[nodo]:
+                    continue
+                asentados += 1
+                for vecino, (peso, _) in salientes[nodo].items():
+                    nueva = distancia + peso
+                    if vecino != excluido and nueva < distancias.get(vecino, math.inf):
+                        distancias[vecino] = nueva
+                        heapq.heappush(pendientes, (nueva, vecino))
+            return distancias
+
+        def atajos(nodo):
+            """Atajos (u, x, peso) que hacen falta al contraer `nodo`."""
+            necesarios = []
+            if not entrantes[nodo] or not salientes[nodo]:
+                return necesarios
+            maximo_salida = max(peso for peso, _ in salientes[nodo].values())
+            for u, (peso_entrada, _) in entrantes[nodo].items():
+                alcanzados = testigos(u, nodo, peso_entrada + maximo_salida)
+                for x, (peso_salida, _) in salientes[nodo].items():
+                    if x == u:
+                        continue
+                    total = peso_entrada + peso_salida
+                    if alcanzados.get(x, math.inf) > total:
+                        necesarios.append((u, x, total))
+            return necesarios
+
+        vecinos_contraidos = [0] * cantidad
+        niveles = [0] * cantidad  # Profundidad en la jerarquía: contraer parejo acorta las búsquedas
+
+        def prioridad(nodo, necesarios):
+            diferencia = len(necesarios) - len(entrantes[nodo]) - len(salientes[nodo])
+            return PESO_DIFERENCIA * diferencia + PESO_CONTRAIDOS * vecinos_contraidos[nodo] + PESO_NIVEL * niveles[nodo]
+
+        cola = [(prioridad(nodo, atajos(nodo)), nodo) for nodo in range(cantidad)]
+        heapq.heapify(cola)
+        rangos = np.empty(cantidad, dtype=np.int32)
+        hacia_arriba = [None] * cantidad  # nodo -> [(vecino, peso, medio), ...]
+        desde_arriba = [None] * cantidad
+        contraidos = 0
+        while cola:
+            _, nodo = heapq.heappop(cola)
+            # Prioridad perezosa: si al recalcularla ya no es la menor, vuelve a la cola
+            necesarios = atajos(nodo)
+            actual = prioridad(nodo, necesarios)
+            if cola and actual > cola[0][0]:
+                heapq.heappush(cola, (actual, nodo))
+                continue
+
+            rangos[nodo] = contraidos
+            contraidos += 1
+            hacia_arriba[nodo] = [(vecino, peso, medio) for vecino, (peso, medio) in salientes[nodo].items()]
+            desde_arriba[nodo] = [(vecino, peso, medio) for vecino, (peso, medio) in entrantes[nodo].items()]
+            for u, x, peso in necesarios:
+                if peso < salientes[u].get(x, (math.inf,))[0]:
+                    salientes[u][x] = (peso, nodo)
+                    entrantes[x][u] = (peso, nodo)
+            for vecino in salientes[nodo]:
+                del entrantes[vecino][nodo]
+                vecinos_contraidos[vecino] += 1
+                niveles[vecino] = max(niveles[vecino], niveles[nodo] + 1)
+            for vecino in entrantes[nodo]:
+                del salientes[vecino][nodo]
+                vecinos_contraidos[vecino] += 1
+                niveles[vecino] = max(niveles[vecino], niveles[nodo] + 1)
+            salientes[nodo] = entrantes[nodo] = None
+            if progreso is not None and contraidos % 1000 == 0:
+                progreso(contraidos, cantidad)
+
+        return cls(rangos, _csr_desde_listas(hacia_arriba), _csr_desde_listas(desde_arriba))
+
+    def guardar(self, ruta_archivo):
+        """Guarda la jerarquía en un .npz."""
+        temporal = ruta_archivo + ".tmp.npz"
+        arreglos = {"version": VERSION_JERARQUIA, "rangos": self.rangos}
+        for prefijo, (indptr, indices, pesos, medios) in (("adelante", self.adelante), ("atras", self.atras)):
+            arreglos.update({f"{prefijo}_indptr": indptr, f"{prefijo}_indices": indices,
+                             f"{prefijo}_pesos": pesos, f"{prefijo}_medios": medios})
+        np.savez(temporal, **arreglos)
+        os.replace(temporal, ruta_archivo)
+
+    @classmethod
+    def cargar(cls, ruta_archivo, cantidad_nodos=None):
+        """
+        Carga una jerarquía guardada con guardar().
+
+        Args:
+            cantidad_nodos (int, optional): Nodos de la red; si no coincide, la jerarquía es de otra red.
+
+        Returns:
+            JerarquiaContraccion: La jerarquía, o None si no se puede usar.
+        """
+        try:
+            with np.load(ruta_archivo, allow_pickle=False) as datos:
+                if int(datos["version"]) != VERSION_JERARQUIA:
+                    return None
+                if cantidad_nodos is not None and len(datos["rangos"]) != cantidad_nodos:
+                    return None
+                partes = [tuple(datos[f"{prefijo}_{nombre}"] for nombre in ("indptr", "indices", "pesos", "medios"))
+                          for prefijo in ("adelante", "atras")]
+                return cls(datos["rangos"], *partes)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"DEBUG: JerarquiaContraccion.cargar - No se pudo cargar {ruta_archivo}: {e}")
+            return None
+
+    def _buscar(self, origen, destino):
+        """
+        Búsqueda bidireccional hacia arriba.  Con "stall-on-demand": un nodo al
+        que se llega más corto bajando desde un vecino de mayor rango no se expande.
+
+        Returns:
+            tuple: (km, nodo de encuentro, predecesores hacia adelante, sucesores hacia atrás), o None.
+        """
+        lados = [
+            (self._adelante, self._atras, {origen: 0.0}, {origen: None}, [(0.0, origen)]),
+            (self._atras, self._adelante, {destino: 0.0}, {destino: None}, [(0.0, destino)]),
+        ]
+        mejor, encuentro = math.inf, None
+        lado = 0
+        while True:
+            # Se alterna entre los lados, salvo que uno ya no pueda mejorar el resultado
+            if not lados[lado][4] or lados[lado][4][0][0] >= mejor:
+                lado = 1 - lado
+                if not lados[lado][4] or lados[lado][4][0][0] >= mejor:
+                    break
+            otro = 1 - lado
+            (indptr, indices, pesos), (ptr_opuesto, ind_opuesto, pes_opuesto), distancias, previos, pendientes = lados[lado]
+            distancias_otro = lados[otro][2]
+            distancia, nodo = heapq.heappop(pendientes)
+            lado = otro
+            if distancia > distancias[nodo]:
+                continue
+            if nodo in distancias_otro and distancia + distancias_otro[nodo] < mejor:
+                mejor, encuentro = distancia + distancias_otro[nodo], nodo
+            # Stall-on-demand: los arcos opuestos de `nodo` vienen de nodos de mayor rango;
+            # si por alguno ya visitado se llega más corto, no vale la pena expandirlo
+            detenido = False
+            for arco in range(ptr_opuesto[nodo], ptr_opuesto[nodo + 1]):
+                previo = distancias.get(ind_opuesto[arco])
+                if previo is not None and previo + pes_opuesto[arco] < distancia:
+                    detenido = True
+                    break
+            if detenido:
+                continue
+            for arco in range(indptr[nodo], indptr[nodo + 1]):
+                vecino = indices[arco]
+                nueva = distancia + pesos[arco]
+                if nueva < distancias.get(vecino, math.inf):
+                    distancias[vecino] = nueva
+                    previos[vecino] = nodo
+                    heapq.heappush(pendientes, (nueva, vecino))
+        if encuentro is None:
+            return None
+        return mejor, encuentro, lados[0][3], lados[1][3]
+
+    def _desplegar(self, desde, hasta, camino):
+        """Agrega a `camino` los nodos del arco desde -> hasta (sin `desde`), abriendo los atajos."""
+        pila = [(desde, hasta)]
+        while pila:
+            a, b = pila.pop()
+            medio = self._medios.get((a, b))
+            if medio is None:
+                camino.append(b)
+            else:
+                pila.append((medio, b))
+                pila.append((a, medio))
+
+    def distancia(self, origen, destino):
+        """Km del camino más corto entre dos nodos, o None si no hay camino."""
+        if origen == destino:
+            return 0.0
+        resultado = self._buscar(origen, destino)
+        return resultado[0] if resultado is not None else None
+
+    def camino_mas_corto(self, origen, destino):
+        """
+        Camino más corto entre dos nodos, con los atajos ya abiertos.
+
+        Returns:
+            tuple: (km, lista de nodos de la red original), o None si no hay camino.
+        """
+        if origen == destino:
+            return 0.0, [origen]
+        resultado = self._buscar(origen, destino)
+        if resultado is None:
+            return None
+        distancia, encuentro, predecesores, sucesores = resultado
+        subida = [encuentro]
+        while predecesores[subida[-1]] is not None:
+            subida.append(predecesores[subida[-1]])
+        subida.reverse()
+        camino = [origen]
+        for desde, hasta in zip(subida, subida[1:]):
+            self._desplegar(desde, hasta, camino)
+        nodo = encuentro
+        while sucesores[nodo] is not None:
+            self._desplegar(nodo, sucesores[nodo], camino)
+            nodo = sucesores[nodo]
+        return distancia, camino
+
+
+if __name__ == "__main__":
+    # Preproceso: python jerarquia_contraccion.py antofagasta.osm.bz2
+    # (deja antofagasta.osm.bz2.ch.npz, que cargar_red_vial usa automáticamente)
+    from red_vial import cargar_red_vial
+
+    if len(sys.argv) != 2:
+        print("Uso: python jerarquia_contraccion.py <extracto OSM>")
+        sys.exit(1)
+    red = cargar_red_vial(sys.argv[1], usar_jerarquia=False)
+    inicio = time.perf_counter()
+    jerarquia = JerarquiaContraccion.construir(
+        red.indptr, red.indices, red.pesos,
+        progreso=lambda hechos, total: print(f"\r{hechos}/{total} nodos contraídos", end="", flush=True))
+    jerarquia.guardar(sys.argv[1] + ".ch.npz")
+    print(f"\n{jerarquia.cantidad_atajos} atajos en {time.perf_counter() - inicio:.1f} s -> {sys.argv[1]}.ch.npz")
@@ -0,0 +1,250 @@
+import os
+import sys
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from distancias import MODELOS_LOTE, coordenadas_rutas
+from persistencia import CargadorCSV
+
+# Parejas que se calculan de una vez.  Vincenty usa unos 30 arreglos auxiliares
+# del tamaño del bloque, así que 250.000 parejas son unos 60 MB por proceso.
+ELEMENTOS_POR_BLOQUE = 250000
+DECIMALES_PUNTOS = 6  # Puntos que coinciden hasta ~10 cm se consideran el mismo
+ARCHIVO_MATRIZ = "matriz_distancias.npz"
+
+
+def puntos_unicos(latitudes, longitudes, etiquetas=None, decimales=DECIMALES_PUNTOS):
+    """
+    Deja una sola vez cada punto (redondeado a `decimales`), en orden de aparición.
+
+    Args:
+        latitudes, longitudes (array_like): Coordenadas en grados; se omiten las que tienen NaN.
+        etiquetas (list, optional): Nombre de cada punto (p. ej. la dirección); se conserva el primero.
+        decimales (int, optional): Decimales de grado para considerar iguales dos puntos.
+
+    Returns:
+        tuple: (arreglo N x 2 de (lat, lon), lista de N etiquetas).
+    """
+    puntos = np.column_stack([np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64)])
+    if etiquetas is None:
+        etiquetas = [""] * len(puntos)
+    validos = np.flatnonzero(np.isfinite(puntos).all(axis=1))
+    if not len(validos):
+        return np.empty((0, 2)), []
+    _, primeros = np.unique(np.round(puntos[validos], decimales), axis=0, return_index=True)
+    primeros = validos[np.sort(primeros)]
+    return puntos[primeros], [etiquetas[indice] for indice in primeros]
+
+
+def _calcular_bloque(filas, columnas, modelo):
+    """Distancias de un bloque de filas contra todas las columnas (se ejecuta en otro proceso)."""
+    distancias = MODELOS_LOTE[modelo](filas[:, 0, None], filas[:, 1, None], columnas[None, :, 0], columnas[None, :, 1])
+    return distancias.astype(np.float32)
+
+
+def construir_matriz(origenes, destinos, modelo="vincenty", elementos_por_bloque=ELEMENTOS_POR_BLOQUE, procesos=1):
+    """
+    Calcula la distancia de cada origen a cada destino, por bloques de filas.
+
+    Args:
+        origenes (numpy.ndarray): N x 2 (lat, lon).
+        destinos (numpy.ndarray): M x 2 (lat, lon).
+        modelo (str, optional): Una clave de distancias.MODELOS_LOTE.
+        elementos_por_bloque (int, optional): Parejas por bloque; acota la memoria de trabajo.
+        procesos (int, optional): Procesos para repartir los bloques (1 = en este proceso,
+            None = uno por núcleo).
+
+    Returns:
+        numpy.ndarray: Matriz N x M en km (float32: alcanza para centímetros a cientos de km).
+    """
+    if modelo not in MODELOS_LOTE:
+        raise ValueError(f"Modelo de distancia desconocido: {modelo}")
+    origenes = np.asarray(origenes, dtype=np.float64).reshape(-1, 2)
+    destinos = np.asarray(destinos, dtype=np.float64).reshape(-1, 2)
+    matriz = np.empty((len(origenes), len(destinos)), dtype=np.float32)
+    if not matriz.size:
+        return matriz
+    filas_por_bloque = max(1, elementos_por_bloque // len(destinos))
+    inicios = range(0, len(origenes), filas_por_bloque)
+
+    if procesos is None:
+        procesos = os.cpu_count() or 1
+    procesos = min(procesos, len(inicios))
+    if procesos <= 1:
+        for inicio in inicios:
+            matriz[inicio:inicio + filas_por_bloque] = _calcular_bloque(origenes[inicio:inicio + filas_por_bloque],
+                                                                         destinos, modelo)
+        return matriz
+
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        futuros = {ejecutor.submit(_calcular_bloque, origenes[inicio:inicio + filas_por_bloque], destinos, modelo): inicio
+                   for inicio in inicios}
+        for futuro in as_completed(futuros):
+            inicio = futuros[futuro]
+            matriz[inicio:inicio + filas_por_bloque] = futuro.result()
+    return matriz
+
+
+class MatrizDistancias:
+    """
+    Distancias de cada punto de partida distinto a cada destino distinto de la flota.
+
+    Los puntos se deduplican (muchas rutas salen de las mismas bodegas), la
+    matriz se calcula por bloques con NumPy y se guarda en un .npz para no
+    recalcularla: al reconstruirla con otra flota se reutilizan las filas y
+    columnas de los puntos que ya estaban y solo se calcula lo nuevo.
+    """
+    def __init__(self, origenes, destinos, distancias, etiquetas_origen=None, etiquetas_destino=None,
+                 modelo="vincenty"):
+        """
+        Args:
+            origenes (numpy.ndarray): N x 2 (lat, lon) de los puntos de partida.
+            destinos (numpy.ndarray): M x 2 (lat, lon) de los destinos.
+            distancias (numpy.ndarray): Matriz N x M en km.
+            etiquetas_origen (list, optional): Dirección de cada origen.
+            etiquetas_destino (list, optional): Dirección de cada destino.
+            modelo (str, optional): Modelo con que se calculó.
+        """
+        self.origenes = origenes
+        self.destinos = destinos
+        self.distancias = distancias
+        self.etiquetas_origen = list(etiquetas_origen) if etiquetas_origen is not None else [""] * len(origenes)
+        self.etiquetas_destino = list(etiquetas_destino) if etiquetas_destino is not None else [""] * len(destinos)
+        self.modelo = modelo
+        self._fila = {_clave_punto(punto): indice for indice, punto in enumerate(origenes)}
+        self._columna = {_clave_punto(punto): indice for indice, punto in enumerate(destinos)}
+
+    @classmethod
+    def desde_rutas(cls, rutas, modelo="vincenty", procesos=1, anterior=None):
+        """
+        Arma la matriz entre las partidas y los destinos distintos de las rutas.
+
+        Args:
+            rutas (list): Tuplas en el formato de ArbolBinarioBusqueda.obtener_rutas().
+            modelo (str, optional): Una clave de distancias.MODELOS_LOTE.
+            procesos (int, optional): Ver construir_matriz().
+            anterior (MatrizDistancias, optional): Matriz ya calculada (del mismo modelo)
+                de la que se reutilizan los puntos en común.
+
+        Returns:
+            MatrizDistancias: La matriz.
+        """
+        lat_partida, lon_partida, lat_destino, lon_destino = coordenadas_rutas(rutas)
+        origenes, etiquetas_origen = puntos_unicos(lat_partida, lon_partida, [ruta[3] for ruta in rutas])
+        destinos, etiquetas_destino = puntos_unicos(lat_destino, lon_destino, [ruta[4] for ruta in rutas])
+        if anterior is None or anterior.modelo != modelo:
+            distancias = construir_matriz(origenes, destinos, modelo, procesos=procesos)
+        else:
+            distancias = anterior._reutilizar(origenes, destinos, modelo, procesos)
+        return cls(origenes, destinos, distancias, etiquetas_origen, etiquetas_destino, modelo)
+
+    def _reutilizar(self, origenes, destinos, modelo, procesos):
+        """Matriz para otros puntos copiando de esta lo conocido y calculando solo lo nuevo."""
+        filas = np.array([self._fila.get(_clave_punto(punto), -1) for punto in origenes], dtype=np.intp)
+        columnas = np.array([self._columna.get(_clave_punto(punto), -1) for punto in destinos], dtype=np.intp)
+        filas_conocidas, filas_nuevas = np.flatnonzero(filas >= 0), np.flatnonzero(filas < 0)
+        columnas_conocidas, columnas_nuevas = np.flatnonzero(columnas >= 0), np.flatnonzero(columnas < 0)
+
+        distancias = np.empty((len(origenes), len(destinos)), dtype=np.float32)
+        distancias[np.ix_(filas_conocidas, columnas_conocidas)] = \
+            self.distancias[np.ix_(filas[filas_conocidas], columnas[columnas_conocidas])]
+        if len(filas_nuevas):
+            distancias[filas_nuevas] = construir_matriz(origenes[filas_nuevas], destinos, modelo, procesos=procesos)
+        if len(filas_conocidas) and len(columnas_nuevas):
+            distancias[np.ix_(filas_conocidas, columnas_nuevas)] = construir_matriz(
+                origenes[filas_conocidas], destinos[columnas_nuevas], modelo, procesos=procesos)
+        print(f"DEBUG: MatrizDistancias - Reutilizadas {len(filas_conocidas) * len(columnas_conocidas)} "
+              f"de {distancias.size} distancias")
+        return distancias
+
+    def distancia(self, lat_origen, lon_origen, lat_destino, lon_destino):
+        """Distancia en km entre un origen y un destino de la matriz, o None si alguno no está."""
+        fila = self._fila.get(_clave_punto((lat_origen, lon_origen)))
+        columna = self._columna.get(_clave_punto((lat_destino, lon_destino)))
+        if fila is None or columna is None:
+            return None
+        return float(self.distancias[fila, columna])
+
+    @property
+    def forma(self):
+        """(orígenes, destinos)."""
+        return self.distancias.shape
+
+    def guardar(self, ruta_archivo):
+        """Guarda la matriz en un .npz (sin compresión: se carga casi instantáneamente)."""
+        temporal = ruta_archivo + ".tmp.npz"
+        np.savez(temporal, origenes=self.origenes, destinos=self.destinos, distancias=self.distancias,
+                 etiquetas_origen=np.array(self.etiquetas_origen, dtype=str),
+                 etiquetas_destino=np.array(self.etiquetas_destino, dtype=str), modelo=np.array(self.modelo))
+        os.replace(temporal, ruta_archivo)
+
+    @classmethod
+    def cargar(cls, ruta_archivo):
+        """
+        Carga una matriz guardada con guardar().
+
+        Returns:
+            MatrizDistancias: La matriz, o None si el archivo no existe o no se puede leer.
+        """
+        try:
+            with np.load(ruta_archivo, allow_pickle=False) as datos:
+                return cls(datos["origenes"], datos["destinos"], datos["distancias"],
+                           datos["etiquetas_origen"].tolist(), datos["etiquetas_destino"].tolist(),
+                           str(datos["modelo"]))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"DEBUG: MatrizDistancias.cargar - No se pudo cargar {ruta_archivo}: {e}")
+            return None
+
+    def huella(self):
+        """Resumen de los puntos y el modelo: dos matrices con la misma huella son intercambiables."""
+        resumen = hashlib.sha1(self.modelo.encode("utf-8"))
+        resumen.update(np.round(self.origenes, DECIMALES_PUNTOS).tobytes())
+        resumen.update(np.round(self.destinos, DECIMALES_PUNTOS).tobytes())
+        return resumen.hexdigest()
+
+
+def _clave_punto(punto):
+    """Clave de diccionario de un punto (redondeado igual que en puntos_unicos)."""
+    return (round(float(punto[0]), DECIMALES_PUNTOS), round(float(punto[1]), DECIMALES_PUNTOS))
+
+
+def matriz_para_rutas(rutas, ruta_archivo=ARCHIVO_MATRIZ, modelo="vincenty", procesos=1):
+    """
+    Devuelve la matriz de las rutas, reutilizando la guardada en `ruta_archivo`
+    (entera si los puntos no cambiaron, o lo que sirva si cambiaron) y
+    guardando la nueva si hubo que calcular algo.
+
+    Returns:
+        MatrizDistancias: La matriz.
+    """
+    anterior = MatrizDistancias.cargar(ruta_archivo) if os.path.exists(ruta_archivo) else None
+    matriz = MatrizDistancias.desde_rutas(rutas, modelo, procesos, anterior)
+    if anterior is None or anterior.huella() != matriz.huella():
+        matriz.guardar(ruta_archivo)
+    return matriz
+
+
+if __name__ == "__main__":
+    # Uso: python matriz_distancias.py rutas_informe.csv [--procesos 4] [--salida matriz_distancias.npz]
+    parser = argparse.ArgumentParser(description="Matriz de distancias entre partidas y destinos de las rutas.")
+    parser.add_argument("archivos", nargs="+", help="CSV con el formato de rutas_informe.csv")
+    parser.add_argument("--salida", default=ARCHIVO_MATRIZ)
+    parser.add_argument("--modelo", default="vincenty", choices=sorted(MODELOS_LOTE))
+    parser.add_argument("--procesos", type=int, default=1, help="0 = uno por núcleo")
+    argumentos = parser.parse_args()
+
+    rutas = []
+    for ruta_archivo in argumentos.archivos:
+        for bloque in CargadorCSV(ruta_archivo).bloques():
+            rutas.extend(bloque)
+    if not rutas:
+        print("No hay rutas en los archivos indicados.")
+        sys.exit(1)
+    inicio = time.perf_counter()
+    resultado = matriz_para_rutas(rutas, argumentos.salida, argumentos.modelo, argumentos.procesos or None)
+    print(f"{len(rutas)} rutas: {resultado.forma[0]} partidas x {resultado.forma[1]} destinos "
+          f"en {time.perf_counter() - inicio:.2f} s -> {argumentos.salida}")
@@ -0,0 +1,186 @@
+import sys
+import glob
+import math
+import bisect
+import threading
+
+from persistencia import CargadorCSV
+from geocodificacion import normalizar_direccion
+
+
+class Nomenclator:
+    """
+    Índice local de direcciones conocidas: dirección normalizada -> (lat, lon).
+
+    Se arma con las rutas ya guardadas (rutas_informe.csv y los otros CSV con
+    el mismo formato), que traen las coordenadas de cada partida y destino.
+    Las bodegas y clientes habituales se resuelven así sin consultar la red,
+    también sin conexión.
+
+    Además del diccionario se mantiene la lista ordenada de claves, con la que
+    una búsqueda por prefijo es una búsqueda binaria (bisect).  En las cargas
+    masivas las claves nuevas se juntan aparte y la lista se ordena una sola
+    vez al final (insertar de a una en orden costaría O(n) cada una).
+    """
+    def __init__(self):
+        self._coordenadas = {}  # clave normalizada -> (lat, lon)
+        self._textos = {}       # clave normalizada -> dirección tal como se escribió
+        self._claves = []       # claves ordenadas, para buscar por prefijo
+        self._sin_ordenar = []  # claves nuevas de una carga masiva, aún fuera de _claves
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._coordenadas)
+
+    def agregar(self, direccion, latitud, longitud, reemplazar=True, ordenar=True):
+        """
+        Agrega (o actualiza) una dirección.
+
+        Args:
+            direccion (str): Dirección tal como se muestra.
+            latitud (float): Latitud.
+            longitud (float): Longitud.
+            reemplazar (bool, optional): Si es False, no pisa una dirección ya indexada.
+            ordenar (bool, optional): Si es False, la clave nueva no se inserta aún en la
+                lista ordenada; queda para el próximo ordenar() (o búsqueda por prefijo).
+
+        Returns:
+            bool: True si se agregó o actualizó.
+        """
+        if not direccion or latitud is None or longitud is None:
+            return False
+        if not (math.isfinite(latitud) and math.isfinite(longitud)):
+            return False
+        clave = normalizar_direccion(direccion)
+        if not clave:
+            return False
+        with self._lock:
+            if clave in self._coordenadas:
+                if not reemplazar:
+                    return False
+            elif ordenar:
+                bisect.insort(self._claves, clave)
+            else:
+                self._sin_ordenar.append(clave)
+            self._coordenadas[clave] = (latitud, longitud)
+            self._textos[clave] = direccion.strip()
+        return True
+
+    def agregar_rutas(self, rutas, reemplazar=True, ordenar=True):
+        """
+        Indexa la partida y el destino de cada ruta.
+
+        Args:
+            rutas (iterable): Tuplas en el formato de ArbolBinarioBusqueda.obtener_rutas().
+            reemplazar (bool, optional): Ver agregar().
+            ordenar (bool, optional): Si es False no se ordenan las claves nuevas al terminar
+                (cuando se cargan varios lotes seguidos y se ordena una vez al final).
+
+        Returns:
+            int: Cantidad de direcciones agregadas o actualizadas.
+        """
+        agregadas = 0
+        for ruta in rutas:
+            agregadas += self.agregar(ruta[3], ruta[5], ruta[6], reemplazar, ordenar=False)
+            agregadas += self.agregar(ruta[4], ruta[7], ruta[8], reemplazar, ordenar=False)
+        if ordenar:
+            self.ordenar()
+        return agregadas
+
+    def ordenar(self):
+        """Incorpora a la lista ordenada las claves pendientes de una carga masiva."""
+        with self._lock:
+            self._ordenar()
+
+    def _ordenar(self):
+        """Ídem ordenar(), con el lock tomado: un solo sort para todas las claves pendientes."""
+        if self._sin_ordenar:
+            self._claves.extend(self._sin_ordenar)
+            self._claves.sort()
+            self._sin_ordenar = []
+
+    def buscar(self, direccion):
+        """Devuelve (lat, lon) de la dirección, o None si no está indexada."""
+        return self._coordenadas.get(normalizar_direccion(direccion))
+
+    def mas_cercana(self, latitud, longitud, radio_km=0.5):
+        """
+        Busca la dirección conocida más cercana a un punto (recorre todo el índice).
+
+        Returns:
+            tuple: (dirección, distancia en km), o None si no hay ninguna dentro del radio.
+        """
+        with self._lock:
+            puntos = list(self._coordenadas.items())
+        coseno = math.cos(math.radians(latitud))
+        mejor = None
+        for clave, (lat, lon) in puntos:
+            # Aproximación equirectangular: suficiente para distancias cortas
+            distancia = 111.195 * math.hypot(lat - latitud, (lon - longitud) * coseno)
+            if distancia <= radio_km and (mejor is None or distancia < mejor[1]):
+                mejor = (clave, distancia)
+        return (self._textos[mejor[0]], mejor[1]) if mejor else None
+
+    def buscar_prefijo(self, prefijo, limite=10):
+        """
+        Busca las direcciones que empiezan con el texto dado.
+
+        Args:
+            prefijo (str): Comienzo de la dirección (se normaliza igual que las claves).
+            limite (int, optional): Máximo de resultados.
+
+        Returns:
+            list: Tuplas (dirección, (lat, lon)) en orden alfabético.
+        """
+        prefijo = normalizar_direccion(prefijo)
+        if not prefijo:
+            return []
+        resultados = []
+        with self._lock:
+            self._ordenar()
+            indice = bisect.bisect_left(self._claves, prefijo)
+            while indice < len(self._claves) and len(resultados) < limite:
+                clave = self._claves[indice]
+                if not clave.startswith(prefijo):
+                    break
+                resultados.append((self._textos[clave], self._coordenadas[clave]))
+                indice += 1
+        return resultados
+
+
+def construir_nomenclator(archivos, nomenclator=None):
+    """
+    Arma un nomenclátor con los CSV de rutas indicados.
+
+    Si una dirección aparece en varios archivos con coordenadas distintas se
+    conserva la del primero, así que conviene pasar primero el más reciente.
+    Los archivos que no tienen el formato de rutas_informe.csv se omiten.
+
+    Args:
+        archivos (iterable): Rutas de los CSV.
+        nomenclator (Nomenclator, optional): Índice a completar (por defecto uno nuevo).
+
+    Returns:
+        Nomenclator: El índice.
+    """
+    if nomenclator is None:
+        nomenclator = Nomenclator()
+    for ruta_archivo in archivos:
+        try:
+            for bloque in CargadorCSV(ruta_archivo).bloques():
+                nomenclator.agregar_rutas(bloque, reemplazar=False, ordenar=False)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            print(f"DEBUG: construir_nomenclator - Se omite {ruta_archivo}: {e}")
+    nomenclator.ordenar()
+    return nomenclator
+
+
+if __name__ == "__main__":
+    # Consulta: python nomenclator.py "av. balma"  (usa los CSV del directorio actual)
+    if len(sys.argv) != 2:
+        print("Uso: python nomenclator.py <comienzo de la dirección>")
+        sys.exit(1)
+    indice = construir_nomenclator(sorted(glob.glob("*.csv")))
+    print(f"Direcciones indexadas: {len(indice)}")
+    for direccion, (latitud, longitud) in indice.buscar_prefijo(sys.argv[1]):
+        print(f"{direccion}: {latitud}, {longitud}")
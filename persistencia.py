@@ -0,0 +1,536 @@
+import os
+import io
+import math
+import csv
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Encabezados del archivo CSV de rutas (mismo formato que genera el informe)
+ENCABEZADOS_CSV = ["ID", "Ruta", "Distancia (km)", "Partida", "Destino", "Latitud Partida", "Longitud Partida",
+                   "Latitud Destino", "Longitud Destino", "Capacidad", "Carga Actual", "Eficiencia"]
+
+
+def calcular_eficiencia_texto(capacidad, carga_actual):
+    """Devuelve la eficiencia ("Baja", "Media", "Alta" o "N/A") tal como se guarda en el CSV."""
+    if capacidad <= 0:  # Evitar división por cero
+        return "N/A"
+    porcentaje = (carga_actual / capacidad) * 100
+    if porcentaje < 50:
+        return "Baja"
+    elif 50 <= porcentaje < 80:
+        return "Media"
+    else:
+        return "Alta"
+
+
+def escribir_csv_rutas(ruta_archivo, rutas):
+    """
+    Escribe las rutas en un archivo CSV de forma atómica.
+
+    Se escribe primero en un archivo temporal y luego se reemplaza el original,
+    así un cierre inesperado nunca deja el archivo a medio escribir.
+
+    Args:
+        ruta_archivo (str): Ruta del archivo CSV de destino.
+        rutas (list): Tuplas tal como las devuelve ArbolBinarioBusqueda.obtener_rutas().
+    """
+    ruta_temporal = ruta_archivo + ".tmp"
+    with open(ruta_temporal, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(ENCABEZADOS_CSV)
+        for ruta in rutas:
+            id_ruta, nombre, distancia, partida, destino, lat_partida, lon_partida, lat_destino, lon_destino, capacidad, carga_actual = ruta
+            eficiencia = calcular_eficiencia_texto(capacidad, carga_actual)
+            writer.writerow([id_ruta, nombre, distancia, partida, destino, lat_partida, lon_partida, lat_destino, lon_destino, capacidad, carga_actual, eficiencia])
+    os.replace(ruta_temporal, ruta_archivo)
+
+
+# Columnas numéricas de una fila del CSV: (índice, conversor, nombre para el reporte)
+COLUMNAS_NUMERICAS = [(0, int, "ID"), (2, float, "Distancia (km)"), (5, float, "Latitud Partida"),
+                      (6, float, "Longitud Partida"), (7, float, "Latitud Destino"), (8, float, "Longitud Destino"),
+                      (9, float, "Capacidad"), (10, float, "Carga Actual")]
+
+
+def validar_carga(capacidad, carga_actual):
+    """
+    Revisa capacidad y carga con las mismas reglas que agregar_ruta.
+
+    Returns:
+        str: El motivo del rechazo, o None si los valores son válidos.
+    """
+    if not (math.isfinite(capacidad) and math.isfinite(carga_actual)):
+        return "Capacidad y Carga Actual deben ser números finitos"
+    if capacidad <= 0:
+        return "La capacidad debe ser un número positivo"
+    if carga_actual < 0:
+        return "La carga actual no puede ser negativa"
+    if carga_actual > capacidad:
+        return "La carga actual no puede ser mayor que la capacidad"
+    return None
+
+
+def validar_bloque(filas):
+    """
+    Valida y convierte un bloque de filas del CSV columna por columna.
+
+    Cada columna numérica se convierte de una vez; solo si alguna conversión
+    falla se revisa esa columna fila por fila para saber cuáles son inválidas.
+    Después se revisan capacidad y carga (ver validar_carga), que de lo
+    contrario harían fallar el cálculo de eficiencia de la tabla.
+
+    Args:
+        filas (list): Pares (número de línea, lista de campos) tal como salen del lector.
+
+    Returns:
+        tuple: (rutas, rechazos).  rutas es una lista de tuplas en el formato de
+        ArbolBinarioBusqueda.obtener_rutas(); rechazos es una lista de
+        (número de línea, motivo, campos).
+    """
+    rechazos = []
+    completas = []
+    for linea, campos in filas:
+        if len(campos) != len(ENCABEZADOS_CSV):
+            rechazos.append((linea, f"Se esperaban {len(ENCABEZADOS_CSV)} columnas y hay {len(campos)}", campos))
+        else:
+            completas.append((linea, campos))
+
+    invalidas = {}  # posición en completas -> motivo (el primero que se encontró)
+    convertidas = {}
+    for indice, conversor, nombre in COLUMNAS_NUMERICAS:
+        valores = [campos[indice] for _, campos in completas]
+        try:
+            convertidas[indice] = list(map(conversor, valores))
+        except ValueError:
+            columna = []
+            for posicion, valor in enumerate(valores):
+                try:
+                    columna.append(conversor(valor))
+                except ValueError:
+                    columna.append(None)
+                    invalidas.setdefault(posicion, f"{nombre} inválido: {valor!r}")
+            convertidas[indice] = columna
+
+    for posicion, (capacidad, carga_actual) in enumerate(zip(convertidas[9], convertidas[10])):
+        if posicion not in invalidas:
+            motivo = validar_carga(capacidad, carga_actual)
+            if motivo:
+                invalidas[posicion] = f"{motivo}: {capacidad!r} / {carga_actual!r}"
+
+    rutas = []
+    for posicion, (linea, campos) in enumerate(completas):
+        if posicion in invalidas:
+            rechazos.append((linea, invalidas[posicion], campos))
+            continue
+        rutas.append((convertidas[0][posicion], campos[1], round(convertidas[2][posicion], 2), campos[3], campos[4],
+                      convertidas[5][posicion], convertidas[6][posicion], convertidas[7][posicion],
+                      convertidas[8][posicion], convertidas[9][posicion], convertidas[10][posicion]))
+    rechazos.sort(key=lambda rechazo: rechazo[0])
+    return rutas, rechazos
+
+
+class CargadorCSV:
+    """
+    Lector del CSV de rutas por bloques de tamaño fijo.
+
+    Solo mantiene en memoria un bloque a la vez, por lo que sirve también para
+    archivos de varios GB.  Las filas inválidas se escriben en un archivo de
+    rechazos (con su número de línea y el motivo) y se cuentan por motivo.
+    """
+    def __init__(self, ruta_archivo, tamano_bloque=10000, archivo_rechazos=None, progreso=None):
+        """
+        Args:
+            ruta_archivo (str): CSV con el formato de rutas_informe.csv.
+            tamano_bloque (int, optional): Filas por bloque.
+            archivo_rechazos (str, optional): Dónde escribir las filas rechazadas.
+                Solo se crea si hay rechazos.
+            progreso (callable, optional): Se llama tras cada bloque con
+                (bytes_leidos, bytes_totales, filas_leidas).
+        """
+        self.ruta_archivo = ruta_archivo
+        self.tamano_bloque = tamano_bloque
+        self.archivo_rechazos = archivo_rechazos
+        self.progreso = progreso
+        self.filas_leidas = 0
+        self.filas_validas = 0
+        self.filas_rechazadas = 0
+        self.motivos_rechazo = Counter()
+
+    def bloques(self):
+        """
+        Recorre el archivo y entrega las rutas válidas bloque por bloque.
+
+        Yields:
+            list: Tuplas de rutas (formato de obtener_rutas) de un bloque.
+
+        Raises:
+            ValueError: Si el archivo está vacío o los encabezados no coinciden.
+        """
+        bytes_totales = os.path.getsize(self.ruta_archivo)
+        salida_rechazos = None
+        escritor_rechazos = None
+        try:
+            with open(self.ruta_archivo, "rb") as binario:
+                texto = io.TextIOWrapper(binario, encoding="utf-8", newline="")
+                lector_csv = csv.reader(texto)
+                encabezados = next(lector_csv, None)
+                if encabezados != ENCABEZADOS_CSV:
+                    raise ValueError("Encabezados incorrectos o archivo vacío.")
+
+                while True:
+                    bloque = []
+                    for fila in lector_csv:
+                        bloque.append((lector_csv.line_num, fila))
+                        if len(bloque) >= self.tamano_bloque:
+                            break
+                    if not bloque:
+                        break
+
+                    rutas, rechazos = validar_bloque(bloque)
+                    self.filas_leidas += len(bloque)
+                    self.filas_validas += len(rutas)
+                    self.filas_rechazadas += len(rechazos)
+                    if rechazos and self.archivo_rechazos:
+                        if escritor_rechazos is None:
+                            salida_rechazos = open(self.archivo_rechazos, "w", newline="", encoding="utf-8")
+                            escritor_rechazos = csv.writer(salida_rechazos)
+                            escritor_rechazos.writerow(["Linea", "Motivo"] + ENCABEZADOS_CSV)
+                        escritor_rechazos.writerows([linea, motivo] + campos for linea, motivo, campos in rechazos)
+                    for _, motivo, _ in rechazos:
+                        self.motivos_rechazo[motivo.split(":")[0]] += 1
+
+                    if self.progreso:
+                        self.progreso(binario.tell(), bytes_totales, self.filas_leidas)
+                    if rutas:
+                        yield rutas
+        finally:
+            if salida_rechazos is not None:
+                salida_rechazos.close()
+
+
+# Columnas mínimas de una planilla de rutas sin coordenadas (la distancia es opcional)
+ENCABEZADOS_DIRECCIONES = ["Ruta", "Partida", "Destino", "Capacidad", "Carga Actual"]
+
+
+def leer_hoja_direcciones(ruta_archivo):
+    """
+    Lee una planilla de rutas que solo trae direcciones (sin latitud/longitud).
+
+    Returns:
+        tuple: (filas, rechazos).  filas es una lista de tuplas (número de línea,
+        nombre, partida, destino, distancia o None, capacidad, carga_actual);
+        rechazos, una lista de (número de línea, motivo, campos).
+
+    Raises:
+        ValueError: Si faltan columnas obligatorias.
+    """
+    filas = []
+    rechazos = []
+    with open(ruta_archivo, "r", newline="", encoding="utf-8") as f:
+        lector_csv = csv.DictReader(f)
+        faltantes = [columna for columna in ENCABEZADOS_DIRECCIONES if columna not in (lector_csv.fieldnames or [])]
+        if faltantes:
+            raise ValueError(f"Faltan columnas: {', '.join(faltantes)}")
+        for registro in lector_csv:
+            # DictReader completa con None los campos que faltan al final de una fila corta
+            campos = [(registro.get(columna) or "").strip() for columna in ENCABEZADOS_DIRECCIONES]
+            nombre, partida, destino, capacidad_str, carga_actual_str = campos
+            if not nombre or not partida or not destino:
+                rechazos.append((lector_csv.line_num, "Ruta, Partida y Destino son obligatorios", campos))
+                continue
+            if not capacidad_str or not carga_actual_str:
+                rechazos.append((lector_csv.line_num, "Capacidad y Carga Actual son obligatorias", campos))
+                continue
+            try:
+                capacidad = float(capacidad_str)
+                carga_actual = float(carga_actual_str)
+                distancia_str = (registro.get("Distancia (km)") or "").strip()
+                distancia = round(float(distancia_str), 2) if distancia_str else None
+            except ValueError as e:
+                rechazos.append((lector_csv.line_num, f"Valor numérico inválido: {e}", campos))
+                continue
+            motivo = validar_carga(capacidad, carga_actual)
+            if motivo is None and distancia is not None and not (math.isfinite(distancia) and distancia >= 0):
+                motivo = "La distancia debe ser un número finito y no negativo"
+            if motivo:
+                rechazos.append((lector_csv.line_num, motivo, campos))
+                continue
+            filas.append((lector_csv.line_num, nombre, partida, destino, distancia, capacidad, carga_actual))
+    return filas, rechazos
+
+
+def dividir_en_rangos(ruta_archivo, partes):
+    """
+    Divide un CSV en rangos de bytes que empiezan y terminan en límites de registro.
+
+    Un salto de línea solo cuenta como fin de registro si está fuera de comillas
+    (las direcciones pueden contener comas y, en general, también saltos de
+    línea entre comillas).  Para saberlo se lleva la paridad de las comillas
+    leyendo el archivo en bloques grandes; contar comillas es mucho más barato
+    que interpretar el CSV.
+
+    Args:
+        ruta_archivo (str): CSV con encabezados en la primera línea.
+        partes (int): Cantidad de rangos deseada (puede resultar menor en archivos chicos).
+
+    Returns:
+        list: Tuplas (inicio, fin, linea_inicial) con los bytes de cada rango y el
+        número de línea en que empieza.  El encabezado queda excluido.
+    """
+    tamano = os.path.getsize(ruta_archivo)
+    with open(ruta_archivo, "rb") as f:
+        f.readline()  # Encabezados
+        inicio_datos = f.tell()
+        objetivos = [inicio_datos + (tamano - inicio_datos) * k // partes for k in range(1, partes)]
+        limites = [(inicio_datos, 2)]
+        posicion = inicio_datos  # Byte en que empieza el bloque actual
+        paridad = 0              # Comillas vistas antes del bloque actual (módulo 2)
+        lineas = 2               # Número de línea al comienzo del bloque actual
+        k = 0
+        while k < len(objetivos):
+            bloque = f.read(1 << 20)
+            if not bloque:
+                break
+            contadas = 0  # Las comillas y líneas de bloque[:contadas] ya se sumaron a paridad_local/lineas_local
+            paridad_local = paridad
+            lineas_local = lineas
+            while k < len(objetivos) and objetivos[k] < posicion + len(bloque):
+                desde = max(objetivos[k] - posicion, limites[-1][0] - posicion, 0)
+                i = bloque.find(b"\n", desde)
+                while i != -1:
+                    paridad_local = (paridad_local + bloque.count(b'"', contadas, i)) % 2
+                    lineas_local += bloque.count(b"\n", contadas, i)
+                    contadas = i
+                    if paridad_local == 0:
+                        break
+                    i = bloque.find(b"\n", i + 1)
+                if i == -1:
+                    break  # El límite cae en el bloque siguiente
+                limites.append((posicion + i + 1, lineas_local + 1))
+                k += 1
+            paridad = (paridad + bloque.count(b'"')) % 2
+            lineas += bloque.count(b"\n")
+            posicion += len(bloque)
+
+    rangos = []
+    for indice, (inicio, linea) in enumerate(limites):
+        fin = limites[indice + 1][0] if indice + 1 < len(limites) else tamano
+        if fin > inicio:
+            rangos.append((inicio, fin, linea))
+    return rangos
+
+
+def _procesar_rango(ruta_archivo, inicio, fin, linea_inicial, tamano_bloque):
+    """
+    Trabajo de un proceso: interpreta y valida un rango de bytes del CSV.
+
+    Returns:
+        tuple: (rutas, rechazos) como en validar_bloque, con números de línea del archivo completo.
+    """
+    with open(ruta_archivo, "rb") as f:
+        f.seek(inicio)
+        texto = f.read(fin - inicio).decode("utf-8")
+    lector_csv = csv.reader(io.StringIO(texto, newline=""))
+    rutas = []
+    rechazos = []
+    bloque = []
+    for fila in lector_csv:
+        bloque.append((linea_inicial + lector_csv.line_num - 1, fila))
+        if len(bloque) >= tamano_bloque:
+            validas, malas = validar_bloque(bloque)
+            rutas.extend(validas)
+            rechazos.extend(malas)
+            bloque = []
+    validas, malas = validar_bloque(bloque)
+    rutas.extend(validas)
+    rechazos.extend(malas)
+    return rutas, rechazos
+
+
+def importar_csv_paralelo(ruta_archivo, procesos=None, archivo_rechazos=None, progreso=None,
+                          tamano_rango=16 * 1024 * 1024, tamano_bloque=10000):
+    """
+    Importa un CSV de rutas grande repartiendo el trabajo entre varios procesos.
+
+    El archivo se divide en rangos alineados a registros (ver dividir_en_rangos);
+    cada proceso interpreta y valida sus rangos y el proceso principal junta los
+    resultados en el orden del archivo.  Los archivos chicos (un solo rango) se
+    procesan sin crear procesos.
+
+    Args:
+        ruta_archivo (str): CSV con el formato de rutas_informe.csv.
+        procesos (int, optional): Procesos a usar (por defecto, uno por núcleo).
+        archivo_rechazos (str, optional): Dónde escribir las filas rechazadas.
+        progreso (callable, optional): Se llama con (rangos_listos, rangos_totales).
+        tamano_rango (int, optional): Bytes aproximados por rango.
+        tamano_bloque (int, optional): Filas por bloque de validación dentro de cada rango.
+
+    Returns:
+        tuple: (rutas, rechazos).  rutas en el formato de obtener_rutas();
+        rechazos como lista de (línea, motivo, campos).
+
+    Raises:
+        ValueError: Si los encabezados no coinciden.
+    """
+    with open(ruta_archivo, "r", newline="", encoding="utf-8") as f:
+        if next(csv.reader(f), None) != ENCABEZADOS_CSV:
+            raise ValueError("Encabezados incorrectos o archivo vacío.")
+
+    procesos = procesos or os.cpu_count() or 1
+    partes = max(1, min(os.path.getsize(ruta_archivo) // tamano_rango + 1, procesos * 4))
+    rangos = dividir_en_rangos(ruta_archivo, partes)
+
+    resultados = [None] * len(rangos)
+    if len(rangos) <= 1 or procesos == 1:
+        for indice, rango in enumerate(rangos):
+            resultados[indice] = _procesar_rango(ruta_archivo, *rango, tamano_bloque)
+            if progreso:
+                progreso(indice + 1, len(rangos))
+    else:
+        with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+            futuros = {ejecutor.submit(_procesar_rango, ruta_archivo, *rango, tamano_bloque): indice
+                       for indice, rango in enumerate(rangos)}
+            for listos, futuro in enumerate(as_completed(futuros), start=1):
+                resultados[futuros[futuro]] = futuro.result()
+                if progreso:
+                    progreso(listos, len(rangos))
+
+    rutas = []
+    rechazos = []
+    for validas, malas in resultados:
+        rutas.extend(validas)
+        rechazos.extend(malas)
+
+    if rechazos and archivo_rechazos:
+        escribir_rechazos(archivo_rechazos, rechazos)
+    return rutas, rechazos
+
+
+def escribir_rechazos(archivo_rechazos, rechazos, encabezados=ENCABEZADOS_CSV):
+    """Escribe las filas rechazadas (línea, motivo, campos) en un CSV."""
+    with open(archivo_rechazos, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["Linea", "Motivo"] + list(encabezados))
+        escritor.writerows([linea, motivo] + campos for linea, motivo, campos in rechazos)
+
+
+class GuardadoDiferido:
+    """
+    Trabajador en segundo plano que persiste los datos sin bloquear la interfaz.
+
+    Cada cambio marca los datos como "sucios" e incrementa un contador de versión.
+    El hilo espera un periodo de calma (sin cambios nuevos) y recién entonces
+    escribe la última instantánea, de modo que una ráfaga de ediciones produce
+    una sola escritura en disco.
+
+    En modo acumulativo los datos son diccionarios clave -> valor (por ejemplo
+    id_ruta -> fila) que se combinan entre sí, y se escriben solo las claves
+    que cambiaron desde la última escritura.
+    """
+    def __init__(self, escribir, espera=1.0, acumulativo=False):
+        """
+        Inicializa el trabajador y arranca su hilo.
+
+        Args:
+            escribir (callable): Función que recibe la instantánea y la escribe en disco.
+            espera (float, optional): Segundos sin cambios antes de escribir.
+            acumulativo (bool, optional): Combinar los cambios (dict) en lugar de reemplazarlos.
+        """
+        self.escribir = escribir
+        self.espera = espera
+        self.acumulativo = acumulativo
+        self.sucio = False
+        self.version = 0            # Versión de los datos en memoria
+        self.version_guardada = 0   # Última versión escrita en disco
+        self._datos = None
+        self._ultimo_cambio = 0.0
+        self._detener = False
+        self._vaciar = False
+        self._condicion = threading.Condition()
+        self._hilo = threading.Thread(target=self._bucle, name="GuardadoDiferido", daemon=True)
+        self._hilo.start()
+
+    def marcar_sucio(self, datos):
+        """
+        Registra una nueva instantánea pendiente de guardar.  No hace I/O.
+
+        Args:
+            datos: Instantánea de los datos (se pasa tal cual a la función escribir),
+                o un dict de cambios en modo acumulativo.
+        """
+        with self._condicion:
+            if self.acumulativo:
+                if self._datos is None:
+                    self._datos = {}
+                self._datos.update(datos)
+            else:
+                self._datos = datos
+            self.sucio = True
+            self.version += 1
+            self._ultimo_cambio = time.monotonic()
+            self._condicion.notify()
+
+    def vaciar(self, timeout=None):
+        """
+        Fuerza la escritura inmediata de los cambios pendientes y espera a que termine.
+
+        Returns:
+            bool: True si no quedaron cambios pendientes.
+        """
+        with self._condicion:
+            if not self.sucio:
+                return True  # Sin esto _vaciar quedaría activo y el próximo cambio se escribiría sin esperar
+            self._vaciar = True
+            self._condicion.notify()
+            self._condicion.wait_for(lambda: not self.sucio or not self._hilo.is_alive(), timeout)
+            if not self.sucio:
+                self._vaciar = False
+            return not self.sucio
+
+    def detener(self, timeout=None):
+        """Escribe lo pendiente y detiene el hilo (se usa al cerrar la ventana)."""
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify()
+        self._hilo.join(timeout)
+
+    def _bucle(self):
+        """Bucle del hilo: espera cambios, deja pasar el periodo de calma y escribe."""
+        while True:
+            with self._condicion:
+                self._condicion.wait_for(lambda: self.sucio or self._detener)
+                if not self.sucio:  # Se pidió detener y no hay nada pendiente
+                    return
+                # --- Esperar el periodo de calma (se reinicia con cada cambio) ---
+                while not (self._detener or self._vaciar):
+                    restante = self._ultimo_cambio + self.espera - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicion.wait(restante)
+                datos = self._datos
+                version = self.version
+                self._vaciar = False
+                if self.acumulativo:
+                    self._datos = None  # Los cambios siguientes se acumulan aparte
+
+            try:
+                self.escribir(datos)
+            except Exception as e:
+                print(f"ERROR: No se pudieron guardar los datos. Detalles: {e}")
+                with self._condicion:
+                    if self.acumulativo:  # Recuperar los cambios no escritos (los nuevos tienen prioridad)
+                        datos.update(self._datos or {})
+                        self._datos = datos
+                    if self._detener:  # No reintentar indefinidamente al cerrar
+                        self.sucio = False
+                        self._condicion.notify_all()
+                        return
+                    self._ultimo_cambio = time.monotonic()  # Reintentar tras otro periodo de calma
+                continue
+
+            with self._condicion:
+                self.version_guardada = version
+                if self.version == version:  # No llegaron cambios mientras se escribía
+                    self.sucio = False
+                self._condicion.notify_all()
@@ -0,0 +1,305 @@
+import sys
+import argparse
+import math
+import time
+import heapq
+import itertools
+import threading
+
+from distancias import distancia_km
+from persistencia import CargadorCSV
+
+# Un destino a menos de esta distancia de la partida de otra ruta se puede encadenar con ella
+TOLERANCIA_KM = 0.5
+TAMANO_CELDA_GRADOS = 0.01  # Celdas del índice espacial (~1,1 km)
+
+
+def _km(lat1, lon1, lat2, lon2):
+    """Distancia corta entre dos puntos (equirectangular: error de centímetros a esta escala)."""
+    return distancia_km(lat1, lon1, lat2, lon2, "equirectangular")
+
+
+class GrillaDinamica:
+    """
+    Índice espacial de puntos que se pueden agregar y quitar: celda -> {clave: (lat, lon)}.
+
+    A diferencia de red_vial.IndiceGrilla (que se arma una vez con arreglos),
+    este acompaña a las rutas mientras se agregan, modifican y eliminan.
+    """
+    def __init__(self, tamano=TAMANO_CELDA_GRADOS):
+        self.tamano = tamano
+        self._celdas = {}  # (fila, columna) -> {clave: (lat, lon)}
+        self._ubicacion = {}  # clave -> (fila, columna)
+
+    def __len__(self):
+        return len(self._ubicacion)
+
+    def _celda(self, latitud, longitud):
+        return math.floor(latitud / self.tamano), math.floor(longitud / self.tamano)
+
+    def agregar(self, clave, latitud, longitud):
+        """Agrega un punto (o lo mueve, si la clave ya estaba)."""
+        self.quitar(clave)
+        celda = self._celda(latitud, longitud)
+        self._celdas.setdefault(celda, {})[clave] = (latitud, longitud)
+        self._ubicacion[clave] = celda
+
+    def quitar(self, clave):
+        """Quita un punto; no hace nada si no estaba."""
+        celda = self._ubicacion.pop(clave, None)
+        if celda is not None:
+            puntos = self._celdas[celda]
+            del puntos[clave]
+            if not puntos:
+                del self._celdas[celda]
+
+    def cercanos(self, latitud, longitud, radio_km):
+        """
+        Puntos a no más de `radio_km` de (latitud, longitud).
+
+        Returns:
+            list: Parejas (clave, distancia en km).
+        """
+        # Celdas que cubren el rectángulo del radio (un grado de longitud se acorta con la latitud)
+        margen_lat = radio_km / 110.574
+        margen_lon = radio_km / max(1e-6, 111.320 * math.cos(math.radians(min(89.0, abs(latitud) + margen_lat))))
+        fila_min, columna_min = self._celda(latitud - margen_lat, longitud - margen_lon)
+        fila_max, columna_max = self._celda(latitud + margen_lat, longitud + margen_lon)
+        encontrados = []
+        for fila in range(fila_min, fila_max + 1):
+            for columna in range(columna_min, columna_max + 1):
+                for clave, (lat, lon) in self._celdas.get((fila, columna), {}).items():
+                    distancia = _km(latitud, longitud, lat, lon)
+                    if distancia <= radio_km:
+                        encontrados.append((clave, distancia))
+        return encontrados
+
+
+class Planificador:
+    """
+    Grafo implícito de las rutas guardadas: la ruta A sigue a la ruta B si el
+    destino de B queda a no más de `tolerancia_km` de la partida de A.
+
+    Los enlaces se mantienen al agregar, modificar o quitar cada ruta (solo se
+    miran sus vecinas en el índice espacial), y planificar() busca con Dijkstra
+    la cadena de rutas existentes más corta entre dos puntos.  Como las rutas
+    no tienen tiempos, "más rápida" se mide en km: los de cada ruta, más los
+    tramos sueltos (del punto de inicio a la primera partida, entre un destino y
+    la partida siguiente y del último destino al punto final), más un recargo
+    opcional por cada transbordo.  Se puede usar desde varios hilos.
+    """
+    def __init__(self, tolerancia_km=TOLERANCIA_KM, recargo_transbordo_km=0.0):
+        """
+        Args:
+            tolerancia_km (float, optional): Distancia máxima entre un destino y la partida siguiente.
+            recargo_transbordo_km (float, optional): Km que se suman por cada cambio de ruta.
+        """
+        self.tolerancia_km = tolerancia_km
+        self.recargo_transbordo_km = recargo_transbordo_km
+        self._rutas = {}  # id -> (nombre, distancia, (lat, lon) partida, (lat, lon) destino)
+        self._partidas = GrillaDinamica()
+        self._destinos = GrillaDinamica()
+        self._siguientes = {}  # id -> {id de la ruta siguiente: km entre destino y partida}
+        self._anteriores = {}  # id -> {id de la ruta anterior: km}
+        self._quitadas = set()  # IDs quitados desde el último vaciar() (ver agregar_ruta)
+        self._generacion = 0  # Sube en cada vaciar(); un armado de una generación anterior se detiene
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rutas)
+
+    @property
+    def cantidad_enlaces(self):
+        return sum(len(siguientes) for siguientes in self._siguientes.values())
+
+    @classmethod
+    def desde_rutas(cls, rutas, tolerancia_km=TOLERANCIA_KM, recargo_transbordo_km=0.0):
+        """Arma el planificador con una lista de rutas (formato de ArbolBinarioBusqueda.obtener_rutas())."""
+        planificador = cls(tolerancia_km, recargo_transbordo_km)
+        planificador.agregar_rutas(rutas)
+        return planificador
+
+    def agregar_ruta(self, ruta, reemplazar=True, generacion=None):
+        """
+        Agrega una ruta (o la actualiza si su ID ya estaba) y la enlaza con sus vecinas.
+        Las rutas sin coordenadas o sin distancia no se pueden encadenar y se omiten.
+
+        Args:
+            ruta (tuple): En el formato de ArbolBinarioBusqueda.obtener_rutas().
+            reemplazar (bool, optional): Si es False, no se toca una ruta que ya está
+                ni una que se quitó después del último vaciar() (sirve para armar
+                el grafo en segundo plano sin pisar los cambios hechos mientras tanto).
+            generacion (int, optional): La que devolvió vaciar() al empezar un armado; si
+                desde entonces se volvió a vaciar, la ruta no se agrega.
+
+        Returns:
+            bool: True si quedó en el grafo.
+        """
+        id_ruta, nombre, distancia = ruta[0], ruta[1], ruta[2]
+        lat_partida, lon_partida, lat_destino, lon_destino = ruta[5:9]
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                return False
+            if not reemplazar and (id_ruta in self._rutas or id_ruta in self._quitadas):
+                return False
+            self._quitar(id_ruta)
+            self._quitadas.discard(id_ruta)
+            if distancia is None or None in (lat_partida, lon_partida, lat_destino, lon_destino):
+                return False
+            self._rutas[id_ruta] = (nombre, distancia, (lat_partida, lon_partida), (lat_destino, lon_destino))
+            self._siguientes[id_ruta] = {}
+            self._anteriores[id_ruta] = {}
+            for siguiente, km in self._partidas.cercanos(lat_destino, lon_destino, self.tolerancia_km):
+                self._siguientes[id_ruta][siguiente] = km
+                self._anteriores[siguiente][id_ruta] = km
+            for anterior, km in self._destinos.cercanos(lat_partida, lon_partida, self.tolerancia_km):
+                self._anteriores[id_ruta][anterior] = km
+                self._siguientes[anterior][id_ruta] = km
+            self._partidas.agregar(id_ruta, lat_partida, lon_partida)
+            self._destinos.agregar(id_ruta, lat_destino, lon_destino)
+            return True
+
+    def agregar_rutas(self, rutas, reemplazar=True, generacion=None):
+        """
+        Agrega varias rutas (ver agregar_ruta).  Con `generacion`, se detiene en cuanto
+        un vaciar() posterior la deja obsoleta (otro armado la reemplazó).
+
+        Returns:
+            int: Cuántas quedaron en el grafo.
+        """
+        agregadas = 0
+        for ruta in rutas:
+            if generacion is not None and generacion != self._generacion:
+                break
+            agregadas += self.agregar_ruta(ruta, reemplazar, generacion)
+        return agregadas
+
+    def vigente(self, generacion):
+        """True si no se vació el grafo desde que vaciar() devolvió `generacion`."""
+        return generacion == self._generacion
+
+    def quitar_ruta(self, id_ruta):
+        """Quita una ruta y sus enlaces; no hace nada si no estaba."""
+        with self._lock:
+            self._quitar(id_ruta)
+            self._quitadas.add(id_ruta)
+
+    def vaciar(self):
+        """
+        Descarta todas las rutas y enlaces.
+
+        Returns:
+            int: La generación nueva, para pasarla a agregar_rutas() en un armado en segundo plano.
+        """
+        with self._lock:
+            self._generacion += 1
+            self._rutas.clear()
+            self._siguientes.clear()
+            self._anteriores.clear()
+            self._quitadas.clear()
+            self._partidas = GrillaDinamica(self._partidas.tamano)
+            self._destinos = GrillaDinamica(self._destinos.tamano)
+            return self._generacion
+
+    def _quitar(self, id_ruta):
+        """Quita una ruta (con el lock tomado)."""
+        if self._rutas.pop(id_ruta, None) is None:
+            return
+        for siguiente in self._siguientes.pop(id_ruta):
+            self._anteriores[siguiente].pop(id_ruta, None)
+        for anterior in self._anteriores.pop(id_ruta):
+            self._siguientes[anterior].pop(id_ruta, None)
+        self._partidas.quitar(id_ruta)
+        self._destinos.quitar(id_ruta)
+
+    def siguientes(self, id_ruta):
+        """Rutas que pueden seguir a `id_ruta`: dict id -> km entre su destino y la partida de cada una."""
+        with self._lock:
+            return dict(self._siguientes.get(id_ruta, {}))
+
+    def planificar(self, lat_inicio, lon_inicio, lat_fin, lon_fin, radio_km=None):
+        """
+        Busca la cadena de rutas más corta para ir de un punto a otro.
+
+        Args:
+            lat_inicio, lon_inicio (float): Punto de partida del viaje.
+            lat_fin, lon_fin (float): Punto de llegada.
+            radio_km (float, optional): Distancia máxima del punto de partida a la primera
+                partida y del último destino al punto de llegada (por defecto, la tolerancia).
+
+        Returns:
+            tuple: (km totales, lista de IDs de las rutas en orden, km fuera de las rutas),
+            o None si ninguna cadena de rutas une los dos puntos.
+        """
+        radio_km = self.tolerancia_km if radio_km is None else radio_km
+        with self._lock:
+            iniciales = self._partidas.cercanos(lat_inicio, lon_inicio, radio_km)
+            finales = dict(self._destinos.cercanos(lat_fin, lon_fin, radio_km))
+            if not iniciales or not finales:
+                return None
+
+            # Dijkstra sobre las rutas: el costo de una ruta es el de llegar a su destino.
+            # Llegar al punto final se agrega como una entrada más de la cola (id None).
+            desempate = itertools.count()
+            costos = {}
+            previas = {}
+            pendientes = []
+            for id_ruta, km in iniciales:
+                costo = km + self._rutas[id_ruta][1]
+                if costo < costos.get(id_ruta, math.inf):
+                    costos[id_ruta] = costo
+                    previas[id_ruta] = None
+                    heapq.heappush(pendientes, (costo, next(desempate), id_ruta, None))
+            cerradas = set()
+            while pendientes:
+                costo, _, id_ruta, ultima = heapq.heappop(pendientes)
+                if id_ruta is None:
+                    return self._armar_plan(costo, ultima, previas)
+                if id_ruta in cerradas:
+                    continue
+                cerradas.add(id_ruta)
+                if id_ruta in finales:
+                    heapq.heappush(pendientes, (costo + finales[id_ruta], next(desempate), None, id_ruta))
+                for siguiente, km in self._siguientes[id_ruta].items():
+                    nuevo = costo + km + self.recargo_transbordo_km + self._rutas[siguiente][1]
+                    if nuevo < costos.get(siguiente, math.inf):
+                        costos[siguiente] = nuevo
+                        previas[siguiente] = id_ruta
+                        heapq.heappush(pendientes, (nuevo, next(desempate), siguiente, None))
+        return None
+
+    def _armar_plan(self, costo, ultima, previas):
+        """Recorre las rutas previas desde la última y arma el resultado de planificar()."""
+        cadena = [ultima]
+        while previas[cadena[-1]] is not None:
+            cadena.append(previas[cadena[-1]])
+        cadena.reverse()
+        km_rutas = sum(self._rutas[id_ruta][1] for id_ruta in cadena)
+        km_sueltos = costo - km_rutas - self.recargo_transbordo_km * (len(cadena) - 1)
+        return costo, cadena, max(0.0, km_sueltos)
+
+
+if __name__ == "__main__":
+    # Uso: python planificador.py rutas_informe.csv --desde LAT LON --hasta LAT LON [--tolerancia 0.5]
+    parser = argparse.ArgumentParser(description="Cadena más corta de rutas guardadas entre dos puntos.")
+    parser.add_argument("archivos", nargs="+", help="CSV con el formato de rutas_informe.csv")
+    parser.add_argument("--desde", nargs=2, type=float, required=True, metavar=("LAT", "LON"))
+    parser.add_argument("--hasta", nargs=2, type=float, required=True, metavar=("LAT", "LON"))
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_KM, help="km entre un destino y la partida siguiente")
+    parser.add_argument("--transbordo", type=float, default=0.0, help="km extra por cada cambio de ruta")
+    argumentos = parser.parse_args()
+
+    inicio = time.perf_counter()
+    planificador = Planificador(argumentos.tolerancia, argumentos.transbordo)
+    for ruta_archivo in argumentos.archivos:
+        for bloque in CargadorCSV(ruta_archivo).bloques():
+            planificador.agregar_rutas(bloque)
+    print(f"{len(planificador)} rutas, {planificador.cantidad_enlaces} enlaces en {time.perf_counter() - inicio:.2f} s")
+    inicio = time.perf_counter()
+    plan = planificador.planificar(*argumentos.desde, *argumentos.hasta)
+    if plan is None:
+        print("Ninguna cadena de rutas une esos puntos.")
+        sys.exit(1)
+    km_total, cadena, km_sueltos = plan
+    print(f"{km_total:.2f} km ({km_sueltos:.2f} fuera de las rutas) en {len(cadena)} tramos, "
+          f"{(time.perf_counter() - inicio) * 1000:.1f} ms: {' -> '.join(map(str, cadena))}")
@@ -0,0 +1,508 @@
+import os
+import bz2
+import sys
+import gzip
+import math
+import heapq
+import argparse
+import xml.etree.ElementTree as ET
+from collections import deque
+
+import numpy as np
+
+from distancias import SEMIEJE_MAYOR_KM, EXCENTRICIDAD2, equirectangular_km
+from jerarquia_contraccion import JerarquiaContraccion
+
+# --- Red vial local (OpenStreetMap) ---
+# Se lee un extracto OSM en XML (.osm, .osm.gz o .osm.bz2; por ejemplo el de la
+# región de Antofagasta exportado desde openstreetmap.org o recortado con osmium)
+# y se arma un grafo dirigido en formato CSR: para el nodo u, sus arcos son
+# indices[indptr[u]:indptr[u + 1]] con largo pesos[...] en km.  El grafo se
+# guarda en un .npz junto al extracto, así la lectura del XML se hace una vez.
+
+# Calles por las que puede circular un camión o un auto
+TIPOS_TRANSITABLES = {
+    "motorway", "motorway_link", "trunk", "trunk_link", "primary", "primary_link", "secondary", "secondary_link",
+    "tertiary", "tertiary_link", "unclassified", "residential", "living_street", "service", "road",
+}
+ACCESOS_PROHIBIDOS = {"no", "private"}
+VERSION_CACHE = 1  # Subirla si cambia el formato del .npz
+TAMANO_CELDA_GRADOS = 0.01  # Celdas del índice espacial (~1,1 km)
+RADIO_MAXIMO_KM = 2.0  # Un punto a más de esto de toda calle no se enruta
+# Factor de la heurística de A*: la distancia en línea recta con radios fijos puede
+# diferir en milésimas del largo de los arcos; así nunca sobreestima.
+FACTOR_HEURISTICA = 0.99
+
+
+def _abrir(ruta_archivo):
+    """Abre el extracto OSM, comprimido o no."""
+    if ruta_archivo.endswith(".gz"):
+        return gzip.open(ruta_archivo, "rb")
+    if ruta_archivo.endswith(".bz2"):
+        return bz2.open(ruta_archivo, "rb")
+    return open(ruta_archivo, "rb")
+
+
+def _sentidos(etiquetas):
+    """
+    Sentidos de circulación de una vía según sus etiquetas OSM.
+
+    Returns:
+        tuple: (se puede ir en el orden de los nodos, se puede ir al revés).
+    """
+    sentido = etiquetas.get("oneway", "").lower()
+    if sentido in ("yes", "true", "1"):
+        return True, False
+    if sentido in ("-1", "reverse"):
+        return False, True
+    if sentido in ("no", "false", "0"):
+        return True, True
+    # Rotondas y autopistas son de un sentido aunque no lo digan
+    if etiquetas.get("junction") in ("roundabout", "circular") or etiquetas.get("highway") == "motorway":
+        return True, False
+    return True, True
+
+
+def leer_osm(ruta_archivo):
+    """
+    Lee las calles transitables de un extracto OSM (XML) con iterparse, sin
+    cargar el documento completo en memoria.
+
+    Args:
+        ruta_archivo (str): Archivo .osm, .osm.gz o .osm.bz2.
+
+    Returns:
+        tuple: (ids de nodo, latitudes, longitudes, arcos) donde arcos es una
+        lista de parejas (id desde, id hasta) en el sentido de circulación.
+
+    Raises:
+        ValueError: Si el archivo no es un XML de OSM válido.
+    """
+    nodos = {}  # id OSM -> (lat, lon)
+    arcos = []
+    with _abrir(ruta_archivo) as archivo:
+        try:
+            for _, elemento in ET.iterparse(archivo, events=("end",)):
+                if elemento.tag == "node":
+                    nodos[int(elemento.get("id"))] = (float(elemento.get("lat")), float(elemento.get("lon")))
+                    elemento.clear()
+                elif elemento.tag == "way":
+                    etiquetas = {etiqueta.get("k"): etiqueta.get("v") for etiqueta in elemento.iter("tag")}
+                    if etiquetas.get("highway") in TIPOS_TRANSITABLES \
+                            and etiquetas.get("access") not in ACCESOS_PROHIBIDOS \
+                            and etiquetas.get("motor_vehicle") not in ACCESOS_PROHIBIDOS:
+                        referencias = [int(nd.get("ref")) for nd in elemento.iter("nd")]
+                        ida, vuelta = _sentidos(etiquetas)
+                        for desde, hasta in zip(referencias, referencias[1:]):
+                            if ida:
+                                arcos.append((desde, hasta))
+                            if vuelta:
+                                arcos.append((hasta, desde))
+                    elemento.clear()
+                elif elemento.tag == "relation":
+                    elemento.clear()
+        except ET.ParseError as e:
+            raise ValueError(f"El archivo no es un extracto OSM válido: {e}") from None
+
+    # Los extractos recortados pueden citar nodos que quedaron fuera
+    arcos = [(desde, hasta) for desde, hasta in arcos if desde in nodos and hasta in nodos]
+    usados = sorted({nodo for arco in arcos for nodo in arco})
+    latitudes = np.array([nodos[nodo][0] for nodo in usados], dtype=np.float64)
+    longitudes = np.array([nodos[nodo][1] for nodo in usados], dtype=np.float64)
+    return np.array(usados, dtype=np.int64), latitudes, longitudes, arcos
+
+
+def _csr(origenes, destinos, pesos, cantidad_nodos):
+    """Arma (indptr, indices, pesos) ordenando los arcos por nodo de origen."""
+    orden = np.argsort(origenes, kind="stable")
+    indptr = np.zeros(cantidad_nodos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(origenes, minlength=cantidad_nodos), out=indptr[1:])
+    return indptr, destinos[orden].astype(np.int32), pesos[orden]
+
+
+def _componente_mayor(indptr, indices, cantidad_nodos):
+    """Nodos de la mayor componente conexa (sin mirar sentidos), como máscara booleana."""
+    # Adyacencia no dirigida: los arcos y sus inversos
+    origenes = np.repeat(np.arange(cantidad_nodos), np.diff(indptr))
+    todos_origen = np.concatenate([origenes, indices])
+    todos_destino = np.concatenate([indices, origenes])
+    ptr, vecinos, _ = _csr(todos_origen, todos_destino, np.zeros(len(todos_origen)), cantidad_nodos)
+    ptr, vecinos = ptr.tolist(), vecinos.tolist()
+
+    componente = [-1] * cantidad_nodos
+    tamanos = []
+    for inicio in range(cantidad_nodos):
+        if componente[inicio] != -1:
+            continue
+        etiqueta = len(tamanos)
+        componente[inicio] = etiqueta
+        cola = deque([inicio])
+        tamano = 0
+        while cola:
+            nodo = cola.popleft()
+            tamano += 1
+            for vecino in vecinos[ptr[nodo]:ptr[nodo + 1]]:
+                if componente[vecino] == -1:
+                    componente[vecino] = etiqueta
+                    cola.append(vecino)
+        tamanos.append(tamano)
+    if not tamanos:
+        return np.zeros(0, dtype=bool)
+    return np.array(componente) == int(np.argmax(tamanos))
+
+
+class IndiceGrilla:
+    """
+    Índice espacial de puntos en una grilla regular de celdas de `tamano` grados.
+
+    Los puntos se ordenan por celda y cada celda guarda su tramo en ese orden;
+    para el más cercano se revisan anillos de celdas alrededor del punto hasta
+    que ninguno más lejano pueda mejorar el resultado.
+    """
+    def __init__(self, latitudes, longitudes, tamano=TAMANO_CELDA_GRADOS):
+        """
+        Args:
+            latitudes, longitudes (numpy.ndarray): Coordenadas de los puntos.
+            tamano (float, optional): Lado de la celda en grados.
+        """
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.tamano = tamano
+        filas = np.floor(latitudes / tamano).astype(np.int64)
+        columnas = np.floor(longitudes / tamano).astype(np.int64)
+        self._orden = np.lexsort((columnas, filas))
+        celdas = np.column_stack([filas[self._orden], columnas[self._orden]])
+        cambios = np.flatnonzero(np.any(np.diff(celdas, axis=0) != 0, axis=1)) + 1
+        inicios = np.concatenate([[0], cambios]) if len(celdas) else np.zeros(0, dtype=np.int64)
+        finales = np.concatenate([cambios, [len(celdas)]]) if len(celdas) else np.zeros(0, dtype=np.int64)
+        self._celdas = {(int(celdas[inicio, 0]), int(celdas[inicio, 1])): (int(inicio), int(final))
+                        for inicio, final in zip(inicios, finales)}
+
+    def _puntos_celda(self, fila, columna):
+        """Índices de los puntos de una celda."""
+        tramo = self._celdas.get((fila, columna))
+        return self._orden[tramo[0]:tramo[1]] if tramo else None
+
+    def mas_cercano(self, latitud, longitud, radio_km=RADIO_MAXIMO_KM):
+        """
+        Busca el punto más cercano.
+
+        Returns:
+            tuple: (índice del punto, distancia en km), o None si no hay ninguno dentro del radio.
+        """
+        fila = math.floor(latitud / self.tamano)
+        columna = math.floor(longitud / self.tamano)
+        # Lado mínimo de una celda en km (el este-oeste se acorta con la latitud)
+        lado_km = self.tamano * 110.574 * min(1.0, math.cos(math.radians(abs(latitud) + self.tamano)))
+        anillos = max(1, math.ceil(radio_km / lado_km))
+        mejor = None
+        for anillo in range(anillos + 1):
+            # Todo punto de este anillo está al menos a (anillo - 1) celdas
+            if mejor is not None and (anillo - 1) * lado_km > mejor[1]:
+                break
+            candidatos = []
+            for f in range(fila - anillo, fila + anillo + 1):
+                for c in range(columna - anillo, columna + anillo + 1):
+                    if max(abs(f - fila), abs(c - columna)) == anillo:
+                        puntos = self._puntos_celda(f, c)
+                        if puntos is not None:
+                            candidatos.append(puntos)
+            if not candidatos:
+                continue
+            candidatos = np.concatenate(candidatos)
+            distancias = equirectangular_km(latitud, longitud, self.latitudes[candidatos], self.longitudes[candidatos])
+            posicion = int(np.argmin(distancias))
+            if mejor is None or distancias[posicion] < mejor[1]:
+                mejor = (int(candidatos[posicion]), float(distancias[posicion]))
+        if mejor is None or mejor[1] > radio_km:
+            return None
+        return mejor
+
+
+class RedVial:
+    """
+    Grafo de calles en formato CSR, con búsqueda del camino más corto (A*,
+    Dijkstra bidireccional o, si se preprocesó, la jerarquía de contracción) y
+    un índice espacial para ubicar el nodo más cercano a un punto.  No cambia
+    después de construido, así que se puede consultar desde varios hilos.
+    """
+    def __init__(self, latitudes, longitudes, indptr, indices, pesos):
+        """
+        Args:
+            latitudes, longitudes (numpy.ndarray): Coordenadas de cada nodo.
+            indptr, indices, pesos (numpy.ndarray): Arcos en formato CSR (pesos en km).
+        """
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.indptr = indptr
+        self.indices = indices
+        self.pesos = pesos
+        origenes = np.repeat(np.arange(len(latitudes)), np.diff(indptr))
+        self.indptr_inverso, self.indices_inverso, self.pesos_inverso = _csr(indices.astype(np.int64), origenes,
+                                                                            pesos, len(latitudes))
+        self.indice = IndiceGrilla(latitudes, longitudes)
+        # Listas de Python: en los bucles de búsqueda son mucho más rápidas que indexar NumPy
+        self._adelante = (indptr.tolist(), indices.tolist(), pesos.tolist())
+        self._atras = (self.indptr_inverso.tolist(), self.indices_inverso.tolist(), self.pesos_inverso.tolist())
+        self._lat = latitudes.tolist()
+        self._lon = longitudes.tolist()
+        self.jerarquia = None  # JerarquiaContraccion, si se preprocesó (ver cargar_red_vial)
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @property
+    def cantidad_arcos(self):
+        return len(self.indices)
+
+    @classmethod
+    def desde_osm(cls, ruta_archivo):
+        """
+        Arma la red a partir de un extracto OSM.  Se conserva solo la mayor
+        componente conexa, para que ningún punto quede pegado a un trozo de
+        calle aislado (un estacionamiento, un recorte del extracto).
+        """
+        ids, latitudes, longitudes, arcos = leer_osm(ruta_archivo)
+        if not arcos:
+            raise ValueError(f"El extracto no tiene calles transitables: {ruta_archivo}")
+        # Los nodos se numeran 0..N-1 según su posición en `ids` (ordenados)
+        pares = np.array(arcos, dtype=np.int64)
+        origenes = np.searchsorted(ids, pares[:, 0])
+        destinos = np.searchsorted(ids, pares[:, 1])
+        return cls._desde_arcos(latitudes, longitudes, origenes, destinos)
+
+    @classmethod
+    def _desde_arcos(cls, latitudes, longitudes, origenes, destinos):
+        """Arma la red con arcos numerados, midiendo cada uno y dejando la mayor componente."""
+        pesos = equirectangular_km(latitudes[origenes], longitudes[origenes], latitudes[destinos], longitudes[destinos])
+        indptr, indices, pesos = _csr(origenes, destinos, pesos, len(latitudes))
+        conservar = _componente_mayor(indptr, indices, len(latitudes))
+        if not conservar.all():
+            nueva_numeracion = np.cumsum(conservar) - 1
+            origenes = np.repeat(np.arange(len(latitudes)), np.diff(indptr))
+            validos = conservar[origenes]
+            origenes, destinos = nueva_numeracion[origenes[validos]], nueva_numeracion[indices[validos]]
+            latitudes, longitudes = latitudes[conservar], longitudes[conservar]
+            indptr, indices, pesos = _csr(origenes, destinos, pesos[validos], len(latitudes))
+        return cls(latitudes, longitudes, indptr, indices, pesos)
+
+    def guardar(self, ruta_archivo):
+        """Guarda el grafo en un .npz."""
+        temporal = ruta_archivo + ".tmp.npz"
+        np.savez(temporal, version=VERSION_CACHE, latitudes=self.latitudes, longitudes=self.longitudes,
+                 indptr=self.indptr, indices=self.indices, pesos=self.pesos)
+        os.replace(temporal, ruta_archivo)
+
+    @classmethod
+    def cargar(cls, ruta_archivo):
+        """
+        Carga un grafo guardado con guardar().
+
+        Returns:
+            RedVial: La red, o None si el archivo no se puede leer o es de otra versión.
+        """
+        try:
+            with np.load(ruta_archivo, allow_pickle=False) as datos:
+                if int(datos["version"]) != VERSION_CACHE:
+                    return None
+                return cls(datos["latitudes"], datos["longitudes"], datos["indptr"], datos["indices"], datos["pesos"])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"DEBUG: RedVial.cargar - No se pudo cargar {ruta_archivo}: {e}")
+            return None
+
+    def nodo_mas_cercano(self, latitud, longitud, radio_km=RADIO_MAXIMO_KM):
+        """Devuelve (nodo, distancia en km) del cruce o punto de calle más cercano, o None."""
+        return self.indice.mas_cercano(latitud, longitud, radio_km)
+
+    def _heuristica(self, destino):
+        """Distancia en línea recta (por debajo de la real) desde cada nodo hasta `destino`."""
+        lat_destino, lon_destino = self._lat[destino], self._lon[destino]
+        seno = math.sin(math.radians(lat_destino))
+        w = 1 - EXCENTRICIDAD2 * seno ** 2
+        km_por_grado_lat = math.radians(SEMIEJE_MAYOR_KM * (1 - EXCENTRICIDAD2) / w ** 1.5) * FACTOR_HEURISTICA
+        km_por_grado_lon = math.radians(SEMIEJE_MAYOR_KM / math.sqrt(w)) * math.cos(math.radians(lat_destino)) \
+            * FACTOR_HEURISTICA
+        latitudes, longitudes = self._lat, self._lon
+
+        def estimar(nodo):
+            return math.hypot((latitudes[nodo] - lat_destino) * km_por_grado_lat,
+                              (longitudes[nodo] - lon_destino) * km_por_grado_lon)
+        return estimar
+
+    def _a_estrella(self, origen, destino):
+        """A* con la distancia en línea recta como heurística.  Devuelve (km, predecesores) o None."""
+        indptr, indices, pesos = self._adelante
+        estimar = self._heuristica(destino)
+        distancias = {origen: 0.0}
+        predecesores = {origen: None}
+        cerrados = set()
+        pendientes = [(estimar(origen), 0.0, origen)]
+        while pendientes:
+            _, distancia, nodo = heapq.heappop(pendientes)
+            if nodo == destino:
+                return distancia, predecesores
+            if nodo in cerrados:
+                continue
+            cerrados.add(nodo)
+            for arco in range(indptr[nodo], indptr[nodo + 1]):
+                vecino = indices[arco]
+                nueva = distancia + pesos[arco]
+                if nueva < distancias.get(vecino, math.inf):
+                    distancias[vecino] = nueva
+                    predecesores[vecino] = nodo
+                    heapq.heappush(pendientes, (nueva + estimar(vecino), nueva, vecino))
+        return None
+
+    def _dijkstra_bidireccional(self, origen, destino):
+        """
+        Dijkstra desde el origen (arcos hacia adelante) y desde el destino (arcos
+        invertidos) a la vez, siempre avanzando el lado con menos por recorrer.
+
+        Returns:
+            tuple: (km, nodo de encuentro, predecesores hacia adelante, sucesores hacia atrás), o None.
+        """
+        if origen == destino:
+            return 0.0, origen, {origen: None}, {destino: None}
+        lados = [
+            (self._adelante, {origen: 0.0}, {origen: None}, [(0.0, origen)], set()),
+            (self._atras, {destino: 0.0}, {destino: None}, [(0.0, destino)], set()),
+        ]
+        mejor, encuentro = math.inf, None
+        while lados[0][3] and lados[1][3]:
+            if lados[0][3][0][0] + lados[1][3][0][0] >= mejor:
+                break
+            lado = 0 if len(lados[0][3]) <= len(lados[1][3]) else 1
+            (indptr, indices, pesos), distancias, previos, pendientes, cerrados = lados[lado]
+            distancias_otro = lados[1 - lado][1]
+            distancia, nodo = heapq.heappop(pendientes)
+            if nodo in cerrados:
+                continue
+            cerrados.add(nodo)
+            for arco in range(indptr[nodo], indptr[nodo + 1]):
+                vecino = indices[arco]
+                nueva = distancia + pesos[arco]
+                if nueva < distancias.get(vecino, math.inf):
+                    distancias[vecino] = nueva
+                    previos[vecino] = nodo
+                    heapq.heappush(pendientes, (nueva, vecino))
+                if vecino in distancias_otro and nueva + distancias_otro[vecino] < mejor:
+                    mejor, encuentro = nueva + distancias_otro[vecino], vecino
+        if encuentro is None:
+            return None
+        return mejor, encuentro, lados[0][2], lados[1][2]
+
+    def camino_mas_corto(self, origen, destino, metodo=None):
+        """
+        Camino más corto entre dos nodos.
+
+        Args:
+            origen (int): Nodo de partida.
+            destino (int): Nodo de llegada.
+            metodo (str, optional): "ch" (jerarquía de contracción), "astar" o "bidireccional".
+                Por defecto "ch" si la red tiene jerarquía y si no "astar".
+
+        Returns:
+            tuple: (km, lista de nodos del camino), o None si no hay camino.
+
+        Raises:
+            ValueError: Si el método no existe.
+        """
+        if metodo is None:
+            metodo = "ch" if self.jerarquia is not None else "astar"
+        if metodo == "ch":
+            if self.jerarquia is None:
+                raise ValueError("La red no tiene jerarquía de contracción (ver jerarquia_contraccion.py)")
+            return self.jerarquia.camino_mas_corto(origen, destino)
+        if metodo == "astar":
+            resultado = self._a_estrella(origen, destino)
+            if resultado is None:
+                return None
+            distancia, predecesores = resultado
+            camino = [destino]
+            while predecesores[camino[-1]] is not None:
+                camino.append(predecesores[camino[-1]])
+            camino.reverse()
+            return distancia, camino
+        if metodo == "bidireccional":
+            resultado = self._dijkstra_bidireccional(origen, destino)
+            if resultado is None:
+                return None
+            distancia, encuentro, predecesores, sucesores = resultado
+            camino = [encuentro]
+            while predecesores[camino[-1]] is not None:
+                camino.append(predecesores[camino[-1]])
+            camino.reverse()
+            while sucesores[camino[-1]] is not None:
+                camino.append(sucesores[camino[-1]])
+            return distancia, camino
+        raise ValueError(f"Método de búsqueda desconocido: {metodo}")
+
+    def distancia_por_calles(self, lat1, lon1, lat2, lon2, metodo=None, radio_km=RADIO_MAXIMO_KM):
+        """
+        Distancia manejando entre dos puntos: del punto a la calle más cercana
+        (en línea recta), por las calles y de la calle al otro punto.
+
+        Returns:
+            tuple: (km, geometría como lista de (lat, lon)), o None si algún
+            punto está lejos de toda calle o no hay camino.
+        """
+        cercano_origen = self.nodo_mas_cercano(lat1, lon1, radio_km)
+        cercano_destino = self.nodo_mas_cercano(lat2, lon2, radio_km)
+        if cercano_origen is None or cercano_destino is None:
+            return None
+        resultado = self.camino_mas_corto(cercano_origen[0], cercano_destino[0], metodo)
+        if resultado is None:
+            return None
+        distancia, camino = resultado
+        geometria = [(lat1, lon1)] + [(self._lat[nodo], self._lon[nodo]) for nodo in camino] + [(lat2, lon2)]
+        return cercano_origen[1] + distancia + cercano_destino[1], geometria
+
+
+def _al_dia(ruta_derivado, ruta_osm):
+    """True si el archivo derivado existe y es posterior al extracto."""
+    return os.path.exists(ruta_derivado) and os.path.getmtime(ruta_derivado) >= os.path.getmtime(ruta_osm)
+
+
+def cargar_red_vial(ruta_osm, ruta_cache=None, usar_jerarquia=True):
+    """
+    Carga la red de un extracto OSM, usando el .npz guardado si está al día
+    (y creándolo si no).  Si además hay una jerarquía de contracción al día
+    (extracto + ".ch.npz", ver jerarquia_contraccion.py) se le agrega a la red.
+
+    Args:
+        ruta_osm (str): Extracto OSM.
+        ruta_cache (str, optional): Archivo del grafo (por defecto, el extracto + ".red.npz").
+        usar_jerarquia (bool, optional): Si es False no se carga la jerarquía.
+
+    Returns:
+        RedVial: La red.
+    """
+    ruta_cache = ruta_cache or ruta_osm + ".red.npz"
+    red = RedVial.cargar(ruta_cache) if _al_dia(ruta_cache, ruta_osm) else None
+    if red is None:
+        red = RedVial.desde_osm(ruta_osm)
+        try:
+            red.guardar(ruta_cache)
+        except OSError as e:
+            print(f"DEBUG: cargar_red_vial - No se pudo guardar {ruta_cache}: {e}")
+    ruta_jerarquia = ruta_osm + ".ch.npz"
+    if usar_jerarquia and _al_dia(ruta_jerarquia, ruta_osm):
+        red.jerarquia = JerarquiaContraccion.cargar(ruta_jerarquia, len(red))
+    return red
+
+
+if __name__ == "__main__":
+    # Uso: python red_vial.py antofagasta.osm.bz2 -23.65 -70.40 -23.58 -70.38
+    parser = argparse.ArgumentParser(description="Distancia por calles con un extracto de OpenStreetMap.")
+    parser.add_argument("extracto")
+    parser.add_argument("coordenadas", nargs=4, type=float, metavar=("LAT1", "LON1", "LAT2", "LON2"))
+    parser.add_argument("--metodo", default=None, choices=("ch", "astar", "bidireccional"))
+    argumentos = parser.parse_args()
+
+    red_cargada = cargar_red_vial(argumentos.extracto)
+    print(f"Red: {len(red_cargada)} nodos, {red_cargada.cantidad_arcos} arcos")
+    trayecto = red_cargada.distancia_por_calles(*argumentos.coordenadas, metodo=argumentos.metodo)
+    if trayecto is None:
+        print("No se encontró un camino entre esos puntos.")
+        sys.exit(1)
+    print(f"{trayecto[0]:.2f} km por calles ({len(trayecto[1])} puntos)")
@@ -0,0 +1,174 @@
+import sys
+import json
+import glob
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from nomenclator import Nomenclator, construir_nomenclator
+
+# Zona donde se ubican las direcciones desconocidas (alrededores de Antofagasta)
+CENTRO_SINTETICO = (-23.65, -70.40)
+RADIO_SINTETICO_GRADOS = 0.08
+
+
+def coordenadas_sinteticas(direccion):
+    """
+    Coordenadas deterministas para una dirección desconocida.
+
+    La misma dirección da siempre el mismo punto, así las pruebas y los
+    benchmarks son repetibles.
+    """
+    resumen = hashlib.sha1(direccion.encode("utf-8")).digest()
+    desplazamiento_lat = (int.from_bytes(resumen[:4], "big") / 0xFFFFFFFF * 2 - 1) * RADIO_SINTETICO_GRADOS
+    desplazamiento_lon = (int.from_bytes(resumen[4:8], "big") / 0xFFFFFFFF * 2 - 1) * RADIO_SINTETICO_GRADOS
+    return CENTRO_SINTETICO[0] + desplazamiento_lat, CENTRO_SINTETICO[1] + desplazamiento_lon
+
+
+class ServidorGeocodificacion:
+    """
+    Servidor HTTP local compatible con la API de Nominatim (/search y /reverse).
+
+    Reemplaza al servicio público en pruebas y benchmarks: responde con las
+    direcciones del nomenclátor (y, si se pide, con puntos sintéticos para las
+    desconocidas), con una latencia configurable e inyección de fallas.  Se
+    usa con ProveedorNominatim apuntando a su URL (ver crear_proveedor).
+    """
+    def __init__(self, host="127.0.0.1", puerto=0, nomenclator=None, latencia=0.0, variacion=0.0,
+                 tasa_fallas=0.0, sinteticas=True, semilla=None):
+        """
+        Args:
+            host (str, optional): Interfaz donde escuchar.
+            puerto (int, optional): Puerto (0 elige uno libre; ver self.url).
+            nomenclator (Nomenclator, optional): Direcciones conocidas.
+            latencia (float, optional): Demora fija de cada respuesta, en segundos.
+            variacion (float, optional): Demora adicional aleatoria (0 a `variacion` segundos).
+            tasa_fallas (float, optional): Fracción de consultas que responden 503
+                (geopy la informa como GeocoderTimedOut).
+            sinteticas (bool, optional): Si es False, lo desconocido se responde como no encontrado.
+            semilla (int, optional): Semilla para que las fallas sean reproducibles.
+        """
+        self.nomenclator = nomenclator if nomenclator is not None else Nomenclator()
+        self.latencia = latencia
+        self.variacion = variacion
+        self.tasa_fallas = tasa_fallas
+        self.sinteticas = sinteticas
+        self.consultas = 0
+        self.fallas = 0
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._hilo = None
+
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor._atender(self)
+
+            def log_message(self, formato, *args):
+                pass  # Sin una línea por consulta en la consola
+
+        self.http = ThreadingHTTPServer((host, puerto), Manejador)
+        self.http.daemon_threads = True
+
+    @property
+    def url(self):
+        """URL base del servidor, para crear_proveedor()."""
+        host, puerto = self.http.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def iniciar(self):
+        """Atiende consultas en un hilo aparte y devuelve self."""
+        self._hilo = threading.Thread(target=self.http.serve_forever, name="servidor_geocodificacion", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        """Deja de atender consultas y libera el puerto."""
+        self.http.shutdown()
+        self.http.server_close()
+
+    def _atender(self, solicitud):
+        """Responde una consulta /search o /reverse."""
+        with self._lock:
+            self.consultas += 1
+            demora = self.latencia + self._azar.uniform(0, self.variacion)
+            fallar = self._azar.random() < self.tasa_fallas
+            if fallar:
+                self.fallas += 1
+        if demora > 0:
+            time.sleep(demora)
+        if fallar:
+            self._responder(solicitud, 503, {"error": "Falla simulada"})
+            return
+
+        url = urlparse(solicitud.path)
+        parametros = {clave: valores[0] for clave, valores in parse_qs(url.query).items()}
+        if url.path.rstrip("/") == "/search":
+            self._responder(solicitud, 200, self._buscar(parametros.get("q", "")))
+        elif url.path.rstrip("/") == "/reverse":
+            try:
+                latitud, longitud = float(parametros["lat"]), float(parametros["lon"])
+            except (KeyError, ValueError):
+                self._responder(solicitud, 400, {"error": "Parámetros lat y lon inválidos"})
+                return
+            self._responder(solicitud, 200, self._inversa(latitud, longitud))
+        else:
+            self._responder(solicitud, 404, {"error": "Ruta desconocida"})
+
+    def _buscar(self, consulta):
+        """Resultado de /search: lista con un lugar, o vacía si no se encontró."""
+        coordenadas = self.nomenclator.buscar(consulta)
+        if coordenadas is None and self.sinteticas and consulta.strip():
+            coordenadas = coordenadas_sinteticas(consulta)
+        if coordenadas is None:
+            return []
+        return [{"lat": str(coordenadas[0]), "lon": str(coordenadas[1]), "display_name": consulta}]
+
+    def _inversa(self, latitud, longitud):
+        """Resultado de /reverse: el lugar conocido más cercano o uno sintético."""
+        cercana = self.nomenclator.mas_cercana(latitud, longitud)
+        if cercana:
+            direccion = cercana[0]
+        elif self.sinteticas:
+            direccion = f"Punto {latitud:.5f}, {longitud:.5f}, Antofagasta, Chile"
+        else:
+            return {"error": "Unable to geocode"}
+        return {"lat": str(latitud), "lon": str(longitud), "display_name": direccion}
+
+    def _responder(self, solicitud, estado, cuerpo):
+        """Envía una respuesta JSON."""
+        datos = json.dumps(cuerpo).encode("utf-8")
+        solicitud.send_response(estado)
+        solicitud.send_header("Content-Type", "application/json; charset=utf-8")
+        solicitud.send_header("Content-Length", str(len(datos)))
+        solicitud.end_headers()
+        solicitud.wfile.write(datos)
+
+
+if __name__ == "__main__":
+    # Uso: python servidor_geocodificacion.py --puerto 8088 --latencia 0.3 --fallas 0.1
+    # y luego: GESTOR_RUTAS_GEOCODIFICADOR=http://127.0.0.1:8088 python GestorRutas.py
+    parser = argparse.ArgumentParser(description="Servidor local compatible con Nominatim para pruebas.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8088)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Demora fija por consulta (s)")
+    parser.add_argument("--variacion", type=float, default=0.0, help="Demora aleatoria adicional máxima (s)")
+    parser.add_argument("--fallas", type=float, default=0.0, help="Fracción de consultas que responden 503")
+    parser.add_argument("--sin-sinteticas", action="store_true", help="No inventar coordenadas para lo desconocido")
+    argumentos = parser.parse_args()
+
+    servidor = ServidorGeocodificacion(argumentos.host, argumentos.puerto,
+                                       construir_nomenclator(sorted(glob.glob("*.csv"))),
+                                       argumentos.latencia, argumentos.variacion, argumentos.fallas,
+                                       not argumentos.sin_sinteticas)
+    print(f"Escuchando en {servidor.url} ({len(servidor.nomenclator)} direcciones conocidas)")
+    try:
+        servidor.http.serve_forever()
+    except KeyboardInterrupt:
+        servidor.http.server_close()
+        sys.exit(0)